@@ -0,0 +1,152 @@
+"""
+Benchmark simulated experiments for many participants, run one participant at
+a time and in lockstep with `darc_toolbox.batch.BatchSimulation`.
+
+There are two loops over participants. "loop" runs each participant's
+experiment in turn as a model and badapted would: score every design by mutual
+information, simulate a response, and update the model's beliefs by population
+Monte Carlo over the whole history. "loop-eq" runs a `BatchSimulation` of one
+participant at a time, so it does the same work as the batch, and the
+difference is just what running participants in lockstep saves. The batch
+runs the same number of trials for every participant at once. We report
+participant-trials per second for each, and the correlation between true and
+estimated logk, as a check that the batch recovers parameters as well.
+
+Most of the speed up over "loop" comes from choosing designs from a screened
+set of candidates (see `BatchSimulation.choose_designs`), which evaluates
+about a tenth as many (design, particle) pairs, and from importance sampling
+rather than rerunning population Monte Carlo every trial. Running in lockstep
+adds less, as most of the work is already in large array operations for one
+participant with this many designs and particles.
+
+Each Metropolis-Hastings move evaluates the likelihood of a participant's whole
+history at the proposed particles, so one move costs O(trials). (The current
+particles' log likelihoods are kept as a running total, so only proposals need
+this.) Moves only happen when a participant's effective sample size drops
+though, and as their posterior narrows that happens about once every `t` trials
+at trial `t`, so the total cost of the moves stays close to linear in the
+number of trials. `phases` records a longer run to check this: it reports the
+time per trial spent in each phase, for the first and last thirds of the
+trials. Design selection dominates throughout, rather than the moves.
+
+Run with:
+    python benchmarks/bench_batch.py
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from darc_toolbox.batch import BatchSimulation
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.instrumentation import TrialRecorder
+from darc_toolbox.reducers import MutualInformation
+
+N_PARTICLES = 500
+N_TRIALS = 10
+N_LOOP_PARTICIPANTS = 10
+N_BATCH_PARTICIPANTS = [10, 100]
+N_PHASE_PARTICIPANTS = 20
+N_PHASE_TRIALS = 60
+PHASES = ["evaluate", "utility", "choose", "update", "resample"]
+
+
+def true_parameters(n, rng):
+    return pd.DataFrame({"logk": rng.normal(-4.5, 1, n), "α": rng.uniform(1, 3, n)})
+
+
+def loop(designs, truth):
+    """One participant at a time, returning the posterior mean of logk"""
+    estimates = []
+    for participant in range(len(truth)):
+        model = delayed_models.Hyperbolic(n_particles=N_PARTICLES)
+        model.θ_true = truth.iloc[[participant]].reset_index(drop=True)
+        data = []
+        for _ in range(N_TRIALS):
+            utility = model.reduce_predictive_y(model.θ, designs, MutualInformation())
+            design = designs.iloc[[int(np.argmax(utility))]].reset_index(drop=True)
+            data.append(design.assign(R=int(model.simulate_y(design))))
+            model.update_beliefs(pd.concat(data, ignore_index=True))
+        estimates.append(model.θ.logk.mean())
+    return np.array(estimates)
+
+
+def loop_equal_work(designs, truth):
+    """One participant at a time, with the same steps as the batch"""
+    return np.concatenate(
+        [
+            batch(designs, truth.iloc[[participant]], seed=participant)
+            for participant in range(len(truth))
+        ]
+    )
+
+
+def batch(designs, truth, seed=0):
+    model = delayed_models.Hyperbolic(n_particles=N_PARTICLES)
+    simulation = BatchSimulation(model, designs, truth, seed=seed)
+    simulation.run(N_TRIALS)
+    return simulation.posterior_mean().logk.to_numpy()
+
+
+def phases(designs, truth):
+    """Seconds per trial in each phase, over the first and last thirds of a
+    run of N_PHASE_TRIALS trials"""
+    model = delayed_models.Hyperbolic(n_particles=N_PARTICLES)
+    model.recorder = TrialRecorder(track_memory=False)
+    simulation = BatchSimulation(model, designs, truth, seed=0)
+    simulation.run(N_PHASE_TRIALS)
+    # trials without a resample have no resample_seconds
+    columns = [f"{phase}_seconds" for phase in PHASES]
+    seconds = model.recorder.to_dataframe().reindex(columns=columns).fillna(0.0)
+    third = N_PHASE_TRIALS // 3
+    print(f"seconds per trial, {len(truth)} participants:")
+    print(f"{'trials':<10}" + "".join(f"{phase:>10}" for phase in PHASES))
+    for name, rows in [("first", seconds[:third]), ("last", seconds[-third:])]:
+        print(f"{name:<10}" + "".join(f"{value:>10.3f}" for value in rows.mean()))
+
+
+def report(name, n_participants, seconds, estimates, truth):
+    rate = n_participants * N_TRIALS / seconds
+    r = np.corrcoef(estimates, truth.logk)[0, 1]
+    print(
+        f"{name:<8}{n_participants:>8} participants{seconds:>10.1f} s"
+        f"{rate:>12.1f} participant-trials/s   r(logk) = {r:.3f}"
+    )
+    return rate
+
+
+def main():
+    rng = np.random.default_rng(0)
+    designs = DesignSpaceBuilder.delayed().build()
+    print(f"{len(designs)} designs, {N_PARTICLES} particles, {N_TRIALS} trials")
+    np.random.seed(0)
+
+    truth = true_parameters(N_LOOP_PARTICIPANTS, rng)
+    rates = dict()
+    for name, func in [("loop", loop), ("loop-eq", loop_equal_work)]:
+        start = time.perf_counter()
+        with np.errstate(all="ignore"):
+            estimates = func(designs, truth)
+        rates[name] = report(
+            name, N_LOOP_PARTICIPANTS, time.perf_counter() - start, estimates, truth
+        )
+
+    for n_participants in N_BATCH_PARTICIPANTS:
+        truth = true_parameters(n_participants, rng)
+        start = time.perf_counter()
+        with np.errstate(all="ignore"):
+            estimates = batch(designs, truth)
+        rate = report(
+            "batch", n_participants, time.perf_counter() - start, estimates, truth
+        )
+        print(
+            f"{'':<8}{rate / rates['loop']:>8.1f}x the loop, "
+            f"{rate / rates['loop-eq']:.1f}x the loop at equal work"
+        )
+
+    with np.errstate(all="ignore"):
+        phases(designs, true_parameters(N_PHASE_PARTICIPANTS, rng))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark building design spaces with `DesignSpaceBuilder.build`.
+
+This is a startup cost, paid once per experiment. We time each of the
+alternate constructors, as a DataFrame, as a `DesignMatrix` and as a
+`VirtualDesignSpace`, and loaded from the on-disk cache (see
+`darc_toolbox.design_cache`), plus a large space (a fine RA grid x a fine PB grid x
+DEFAULT_DB) of several million designs.
+
+Run with:
+    python benchmarks/bench_build.py
+"""
+
+import tempfile
+import timeit
+import numpy as np
+from darc_toolbox.designs import DesignSpaceBuilder, DEFAULT_DB
+
+REPEATS = 5
+PRESETS = [
+    "delayed",
+    "risky",
+    "delayed_and_risky",
+    "frontend_delay",
+    "delay_magnitude_effect",
+]
+
+
+def large():
+    return DesignSpaceBuilder(
+        RA=np.linspace(1, 99, 1000).tolist(),
+        PB=np.linspace(0.01, 1, 100).tolist(),
+        DB=DEFAULT_DB,
+    )
+
+
+def best_time(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEATS))
+
+
+def main():
+    builders = [(preset, getattr(DesignSpaceBuilder, preset)()) for preset in PRESETS]
+    builders.append(("large", large()))
+    print(
+        f"{'design space':<26}{'designs':>10}{'DataFrame [ms]':>16}"
+        f"{'DesignMatrix [ms]':>19}{'virtual [ms]':>14}{'virtual [KB]':>14}"
+        f"{'cached [ms]':>13}"
+    )
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, builder in builders:
+            run(name, builder, cache_dir)
+
+
+def run(name, builder, cache_dir):
+    n_designs = len(builder.build())
+    df = best_time(lambda: builder.build())
+    dm = best_time(lambda: builder.build(as_design_matrix=True))
+    virtual = best_time(lambda: builder.build_virtual())
+    kb = builder.build_virtual().nbytes / 1024
+    builder.build(as_design_matrix=True, cache_dir=cache_dir)
+    cached = best_time(
+        lambda: builder.build(as_design_matrix=True, cache_dir=cache_dir)
+    )
+    print(
+        f"{name:<26}{n_designs:>10}{df * 1e3:>16.1f}{dm * 1e3:>19.1f}"
+        f"{virtual * 1e3:>14.1f}{kb:>14.0f}{cached * 1e3:>13.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
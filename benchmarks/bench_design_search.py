@@ -0,0 +1,86 @@
+"""
+Benchmark `coarse_to_fine_search` and `golden_section_search` against
+`exhaustive_search`.
+
+For each design space, we find the design with the highest mutual information
+under the prior, each way, and report how many designs each evaluated and how
+long it took. We also report how much utility the coarse-to-fine search lost
+(see `check_search`), and how much the golden-section search (over RA, to the
+nearest 0.01) gained or lost, compared with the best design in the grid. Each
+row is a fresh sample from the prior, so these vary from run to run.
+
+Run with:
+    python benchmarks/bench_design_search.py
+"""
+
+import timeit
+import numpy as np
+from darc_toolbox.designs import DesignSpaceBuilder, DEFAULT_DB
+from darc_toolbox.design_search import (
+    check_search,
+    coarse_to_fine_search,
+    exhaustive_search,
+    golden_section_search,
+)
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+
+N_PARTICLES = 5_000
+REPEATS = 3
+
+
+def fine_delayed():
+    return DesignSpaceBuilder(RA=np.linspace(1, 99, 981).tolist(), DB=DEFAULT_DB)
+
+
+comparisons = [
+    ("delayed", delayed_models.Hyperbolic, DesignSpaceBuilder.delayed),
+    (
+        "delay_magnitude_effect",
+        delayed_models.HyperbolicMagnitudeEffect,
+        DesignSpaceBuilder.delay_magnitude_effect,
+    ),
+    ("risky", risky_models.Hyperbolic, DesignSpaceBuilder.risky),
+    (
+        "delayed_and_risky",
+        delayed_and_risky_models.MultiplicativeHyperbolic,
+        DesignSpaceBuilder.delayed_and_risky,
+    ),
+    ("delayed, RA every 0.1", delayed_models.Hyperbolic, fine_delayed),
+]
+
+
+def best_time(func):
+    with np.errstate(all="ignore"):
+        return min(timeit.repeat(func, number=1, repeat=REPEATS))
+
+
+def main():
+    print(f"{N_PARTICLES} particles")
+    print(f"{'':<24}{'':>9}{'':>17}{'coarse to fine':>34}{'golden section':>34}")
+    print(
+        f"{'design space':<24}{'designs':>9}{'exhaustive [ms]':>17}"
+        + f"{'evaluated':>11}{'[ms]':>10}{'loss [nats]':>13}" * 2
+    )
+    for name, model_class, preset in comparisons:
+        model = model_class(n_particles=N_PARTICLES)
+        builder = preset()
+        with np.errstate(all="ignore"):
+            result = coarse_to_fine_search(model, builder)
+            check = check_search(model, builder, result)
+            golden = golden_section_search(model, builder)
+        exhaustive = best_time(lambda: exhaustive_search(model, builder))
+        coarse_to_fine = best_time(lambda: coarse_to_fine_search(model, builder))
+        golden_time = best_time(lambda: golden_section_search(model, builder))
+        golden_loss = check.best.utility - golden.utility
+        print(
+            f"{name:<24}{check.n_designs:>9}{exhaustive * 1e3:>17.1f}"
+            f"{check.n_evaluated:>11}{coarse_to_fine * 1e3:>10.1f}"
+            f"{check.utility_loss:>13.2g}"
+            f"{golden.n_evaluated:>11}{golden_time * 1e3:>10.1f}{golden_loss:>13.2g}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark the fused, compiled kernels in `darc_toolbox.fused` (the "numba"
+backend) against the NumPy backend.
+
+Design optimisation in badapted calls `predictive_y` on n_particles (particle,
+design) pairs for each of `N_STEPS` steps. We time one such step, and also a
+grid evaluation of `N_GRID_DESIGNS` designs against every particle. Compile
+time is excluded by warming up first.
+
+Run with:
+    python benchmarks/bench_fused.py
+"""
+
+import timeit
+import numpy as np
+from darc_toolbox import fused
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+
+N_PARTICLES = 100_000
+N_STEPS = 50  # design optimisation steps per trial, as in badapted
+N_GRID_DESIGNS = 100
+REPEATS = 5
+
+comparisons = [
+    (delayed_models.Hyperbolic, "delayed"),
+    (delayed_models.ModifiedRachlin, "delayed"),
+    (delayed_models.HyperbolicMagnitudeEffect, "delay_magnitude_effect"),
+    (risky_models.LinearInLogOdds, "risky"),
+    (delayed_and_risky_models.MultiplicativeHyperbolic, "delayed_and_risky"),
+]
+
+
+def best_time(func):
+    with np.errstate(all="ignore"):
+        func()  # warm up, and compile the numba kernels
+        return min(timeit.repeat(func, number=1, repeat=REPEATS))
+
+
+def main():
+    if not fused.HAVE_NUMBA:
+        print("Numba is not installed, nothing to compare")
+        return
+    print(f"{N_PARTICLES} particles")
+    print(
+        f"{'model':<28}{'backend':>8}{'paired step [ms]':>18}"
+        f"{f'grid {N_GRID_DESIGNS} designs [ms]':>24}"
+    )
+    for model_class, preset in comparisons:
+        model = model_class(n_particles=N_PARTICLES)
+        θ = model.θ
+        D = getattr(DesignSpaceBuilder, preset)().build(as_design_matrix=True)
+        paired_designs = D.take(np.random.randint(len(D), size=N_PARTICLES))
+        grid_designs = D.take(np.random.randint(len(D), size=N_GRID_DESIGNS))
+        for backend in ("numpy", "numba"):
+            model.backend = backend
+            paired = best_time(lambda: model.predictive_y(θ, paired_designs))
+            grid = best_time(lambda: model.predictive_y_grid(θ, grid_designs))
+            print(
+                f"{model_class.__name__:<28}{backend:>8}"
+                f"{paired * 1000:>18.2f}{grid * 1000:>24.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark the broadcasting kernels in `darc_toolbox.kernels` against the
+`np.vectorize` implementations which they replaced.
+
+One design optimisation step evaluates `predictive_y` on n_particles
+(particle, design) pairs, and a trial takes `N_STEPS` such steps. We time a
+single step for each model and report the implied per-trial time.
+
+Run with:
+    python benchmarks/bench_kernels.py
+"""
+
+import timeit
+import numpy as np
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+
+N_PARTICLES = 50_000
+N_STEPS = 50  # design optimisation steps per trial, as in badapted
+REPEATS = 3
+
+
+# The old np.vectorize'd implementations =====================================
+
+
+class ExponentialBefore(delayed_models.Exponential):
+    @staticmethod
+    @np.vectorize
+    def _time_discount_func(delay, k):
+        return np.exp(-k * delay)
+
+
+class ExponentialMagnitudeEffectBefore(delayed_models.ExponentialMagnitudeEffect):
+    @staticmethod
+    @np.vectorize
+    def _present_subjective_value(reward, delay, m, c):
+        k = np.exp(m * np.log(reward) + c)
+        discount_fraction = np.exp(-k * delay)
+        V = reward * discount_fraction
+        return V
+
+
+class ModifiedRachlinBefore(delayed_models.ModifiedRachlin):
+    @staticmethod
+    @np.vectorize
+    def _time_discount_func(delay, logk, s):
+        if delay == 0:
+            return 1
+        else:
+            k = np.exp(logk)
+            return 1 / (1 + np.power(k * delay, s))
+
+
+class LinearInLogOddsBefore(risky_models.LinearInLogOdds):
+    @staticmethod
+    @np.vectorize
+    def _w(p, δ, γ):
+        if p == 0.0 or p == 1.0:
+            return p
+        else:
+            return (δ * p**γ) / ((δ * p**γ) + (1 - p) ** γ)
+
+
+comparisons = [
+    (delayed_models.Exponential, ExponentialBefore, "delayed"),
+    (
+        delayed_models.ExponentialMagnitudeEffect,
+        ExponentialMagnitudeEffectBefore,
+        "delay_magnitude_effect",
+    ),
+    (delayed_models.ModifiedRachlin, ModifiedRachlinBefore, "delayed"),
+    (risky_models.LinearInLogOdds, LinearInLogOddsBefore, "risky"),
+]
+
+
+def time_one_step(model_class, designs):
+    model = model_class(n_particles=N_PARTICLES)
+    θ = model.θ
+    # some prior draws (eg negative k) overflow, which is not what we are timing
+    with np.errstate(all="ignore"):
+        times = timeit.repeat(
+            lambda: model.predictive_y(θ, designs), number=1, repeat=REPEATS
+        )
+    return min(times)
+
+
+def main():
+    print(f"{N_PARTICLES} particles, {N_STEPS} optimisation steps per trial")
+    print(
+        f"{'model':<28}{'before [s/trial]':>18}{'after [s/trial]':>18}{'speedup':>10}"
+    )
+    for after_class, before_class, preset in comparisons:
+        D = getattr(DesignSpaceBuilder, preset)().build()
+        # one optimisation step pairs each particle with a sampled design
+        designs = D.sample(n=N_PARTICLES, replace=True).reset_index(drop=True)
+        before = time_one_step(before_class, designs) * N_STEPS
+        after = time_one_step(after_class, designs) * N_STEPS
+        print(
+            f"{after_class.__name__:<28}{before:>18.3f}{after:>18.3f}"
+            f"{before / after:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark sharding particles over worker processes (`model.n_workers`, see
+`darc_toolbox.parallel`) for one trial's worth of evaluation.
+
+We time a grid evaluation of `N_GRID_DESIGNS` designs against every particle,
+and a paired evaluation of one design optimisation step, for 1 worker (in
+process) and then for more workers, up to the number of CPUs. Speedups need as
+many free cores as workers, so on a machine with one core this only measures
+the overhead of the round trip to the workers.
+
+Run with:
+    python benchmarks/bench_parallel.py
+"""
+
+import os
+import timeit
+import numpy as np
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+
+N_PARTICLES = 200_000
+N_GRID_DESIGNS = 200
+REPEATS = 5
+
+comparisons = [
+    (delayed_models.Hyperbolic, "delayed"),
+    (delayed_models.HyperbolicMagnitudeEffect, "delay_magnitude_effect"),
+    (delayed_and_risky_models.MultiplicativeHyperbolic, "delayed_and_risky"),
+]
+
+
+def best_time(func):
+    with np.errstate(all="ignore"):
+        func()  # warm up, which also starts the worker processes
+        return min(timeit.repeat(func, number=1, repeat=REPEATS))
+
+
+def worker_counts():
+    n_cpus = os.cpu_count() or 1
+    counts = [1, 2]
+    while counts[-1] * 2 <= n_cpus:
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def main():
+    print(f"{N_PARTICLES} particles, {os.cpu_count()} CPUs")
+    print(
+        f"{'model':<28}{'workers':>8}{'paired step [ms]':>18}"
+        f"{f'grid {N_GRID_DESIGNS} designs [ms]':>24}"
+    )
+    for model_class, preset in comparisons:
+        model = model_class(n_particles=N_PARTICLES)
+        θ = model.θ
+        D = getattr(DesignSpaceBuilder, preset)().build(as_design_matrix=True)
+        paired_designs = D.take(np.random.randint(len(D), size=N_PARTICLES))
+        grid_designs = D.take(np.random.randint(len(D), size=N_GRID_DESIGNS))
+        for n_workers in worker_counts():
+            model.n_workers = n_workers
+            paired = best_time(lambda: model.predictive_y(θ, paired_designs))
+            grid = best_time(lambda: model.predictive_y_grid(θ, grid_designs))
+            print(
+                f"{model_class.__name__:<28}{n_workers:>8}"
+                f"{paired * 1e3:>18.1f}{grid * 1e3:>24.1f}"
+            )
+        model.n_workers = 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark `streaming_search` over design spaces of increasing size.
+
+We find the design with the highest mutual information under the prior by
+streaming the chunks of `DesignSpaceBuilder.iter_chunks` through the model, and
+report the time taken and the peak memory allocated (by tracemalloc) along the
+way. The peak should stay roughly constant as the design space grows, because
+only a chunk of designs and a tile of p(chose B) are ever held at once.
+
+Run with:
+    python benchmarks/bench_streaming.py
+"""
+
+import time
+import tracemalloc
+import numpy as np
+from darc_toolbox.designs import DesignSpaceBuilder, DEFAULT_DB
+from darc_toolbox.design_search import streaming_search
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+
+N_PARTICLES = 1_000
+CHUNK_SIZE = 2**14
+MAX_BYTES = 32 * 2**20
+N_RA = [91, 300, 1000]
+N_PB = [7, 30, 100]
+
+
+def main():
+    model = delayed_and_risky_models.MultiplicativeHyperbolic(n_particles=N_PARTICLES)
+    print(f"{N_PARTICLES} particles, chunks of {CHUNK_SIZE} designs")
+    print(f"{'designs':>10}{'time [s]':>10}{'peak [MB]':>11}")
+    for n_RA, n_PB in zip(N_RA, N_PB):
+        builder = DesignSpaceBuilder(
+            RA=np.linspace(1, 99, n_RA).tolist(),
+            PB=np.linspace(0.01, 1, n_PB).tolist(),
+            DB=DEFAULT_DB,
+        )
+        tracemalloc.start()
+        start = time.perf_counter()
+        with np.errstate(all="ignore"):
+            result = streaming_search(
+                model, builder.iter_chunks(CHUNK_SIZE), max_bytes=MAX_BYTES
+            )
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{result.n_designs:>10}{elapsed:>10.1f}{peak / 2**20:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
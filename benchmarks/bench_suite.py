@@ -0,0 +1,247 @@
+"""
+Benchmark suite covering every model, design space preset and particle count.
+
+For every model class in `darc_toolbox.delayed.models`, `.risky.models` and
+`.delayed_and_risky.models`, crossed with each `DesignSpaceBuilder` preset of
+its kind (eg the delayed models with "delayed", "frontend_delay" and
+"delay_magnitude_effect") and with each particle count, we time
+
+- predictive_y: one paired evaluation of as many designs as particles, drawn
+  from the design space, as in one step of badapted's design optimisation.
+- trial: one simulated trial. Design selection scores every design in the
+  space by mutual information (`reduce_predictive_y`), then we simulate a
+  response from a true parameter and update the model's beliefs.
+
+and, once per preset, `DesignSpaceBuilder.build`.
+
+Each timing is the best of `--repeats` runs. Results are written as JSON (by
+default to benchmarks/results/<label>.json, where the label defaults to the
+git commit), along with the versions of Python and NumPy. Passing
+`--compare` an earlier results file prints how each timing changed, flagging
+those slower by more than `--threshold`.
+
+The full suite (up to 100k particles) takes a long while. Use eg
+`--particles 1000 --models Hyperbolic` to run part of it.
+
+Run with:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --compare benchmarks/results/<label>.json
+"""
+
+import argparse
+import inspect
+import json
+import platform
+import subprocess
+import time
+import timeit
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.model import DARCModel
+from darc_toolbox.reducers import MutualInformation
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+
+PARTICLES = [1_000, 10_000, 100_000]
+REPEATS = 3
+THRESHOLD = 1.2
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# the presets which suit the models in each module
+families = [
+    (delayed_models, ["delayed", "frontend_delay", "delay_magnitude_effect"]),
+    (risky_models, ["risky"]),
+    (delayed_and_risky_models, ["delayed_and_risky"]),
+]
+
+
+def model_classes(module):
+    """Every concrete DARCModel class defined in `module`"""
+    return [
+        cls
+        for _, cls in inspect.getmembers(module, inspect.isclass)
+        if issubclass(cls, DARCModel) and cls.__module__ == module.__name__
+    ]
+
+
+def cases(model_names=None, preset_names=None):
+    """(model class, preset) for every model and each preset of its kind"""
+    for module, presets in families:
+        for model_class in model_classes(module):
+            if model_names and model_class.__name__ not in model_names:
+                continue
+            for preset in presets:
+                if preset_names and preset not in preset_names:
+                    continue
+                yield model_class, preset
+
+
+def best_time(func, repeats):
+    with np.errstate(all="ignore"):
+        return min(timeit.repeat(func, number=1, repeat=repeats))
+
+
+def paired_designs(designs, n, rng):
+    """n designs drawn (with replacement) from a DataFrame of designs"""
+    return designs.iloc[rng.integers(len(designs), size=n)].reset_index(drop=True)
+
+
+def simulated_trial(model, designs, prior_θ):
+    """Choose the most informative design, simulate a response to it, then
+    update the model's beliefs. We start from the same prior particles each
+    time, so repeats are comparable."""
+    model.θ = prior_θ
+    utility = model.reduce_predictive_y(model.θ, designs, MutualInformation())
+    design = designs.iloc[[int(np.argmax(utility))]].reset_index(drop=True)
+    data = design.assign(R=int(model.simulate_y(design)))
+    model.update_beliefs(data)
+
+
+def time_build(preset, repeats):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    n_designs = len(builder.build())
+    seconds = best_time(builder.build, repeats)
+    return dict(benchmark="build", preset=preset, n_designs=n_designs, seconds=seconds)
+
+
+def time_model(model_class, preset, n_particles, repeats, rng):
+    designs = getattr(DesignSpaceBuilder, preset)().build()
+    np.random.seed(int(rng.integers(2**31)))
+    model = model_class(n_particles=n_particles)
+    prior_θ = model.θ
+    model.θ_true = prior_θ.iloc[[0]].reset_index(drop=True)
+    paired = paired_designs(designs, n_particles, rng)
+    common = dict(
+        model=f"{model_class.__module__}.{model_class.__name__}",
+        preset=preset,
+        n_particles=n_particles,
+    )
+    predictive_y = best_time(lambda: model.predictive_y(prior_θ, paired), repeats)
+    trial = dict(benchmark="trial", **common, n_designs=len(designs))
+    try:
+        trial["seconds"] = best_time(
+            lambda: simulated_trial(model, designs, prior_θ), repeats
+        )
+    except AssertionError as error:
+        # badapted asserts if the posterior has NaNs, which some models
+        # produce for extreme particles
+        trial.update(seconds=None, error=str(error))
+    return [
+        dict(
+            benchmark="predictive_y",
+            **common,
+            n_designs=n_particles,
+            seconds=predictive_y,
+        ),
+        trial,
+    ]
+
+
+def key(result):
+    return (
+        result["benchmark"],
+        result.get("model"),
+        result["preset"],
+        result.get("n_particles"),
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    baseline = {
+        key(r): r for r in json.loads(Path(baseline_path).read_text())["results"]
+    }
+    print(f"\ncompared with {baseline_path}")
+    print(f"{'benchmark':<14}{'model':<26}{'preset':<24}{'particles':>10}{'ratio':>8}")
+    n_slower = 0
+    for result in results:
+        old = baseline.get(key(result))
+        if old is None or old["seconds"] is None or result["seconds"] is None:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        flag = "  SLOWER" if ratio > threshold else ""
+        n_slower += bool(flag)
+        model = (result.get("model") or "").rsplit(".", 1)[-1]
+        particles = result.get("n_particles") or ""
+        print(
+            f"{result['benchmark']:<14}{model:<26}{result['preset']:<24}"
+            f"{particles:>10}{ratio:>8.2f}{flag}"
+        )
+    print(f"{n_slower} timings more than {threshold}x slower")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--particles", type=int, nargs="+", default=PARTICLES)
+    parser.add_argument("--models", nargs="+", help="model class names to run")
+    parser.add_argument("--presets", nargs="+", help="presets to run")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", help="name of the results (default: git commit)")
+    parser.add_argument("--output", help="results file (default: results/<label>)")
+    parser.add_argument("--compare", help="an earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    label = args.label or git_commit() or time.strftime("%Y%m%d-%H%M%S")
+    results = []
+    selected = list(cases(args.models, args.presets))
+    for preset in dict.fromkeys(preset for _, preset in selected):
+        result = time_build(preset, args.repeats)
+        print(f"build {preset:<24}{result['seconds'] * 1e3:>10.1f} ms")
+        results.append(result)
+    for model_class, preset in selected:
+        for n_particles in args.particles:
+            for result in time_model(
+                model_class, preset, n_particles, args.repeats, rng
+            ):
+                if result["seconds"] is None:
+                    timing = f"{'failed':>12}: {result['error']}"
+                else:
+                    timing = f"{result['seconds'] * 1e3:>12.1f} ms"
+                print(
+                    f"{result['benchmark']:<14}{model_class.__name__:<26}"
+                    f"{preset:<24}{n_particles:>8}{timing}"
+                )
+                results.append(result)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            dict(
+                label=label,
+                timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                python=platform.python_version(),
+                numpy=np.__version__,
+                pandas=pd.__version__,
+                machine=platform.machine(),
+                repeats=args.repeats,
+                results=results,
+            ),
+            indent=2,
+        )
+    )
+    print(f"results saved to {output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
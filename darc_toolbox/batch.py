@@ -0,0 +1,447 @@
+"""
+Simulated experiments for many virtual participants at once.
+
+Simulating an adaptive experiment one participant at a time with badapted
+scores every design with every particle on every trial, and its belief
+updates rerun population Monte Carlo over every trial so far.
+`BatchSimulation` does less work per participant, and advances many simulated
+participants in lockstep. Each participant has their
+own set of particles, and these are stacked into arrays of shape
+(n_participants, n_particles). Every step of a trial is vectorised across
+participants:
+
+- Design selection. The particles of a group of participants are flattened
+  into one long particle set, so one `predictive_y_grid` call evaluates every
+  design for all of them. By default this screens the designs with a few
+  particles per participant, and only the best candidates are then scored with
+  all of their particles and weights, by mutual information.
+- Responses are simulated from each participant's true parameters, in one
+  paired `predictive_y` call.
+- Belief updates reweight each participant's particles by the likelihood of
+  their response (importance sampling). When a participant's effective
+  sample size drops below `ess_threshold` of their particles, we resample
+  them and move each particle by a Metropolis-Hastings random walk step
+  targeting that participant's posterior, which keeps them diverse. Each
+  particle's log likelihood is kept as a running total, so only the proposed
+  particles need the likelihood of the whole history, which is evaluated for
+  many trials per call. That makes one move O(trials), but as a posterior
+  narrows its effective sample size drops less and less often, so the moves
+  add little.
+
+Screening the designs is where most of the speed up over simulating one
+participant at a time with badapted comes from (about 10x, see
+benchmarks/bench_batch.py), along with the cheaper belief updates. Running
+participants in lockstep only adds about 1.2x to that, because with thousands
+of designs and hundreds of particles, one participant's arrays are already
+large enough to keep NumPy busy.
+
+When the model has a recorder (see `darc_toolbox.instrumentation`), each
+trial and its phases are recorded.
+
+Every participant sees the same design space, and gets their own design on
+each trial. Groups of participants are evaluated in tiles of about
+`max_bytes`, as in `DARCModel.predictive_y_tiles`.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from scipy.special import logsumexp
+from darc_toolbox.design_matrix import DESIGN_VARIABLES, DesignMatrix
+from darc_toolbox.instrumentation import NO_PHASE
+from darc_toolbox.model import DEFAULT_TILE_BYTES, _TEMPORARIES_PER_TILE
+from darc_toolbox.reducers import _binary_entropy
+
+DEFAULT_ESS_THRESHOLD = 0.5
+DEFAULT_N_MOVES = 1
+# Random walk proposal scale, relative to the posterior standard deviation
+DEFAULT_STEP_SCALE = 0.5
+# Designs which go through from screening to be scored with every particle,
+# and the particles per participant they are screened with
+DEFAULT_N_CANDIDATES = 32
+DEFAULT_N_SCREENING_PARTICLES = 50
+# (participant, design, particle) triples per paired evaluation, small enough
+# for the arrays of one evaluation to stay in cache
+_PAIRED_CHUNK = 2**16
+
+
+class BatchSimulation:
+    """
+    Simulated adaptive experiments for a batch of participants, whose true
+    parameters are the rows of `θ_true` (a DataFrame, or a dict of arrays,
+    with one column per parameter of `model`). `model` supplies the prior,
+    the choice function and the precision, and is not modified.
+
+    Each participant starts with `n_particles` particles (the model's
+    `n_particles` by default) drawn from the prior with `seed`. `designs` is
+    the design space, as a DataFrame or `DesignMatrix`.
+
+    Designs are chosen from the `n_candidates` which screen best with
+    `n_screening_particles` particles per participant. Set `n_candidates` to
+    None to score every design with every particle (see `choose_designs`).
+
+    `θ` holds the particles as a dict of arrays shaped
+    (n_participants, n_particles), and `log_weights` their normalised log
+    weights. Call `run(n_trials)`, or `trial()` once per trial.
+    """
+
+    def __init__(
+        self,
+        model,
+        designs,
+        θ_true,
+        n_particles=None,
+        seed=None,
+        ess_threshold=DEFAULT_ESS_THRESHOLD,
+        n_moves=DEFAULT_N_MOVES,
+        step_scale=DEFAULT_STEP_SCALE,
+        max_bytes=DEFAULT_TILE_BYTES,
+        n_candidates=DEFAULT_N_CANDIDATES,
+        n_screening_particles=DEFAULT_N_SCREENING_PARTICLES,
+    ):
+        self.model = model
+        self.designs = DesignMatrix.coerce(designs, model.dtype)
+        self.parameter_names = list(model.prior)
+        self.θ_true = {
+            name: np.asarray(θ_true[name], dtype=model.dtype).reshape(-1)
+            for name in self.parameter_names
+        }
+        self.n_participants = self.θ_true[self.parameter_names[0]].size
+        self.n_particles = int(n_particles or model.n_particles)
+        self.ess_threshold = ess_threshold
+        self.n_moves = n_moves
+        self.step_scale = step_scale
+        self.max_bytes = max_bytes
+        self.n_candidates = n_candidates
+        self.n_screening_particles = n_screening_particles
+        self.rng = np.random.default_rng(seed)
+
+        shape = (self.n_participants, self.n_particles)
+        self.θ = {
+            name: model.prior[name]
+            .rvs(size=shape, random_state=self.rng)
+            .astype(model.dtype)
+            for name in self.parameter_names
+        }
+        self.log_weights = np.full(shape, -np.log(self.n_particles))
+        # log likelihood of each particle, given each participant's responses
+        # so far, which the Metropolis-Hastings moves need
+        self.log_likelihood = np.zeros(shape)
+        # design index and response of each participant on each trial
+        self.chosen = []
+        self.responses = []
+
+    @property
+    def n_trials(self):
+        return len(self.chosen)
+
+    def run(self, n_trials):
+        """Run `n_trials` more trials for every participant. Returns the
+        trials as a DataFrame (see `trials_dataframe`)."""
+        for _ in range(n_trials):
+            self.trial()
+        return self.trials_dataframe()
+
+    def trial(self):
+        """Run one trial for every participant: choose their designs, simulate
+        their responses, and update their beliefs"""
+        recorder = self.model.recorder
+        if recorder is None:
+            trial = NO_PHASE
+        else:
+            trial = recorder.trial(
+                self.model,
+                len(self.designs),
+                n_particles=self.n_particles,
+                n_participants=self.n_participants,
+            )
+        with trial:
+            chosen = self.choose_designs()
+            responses = self.simulate_responses(chosen)
+            self.update_beliefs(chosen, responses)
+        return chosen, responses
+
+    def choose_designs(self):
+        """Return the index (into `designs`) of the design with the highest
+        mutual information for each participant, given their particles.
+
+        Scoring every design with every particle costs n_designs x
+        n_particles evaluations per participant. So unless `n_candidates` is
+        None, we first screen every design with `n_screening_particles` of
+        each participant's particles (resampled by weight), then score just
+        the `n_candidates` designs which screen best with all the particles.
+        The design chosen is the best of those, so it is occasionally not
+        the best of all."""
+        weights = np.exp(self.log_weights)
+        if (
+            self.n_candidates is None
+            or self.n_candidates >= len(self.designs)
+            or self.n_screening_particles >= self.n_particles
+        ):
+            return self._top_designs(self.θ, weights, 1)[:, 0]
+        ancestors = _systematic_resample(weights, self.n_screening_particles, self.rng)
+        θ = {
+            name: np.take_along_axis(values, ancestors, axis=1)
+            for name, values in self.θ.items()
+        }
+        equal_weights = np.full(ancestors.shape, 1 / self.n_screening_particles)
+        candidates = self._top_designs(θ, equal_weights, self.n_candidates)
+        utility = np.empty(candidates.shape)
+        step = max(1, _PAIRED_CHUNK // (self.n_candidates * self.n_particles))
+        for start in range(0, self.n_participants, step):
+            participants = slice(start, start + step)
+            with self.model._phase("evaluate"):
+                p_chose_B = self._paired_p_chose_B(
+                    {name: values[participants] for name, values in self.θ.items()},
+                    candidates[participants],
+                )
+            with self.model._phase("utility"):
+                utility[participants] = _mutual_information(
+                    p_chose_B.transpose(1, 0, 2), weights[participants]
+                ).T
+        with self.model._phase("choose"):
+            best = np.argmax(utility, axis=1)
+            return candidates[np.arange(self.n_participants), best]
+
+    def _top_designs(self, θ, weights, n_keep):
+        """The indices of the `n_keep` designs with the highest mutual
+        information for each participant, shaped (n_participants, n_keep),
+        where θ and weights are the particles, shaped (n_participants, n).
+        With n_keep = 1, ties go to the first design."""
+        n_designs = len(self.designs)
+        n_particles = weights.shape[1]
+        max_elements = max(
+            1, self.max_bytes // (self.model.dtype.itemsize * _TEMPORARIES_PER_TILE)
+        )
+        per_participant = n_designs * n_particles
+        group = max(1, max_elements // per_participant)
+        design_step = n_designs if group > 1 else max(1, max_elements // n_particles)
+
+        top = np.empty((self.n_participants, min(n_keep, n_designs)), dtype=np.int64)
+        for start in range(0, self.n_participants, group):
+            participants = slice(start, start + group)
+            flat = {
+                name: values[participants].reshape(-1) for name, values in θ.items()
+            }
+            w = weights[participants]
+            # the best designs so far, and their utilities, shaped (n, group)
+            best = np.empty((0, w.shape[0]), dtype=np.int64)
+            best_utility = np.empty((0, w.shape[0]))
+            for design_start in range(0, n_designs, design_step):
+                design_slice = slice(design_start, design_start + design_step)
+                with self.model._phase("evaluate"):
+                    p_chose_B = self.model.predictive_y_grid(
+                        flat, self.designs.take(design_slice)
+                    ).reshape(-1, w.shape[0], n_particles)
+                with self.model._phase("utility"):
+                    utility = _mutual_information(p_chose_B, w)
+                with self.model._phase("choose"):
+                    index = np.arange(design_start, design_start + len(utility))
+                    best = np.concatenate(
+                        [best, np.broadcast_to(index[:, np.newaxis], utility.shape)]
+                    )
+                    best_utility = np.concatenate([best_utility, utility])
+                    if len(best) > n_keep:
+                        # the designs so far come first, so win any ties
+                        if n_keep == 1:
+                            keep = np.argmax(best_utility, axis=0)[np.newaxis, :]
+                        else:
+                            keep = np.argpartition(-best_utility, n_keep - 1, axis=0)[
+                                :n_keep
+                            ]
+                        best = np.take_along_axis(best, keep, axis=0)
+                        best_utility = np.take_along_axis(best_utility, keep, axis=0)
+            top[participants] = best.T
+        return top
+
+    def simulate_responses(self, chosen):
+        """Simulate each participant's response (True for chose B) to the
+        designs at index `chosen`, from their true parameters"""
+        p_chose_B = self.model.predictive_y(self.θ_true, self.designs.take(chosen))
+        return self.rng.random(self.n_participants) < p_chose_B
+
+    def update_beliefs(self, chosen, responses):
+        """Reweight each participant's particles by the likelihood of their
+        response to their design, then resample and move the particles of any
+        participant whose effective sample size is too low"""
+        self.chosen.append(np.asarray(chosen))
+        self.responses.append(np.asarray(responses, dtype=bool))
+        with self.model._phase("update"):
+            ll = self._trial_log_likelihood(self.θ, chosen, self.responses[-1])
+            self.log_likelihood += ll
+            log_weights = self.log_weights + ll
+            norm = logsumexp(log_weights, axis=1, keepdims=True)
+            lost = ~np.isfinite(norm.reshape(-1))
+            if np.any(lost):
+                logging.warning(
+                    f"{np.count_nonzero(lost)} participants have no particles "
+                    "left which can explain their responses, so keep their old "
+                    "weights"
+                )
+                log_weights[lost] = self.log_weights[lost]
+                norm[lost] = 0.0
+            self.log_weights = log_weights - norm
+
+        degenerate = (
+            self.effective_sample_size() < self.ess_threshold * self.n_particles
+        )
+        if np.any(degenerate):
+            with self.model._phase("resample"):
+                self._resample_move(np.flatnonzero(degenerate))
+
+    def effective_sample_size(self):
+        """The effective sample size of each participant's particles"""
+        return 1.0 / np.sum(np.exp(2 * self.log_weights), axis=1)
+
+    def posterior_mean(self):
+        """The posterior mean of each parameter, for each participant, as a
+        DataFrame with one row per participant"""
+        weights = np.exp(self.log_weights)
+        return pd.DataFrame(
+            {name: np.sum(weights * values, axis=1) for name, values in self.θ.items()}
+        )
+
+    def trials_dataframe(self):
+        """One row per participant per trial, with the index of their design
+        in `designs`, the design variables and their response (R, 1 for chose
+        B)"""
+        if self.n_trials == 0:
+            return pd.DataFrame(
+                columns=["participant", "trial", "design"] + DESIGN_VARIABLES + ["R"]
+            )
+        chosen = np.stack(self.chosen, axis=1)
+        df = pd.DataFrame(
+            {
+                "participant": np.repeat(np.arange(self.n_participants), self.n_trials),
+                "trial": np.tile(np.arange(self.n_trials), self.n_participants),
+                "design": chosen.reshape(-1),
+            }
+        )
+        designs = self.designs.take(df["design"].to_numpy())
+        for name in DESIGN_VARIABLES:
+            df[name] = designs[name]
+        df["R"] = np.stack(self.responses, axis=1).reshape(-1).astype(int)
+        return df
+
+    def _paired_p_chose_B(self, θ, chosen):
+        """p(chose B) for each of the particles θ of some participants, shaped
+        (n, n_particles), against each of their designs at index `chosen`,
+        shaped (n, t). The result is shaped (n, t, n_particles)."""
+        n, t = chosen.shape
+        shape = (n, t, self.n_particles)
+        particles = {
+            name: np.broadcast_to(values[:, np.newaxis, :], shape).reshape(-1)
+            for name, values in θ.items()
+        }
+        designs = self.designs.take(np.repeat(chosen.reshape(-1), self.n_particles))
+        return self.model.predictive_y(particles, designs).reshape(shape)
+
+    def _log_likelihood(self, θ, chosen, responses):
+        """log p(response | particle) for each of the particles θ of some
+        participants, shaped (n, n_particles), on each of their trials with
+        designs `chosen` and `responses`, shaped (n, t). The result is shaped
+        (n, t, n_particles)."""
+        p_chose_B = self._paired_p_chose_B(θ, chosen)
+        with np.errstate(divide="ignore"):
+            ll = np.where(
+                responses[:, :, np.newaxis], np.log(p_chose_B), np.log1p(-p_chose_B)
+            )
+        # particles for which the model can't say are dropped
+        return np.where(np.isnan(ll), -np.inf, ll)
+
+    def _trial_log_likelihood(self, θ, chosen, responses):
+        """log p(response | particle) for one trial, where θ holds the
+        particles of some participants, shaped (n, n_particles), and chosen
+        and responses are those participants' designs and responses"""
+        return self._log_likelihood(θ, chosen[:, np.newaxis], responses[:, np.newaxis])[
+            :, 0
+        ]
+
+    def _history_log_likelihood(self, θ, participants):
+        """log p(all responses so far | particle), for the particles θ of
+        `participants`. This is only needed for proposed particles, as
+        `log_likelihood` keeps a running total for the current ones. The
+        trials are evaluated several at a time, in calls of about
+        `_PAIRED_CHUNK` evaluations."""
+        chosen = np.stack(self.chosen, axis=1)[participants]
+        responses = np.stack(self.responses, axis=1)[participants]
+        ll = np.zeros((participants.size, self.n_particles))
+        step = max(1, _PAIRED_CHUNK // (participants.size * self.n_particles))
+        for start in range(0, self.n_trials, step):
+            trials = slice(start, start + step)
+            ll += self._log_likelihood(θ, chosen[:, trials], responses[:, trials]).sum(
+                axis=1
+            )
+        return ll
+
+    def _log_prior(self, θ):
+        return sum(self.model.prior[name].logpdf(values) for name, values in θ.items())
+
+    def _resample_move(self, participants):
+        """Resample the particles of `participants` in proportion to their
+        weights (systematic resampling), then move them by random walk
+        Metropolis-Hastings steps"""
+        n = self.n_particles
+        weights = np.exp(self.log_weights[participants])
+        ancestors = _systematic_resample(weights, n, self.rng)
+        rows = participants[:, np.newaxis]
+        θ = {name: values[rows, ancestors] for name, values in self.θ.items()}
+        ll = self.log_likelihood[rows, ancestors]
+        # the posterior spread of each parameter sets the step size
+        scale = {
+            name: self.step_scale * np.std(values, axis=1, keepdims=True)
+            for name, values in θ.items()
+        }
+        log_posterior = ll + self._log_prior(θ)
+        for _ in range(self.n_moves):
+            proposal = {
+                name: values + scale[name] * self.rng.standard_normal(values.shape)
+                for name, values in θ.items()
+            }
+            with np.errstate(divide="ignore", invalid="ignore"):
+                log_prior = self._log_prior(proposal)
+                proposal_ll = np.where(
+                    np.isfinite(log_prior),
+                    self._history_log_likelihood(proposal, participants),
+                    -np.inf,
+                )
+            proposal_log_posterior = proposal_ll + log_prior
+            accept = np.log(self.rng.random(ll.shape)) < (
+                proposal_log_posterior - log_posterior
+            )
+            for name in θ:
+                θ[name] = np.where(accept, proposal[name], θ[name]).astype(
+                    self.model.dtype
+                )
+            ll = np.where(accept, proposal_ll, ll)
+            log_posterior = np.where(accept, proposal_log_posterior, log_posterior)
+        for name in θ:
+            self.θ[name][participants] = θ[name]
+        self.log_likelihood[participants] = ll
+        self.log_weights[participants] = -np.log(n)
+
+
+def _systematic_resample(weights, n, rng):
+    """Indices of `n` particles for each row of `weights` (normalised, shaped
+    (n_rows, n_particles)), resampled in proportion to the weights by
+    systematic resampling"""
+    n_particles = weights.shape[1]
+    cumulative = np.cumsum(weights, axis=1)
+    cumulative[:, -1] = 1.0
+    positions = (rng.random((weights.shape[0], 1)) + np.arange(n)) / n
+    # offset each row by its number, so one search does all of them
+    offset = np.arange(weights.shape[0])[:, np.newaxis]
+    ancestors = np.searchsorted(
+        (cumulative + offset).reshape(-1), (positions + offset).reshape(-1)
+    ).reshape(-1, n)
+    return np.minimum(ancestors - offset * n_particles, n_particles - 1)
+
+
+def _mutual_information(p_chose_B, weights):
+    """Mutual information between the response and the parameters, for each
+    design and participant, where p_chose_B has shape (n_designs,
+    n_participants, n_particles) and weights (n_participants, n_particles)
+    are normalised particle weights"""
+    p_mean = np.einsum("dpn,pn->dp", p_chose_B, weights)
+    entropy = np.einsum("dpn,pn->dp", _binary_entropy(p_chose_B), weights)
+    return np.maximum(_binary_entropy(p_mean) - entropy, 0.0)
@@ -0,0 +1,117 @@
+"""
+Canonical designs, with stable integer IDs.
+
+Some design variables are computed in floating point as a design space is
+built (DB = DA + IRI, or RA = RB * RA_over_RB), so the same design can turn up
+more than once, differing only by rounding error. Each copy is then evaluated
+on every trial, and designs can't be reliably matched up by their values.
+
+`DesignIndex` snaps every design variable to the nearest multiple of a
+tolerance, and keeps one copy of each distinct design. Designs are numbered
+(their ID) in the order they first appear, so the same design space always
+gives the same IDs. It can look up the ID of any design by its values (RA, DA,
+PA, RB, DB, PB), which gives trial logs and caches a compact key to join on.
+"""
+
+import logging
+import numpy as np
+from darc_toolbox.design_matrix import DESIGN_VARIABLES, DesignMatrix
+
+DEFAULT_TOLERANCE = 1e-9
+
+# One int64 field per design variable, so that keys sort lexicographically
+_KEY_DTYPE = np.dtype([(name, np.int64) for name in DESIGN_VARIABLES])
+
+
+class DesignIndex:
+    """
+    The distinct designs in `designs` (a DataFrame or `DesignMatrix`), with
+    every design variable snapped to a multiple of `tolerance`. Design IDs run
+    from 0 to len(index) - 1, in the order each design first appears.
+
+    `designs` holds the canonical designs as a `DesignMatrix`, one per ID, and
+    `ids` the ID of each of the designs we were given. For float32 designs,
+    use a tolerance well above float32 rounding error (eg 1e-4), so that they
+    snap to the same keys as their float64 values.
+    """
+
+    def __init__(self, designs, tolerance=DEFAULT_TOLERANCE):
+        if tolerance <= 0:
+            raise ValueError("tolerance must be positive")
+        self.tolerance = tolerance
+        designs = DesignMatrix.coerce(designs)
+        keys = self._keys(designs)
+        unique_keys, first, inverse = np.unique(
+            keys, return_index=True, return_inverse=True
+        )
+        # number designs in order of first appearance, not in key order
+        order = np.argsort(first, kind="stable")
+        id_of_key = np.empty_like(order)
+        id_of_key[order] = np.arange(order.size)
+        self.ids = id_of_key[inverse.reshape(-1)]
+        self._sorted_keys = unique_keys
+        self._id_of_sorted_key = id_of_key
+        self.designs = DesignMatrix(
+            **{
+                name: self.snap(designs[name][first[order]])
+                for name in DESIGN_VARIABLES
+            },
+            dtype=designs.dtype,
+        )
+        logging.debug(
+            f"{len(designs) - len(self)} duplicate designs removed, "
+            f"{len(self)} left"
+        )
+
+    def __len__(self):
+        return len(self.designs)
+
+    @property
+    def n_duplicates(self):
+        """The number of designs we were given which duplicated another"""
+        return self.ids.size - len(self)
+
+    def snap(self, values):
+        """Round values to the nearest multiple of the tolerance"""
+        snapped = np.round(np.asarray(values, dtype="float64") / self.tolerance)
+        # tidy up eg 30.000000000000004 where the tolerance is a power of 10
+        decimals = max(0, -int(np.floor(np.log10(self.tolerance))))
+        return np.round(snapped * self.tolerance, decimals)
+
+    def lookup(self, designs):
+        """Return the ID of each of `designs` (a DataFrame, `DesignMatrix` or
+        `Design`), or -1 for designs which are not in the index"""
+        keys = self._keys(DesignMatrix.coerce(designs))
+        if self._sorted_keys.size == 0:
+            return np.full(keys.size, -1)
+        position = np.searchsorted(self._sorted_keys, keys)
+        position = np.minimum(position, self._sorted_keys.size - 1)
+        found = self._sorted_keys[position] == keys
+        return np.where(found, self._id_of_sorted_key[position], -1)
+
+    def id_of(self, design):
+        """Return the ID of a single `Design`. Raises KeyError if it is not in
+        the index."""
+        design_id = int(self.lookup(design)[0])
+        if design_id < 0:
+            raise KeyError(design)
+        return design_id
+
+    def get_design(self, design_id):
+        """Return the design with ID `design_id` as a `Design` named tuple"""
+        return self.designs.get_design(design_id)
+
+    def to_dataframe(self):
+        """The canonical designs as a DataFrame, indexed by design ID"""
+        df = self.designs.to_dataframe()
+        df.index.name = "design_id"
+        return df
+
+    def _keys(self, designs):
+        """The multiple of the tolerance each design variable is nearest to,
+        as one structured value per design"""
+        keys = np.empty(len(designs), dtype=_KEY_DTYPE)
+        for name in DESIGN_VARIABLES:
+            values = np.asarray(designs[name], dtype="float64")
+            keys[name] = np.round(values / self.tolerance)
+        return keys
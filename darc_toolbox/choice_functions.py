@@ -0,0 +1,48 @@
+"""
+Choice functions for the DARC model classes.
+
+These mirror the choice functions in `badapted.choice_functions`, but take the
+particles θ as a dict of numpy arrays (as prepared by `DARCModel`) rather than a
+DataFrame. That means they broadcast in the same way as the decision variable.
+
+They take an optional `out` array for p(chose B). `DARCModel` passes in the
+decision variable itself (a temporary it no longer needs), so the choice
+function allocates nothing.
+"""
+
+import numpy as np
+from scipy.special import ndtr
+
+
+def StandardCumulativeNormalChoiceFunc(decision_variable, θ, θ_fixed, out=None):
+    """Cumulative normal choice function, but no alpha parameter"""
+    p_chose_B = _Phi(decision_variable, out=out)
+    return _add_lapse_rate(p_chose_B, θ_fixed["ϵ"])
+
+
+def CumulativeNormalChoiceFunc(decision_variable, θ, θ_fixed, out=None):
+    """Our default choice function"""
+    α = θ["α"]
+    p_chose_B = np.divide(decision_variable, α, out=out)
+    p_chose_B = _Phi(p_chose_B, out=p_chose_B)
+    return _add_lapse_rate(p_chose_B, θ_fixed["ϵ"])
+
+
+def _Phi(x, out=None):
+    """Cumulative normal distribution, provided here as a helper function.
+    Keeps the precision of x (float32 or float64), anything else is converted
+    to float64."""
+    x = np.asarray(x)
+    if x.dtype not in (np.float32, np.float64):
+        x = x.astype("float64")
+    return ndtr(x, out=out)
+
+
+def _add_lapse_rate(p_chose_B, ϵ):
+    """Return ϵ + (1 - 2ϵ) * p_chose_B, overwriting p_chose_B, which must be a
+    temporary array (or a scalar)"""
+    if np.ndim(p_chose_B) == 0:
+        return ϵ + (1 - 2 * ϵ) * p_chose_B
+    p_chose_B *= 1 - 2 * ϵ
+    p_chose_B += ϵ
+    return p_chose_B
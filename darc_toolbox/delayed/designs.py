@@ -7,11 +7,11 @@ approaches in the literature.
 import numpy as np
 import pandas as pd
 import logging
-from badapted.designs import DesignGeneratorABC
 from darc_toolbox import Design
+from darc_toolbox.designs import DARCDesignGenerator
 
 
-class Kirby2009(DesignGeneratorABC):
+class Kirby2009(DARCDesignGenerator):
     """
     A class to provide designs from the Kirby (2009) delay discounting task.
 
@@ -131,7 +131,7 @@ class Kirby2009(DesignGeneratorABC):
             return None
 
 
-class Griskevicius2011(DesignGeneratorABC):
+class Griskevicius2011(DARCDesignGenerator):
     """
     A class to provide designs from the Griskevicius et al (2011) delay
     discounting task.
@@ -160,7 +160,7 @@ class Griskevicius2011(DesignGeneratorABC):
 
             return Design(
                 DA=self._DA,
-                RA=self._RA[self.trial],
+                RA=self._RA,
                 PA=self._PA,
                 DB=self._DB,
                 RB=self._RB[self.trial],
@@ -170,7 +170,7 @@ class Griskevicius2011(DesignGeneratorABC):
             return None
 
 
-class Koffarnus_Bickel(DesignGeneratorABC):
+class Koffarnus_Bickel(DARCDesignGenerator):
     """
     This function returns a function which returns designs according to the
     method described by:
@@ -206,17 +206,8 @@ class Koffarnus_Bickel(DesignGeneratorABC):
         if self.trial >= self.max_trials:
             return None
 
-        if self.trial == 0:
-            design = Design(
-                DA=self._DA,
-                RA=self._RA,
-                PA=self._PA,
-                DB=self._DB,
-                RB=self._RB[self._delay_index],
-                PB=self._PB,
-            )
-
-        else:
+        # the first trial uses the initial delay
+        if self.trial > 0:
 
             if self.get_last_response_chose_B():
                 self._delay_index += self._index_increments
@@ -238,7 +229,7 @@ class Koffarnus_Bickel(DesignGeneratorABC):
         return design
 
 
-class Frye(DesignGeneratorABC):
+class Frye(DARCDesignGenerator):
     """
     A class to provide designs based on the Frye et al (2016) protocol.
 
@@ -303,7 +294,7 @@ class Frye(DesignGeneratorABC):
         return design
 
 
-class DuGreenMyerson2002(DesignGeneratorABC):
+class DuGreenMyerson2002(DARCDesignGenerator):
     """
     A class to provide designs based on the Du et al (2002) protocol.
 
@@ -366,4 +357,3 @@ class DuGreenMyerson2002(DesignGeneratorABC):
             self._trial_per_delay_counter = 0
 
         return design
-
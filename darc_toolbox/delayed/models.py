@@ -3,28 +3,27 @@ specifics about the design space and the model parameters.
 
 The main jobs of the model classes are:
 a) define priors over parameters - as scipy distribution objects
-b) implement the `predictive_y` method. You can add
+b) implement the `_decision_variable` method. You can add
    whatever useful helper functions you wat in order to help with
    that job.
 
-NOTE: There is some faff and checking required when we are doing
-the numerical stuff. This might be my inexperience with Python, but
-I think it comes down to annoyances in grabbing parameters and designs
-out of a Pandas dataframe and getting that into useful Numpy arrays.
-TODO: Can this be made easier/better?
+NOTE: The `DARCModel` base class takes care of grabbing parameters and designs
+out of Pandas dataframes. By the time `_decision_variable` is called, θ and
+data are indexed by name and give back plain Numpy arrays.
 """
 
-
 from scipy.stats import norm, halfnorm, uniform
 import numpy as np
-from badapted.model import Model
-from badapted.choice_functions import (
+from darc_toolbox.model import DARCModel
+from darc_toolbox import fused, kernels
+from darc_toolbox.kernels import in_place
+from darc_toolbox.choice_functions import (
     CumulativeNormalChoiceFunc,
     StandardCumulativeNormalChoiceFunc,
 )
 
 
-class DelaySlice(Model):
+class DelaySlice(DARCModel):
     """This is an insane delay discounting model. It basically fits ONE indifference
     point. It amounts to fitting a psychometric function with the indifference point
     shifting the function and alpha determining the slope of the function.
@@ -45,18 +44,13 @@ class DelaySlice(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        """ The decision variable is difference between the indifference point and
-        the 'stimulus intensity' which is RA/RB """
-        return θ["indiff"].values - (data["RA"].values / data["RB"].values)
+    def _decision_variable(self, θ, data):
+        """The decision variable is difference between the indifference point and
+        the 'stimulus intensity' which is RA/RB"""
+        return θ["indiff"] - (data["RA"] / data["RB"])
 
 
-class Hyperbolic(Model):
+class Hyperbolic(DARCModel):
     """Hyperbolic time discounting model
 
     Mazur, J. E. (1987). An adjusting procedure for studying delayed
@@ -75,26 +69,30 @@ class Hyperbolic(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._time_discount_func(
-            data["DA"].values, np.exp(θ["logk"].values)
+    def _decision_variable(self, θ, data):
+        k = self._derived(θ, "logk", np.exp)
+        VA = in_place(
+            np.multiply, data.map_unique("DA", self._time_discount_func, k), data["RA"]
         )
-        VB = data["RB"].values * self._time_discount_func(
-            data["DB"].values, np.exp(θ["logk"].values)
+        VB = in_place(
+            np.multiply, data.map_unique("DB", self._time_discount_func, k), data["RB"]
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
     def _time_discount_func(delay, k):
-        return 1 / (1 + k * delay)
+        return kernels.hyperbolic(delay, k)
+
+    def _fused_parameters(self, θ):
+        return (self._derived(θ, "logk", np.exp),)
+
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.hyperbolic(delay, params[0, j])
 
 
-class Exponential(Model):
+class Exponential(DARCModel):
     """Exponential time discounting model"""
 
     def __init__(
@@ -107,27 +105,33 @@ class Exponential(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._time_discount_func(
-            data["DA"].values, θ["k"].values
+    def _decision_variable(self, θ, data):
+        VA = in_place(
+            np.multiply,
+            data.map_unique("DA", self._time_discount_func, θ["k"]),
+            data["RA"],
         )
-        VB = data["RB"].values * self._time_discount_func(
-            data["DB"].values, θ["k"].values
+        VB = in_place(
+            np.multiply,
+            data.map_unique("DB", self._time_discount_func, θ["k"]),
+            data["RB"],
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    @np.vectorize
     def _time_discount_func(delay, k):
-        return np.exp(-k * delay)
+        return kernels.exponential(delay, k)
+
+    def _fused_parameters(self, θ):
+        return (θ["k"],)
 
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.exponential(delay, params[0, j])
 
-class HyperbolicMagnitudeEffect(Model):
+
+class HyperbolicMagnitudeEffect(DARCModel):
     """Hyperbolic time discounting model + magnitude effect
 
     Vincent, B. T. (2016). Hierarchical Bayesian estimation and hypothesis
@@ -149,29 +153,33 @@ class HyperbolicMagnitudeEffect(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = self._present_subjective_value(
-            data["RA"].values, data["DA"].values, θ["m"].values, θ["c"].values
+    def _decision_variable(self, θ, data):
+        VA = data.map_unique(
+            ("RA", "DA"), self._present_subjective_value, θ["m"], θ["c"]
         )
-        VB = self._present_subjective_value(
-            data["RB"].values, data["DB"].values, θ["m"].values, θ["c"].values
+        VB = data.map_unique(
+            ("RB", "DB"), self._present_subjective_value, θ["m"], θ["c"]
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
     def _present_subjective_value(reward, delay, m, c):
-        k = np.exp(m * np.log(reward) + c)
-        discount_fraction = 1 / (1 + k * delay)
+        k = kernels.magnitude_effect_k(reward, m, c)
+        discount_fraction = kernels.hyperbolic(delay, k)
         V = reward * discount_fraction
         return V
 
+    def _fused_parameters(self, θ):
+        return (θ["m"], θ["c"])
 
-class ExponentialMagnitudeEffect(Model):
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        k = fused.magnitude_effect_k(reward, params[0, j], params[1, j])
+        return reward * fused.hyperbolic(delay, k)
+
+
+class ExponentialMagnitudeEffect(DARCModel):
     """Exponential time discounting model + magnitude effect
     Similar to...
     Vincent, B. T. (2016). Hierarchical Bayesian estimation and hypothesis
@@ -193,30 +201,33 @@ class ExponentialMagnitudeEffect(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = self._present_subjective_value(
-            data["RA"].values, data["DA"].values, θ["m"].values, θ["c"].values
+    def _decision_variable(self, θ, data):
+        VA = data.map_unique(
+            ("RA", "DA"), self._present_subjective_value, θ["m"], θ["c"]
         )
-        VB = self._present_subjective_value(
-            data["RB"].values, data["DB"].values, θ["m"].values, θ["c"].values
+        VB = data.map_unique(
+            ("RB", "DB"), self._present_subjective_value, θ["m"], θ["c"]
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    @np.vectorize
     def _present_subjective_value(reward, delay, m, c):
-        k = np.exp(m * np.log(reward) + c)
-        discount_fraction = np.exp(-k * delay)
+        k = kernels.magnitude_effect_k(reward, m, c)
+        discount_fraction = kernels.exponential(delay, k)
         V = reward * discount_fraction
         return V
 
+    def _fused_parameters(self, θ):
+        return (θ["m"], θ["c"])
+
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        k = fused.magnitude_effect_k(reward, params[0, j], params[1, j])
+        return reward * fused.exponential(delay, k)
 
-class ConstantSensitivity(Model):
+
+class ConstantSensitivity(DARCModel):
     """The constant sensitivity time discounting model
 
     Ebert & Prelec (2007) The Fragility of Time: Time-Insensitivity and Valuation
@@ -237,30 +248,34 @@ class ConstantSensitivity(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._time_discount_func(
-            data["DA"].values, θ["a"].values, θ["b"].values
+    def _decision_variable(self, θ, data):
+        VA = in_place(
+            np.multiply,
+            data.map_unique("DA", self._time_discount_func, θ["a"], θ["b"]),
+            data["RA"],
         )
-        VB = data["RB"].values * self._time_discount_func(
-            data["DB"].values, θ["a"].values, θ["b"].values
+        VB = in_place(
+            np.multiply,
+            data.map_unique("DB", self._time_discount_func, θ["a"], θ["b"]),
+            data["RB"],
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
     def _time_discount_func(delay, a, b):
-        # NOTE: we want params as a row matrix, and delays as a column matrix
-        # to do the appropriate array broadcasting.
-        return np.exp(-np.power(a * delay, b))
+        return kernels.constant_sensitivity(delay, a, b)
 
+    def _fused_parameters(self, θ):
+        return (θ["a"], θ["b"])
+
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.constant_sensitivity(delay, params[0, j], params[1, j])
 
-class MyersonHyperboloid(Model):
-    """Myerson style hyperboloid
-    """
+
+class MyersonHyperboloid(DARCModel):
+    """Myerson style hyperboloid"""
 
     def __init__(
         self,
@@ -276,29 +291,34 @@ class MyersonHyperboloid(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._time_discount_func(
-            data["DA"].values, θ["logk"].values, θ["s"].values
+    def _decision_variable(self, θ, data):
+        k = self._derived(θ, "logk", np.exp)
+        VA = in_place(
+            np.multiply,
+            data.map_unique("DA", self._time_discount_func, k, θ["s"]),
+            data["RA"],
         )
-        VB = data["RB"].values * self._time_discount_func(
-            data["DB"].values, θ["logk"].values, θ["s"].values
+        VB = in_place(
+            np.multiply,
+            data.map_unique("DB", self._time_discount_func, k, θ["s"]),
+            data["RB"],
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
+
+    @staticmethod
+    def _time_discount_func(delay, k, s):
+        return kernels.hyperboloid_myerson(delay, k, s)
+
+    def _fused_parameters(self, θ):
+        return (self._derived(θ, "logk", np.exp), θ["s"])
 
     @staticmethod
-    def _time_discount_func(delay, logk, s):
-        # NOTE: we want logk as a row matrix, and delays as a column matrix to
-        # do the appropriate array broadcasting.
-        k = np.exp(logk)
-        return 1 / np.power(1 + k * delay, s)
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.hyperboloid_myerson(delay, params[0, j], params[1, j])
 
 
-class ModifiedRachlin(Model):
+class ModifiedRachlin(DARCModel):
     """The Rachlin (2006) discount function, modified by Vincent &
     Stewart (2018). This has a better parameterisation.
 
@@ -323,33 +343,34 @@ class ModifiedRachlin(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._time_discount_func(
-            data["DA"].values, θ["logk"].values, θ["s"].values
+    def _decision_variable(self, θ, data):
+        k = self._derived(θ, "logk", np.exp)
+        VA = in_place(
+            np.multiply,
+            data.map_unique("DA", self._time_discount_func, k, θ["s"]),
+            data["RA"],
         )
-        VB = data["RB"].values * self._time_discount_func(
-            data["DB"].values, θ["logk"].values, θ["s"].values
+        VB = in_place(
+            np.multiply,
+            data.map_unique("DB", self._time_discount_func, k, θ["s"]),
+            data["RB"],
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    @np.vectorize
-    def _time_discount_func(delay, logk, s):
-        # NOTE: we want logk as a row matrix, and delays as a column matrix to do the
-        # appropriate array broadcasting.
-        if delay == 0:
-            return 1
-        else:
-            k = np.exp(logk)
-            return 1 / (1 + np.power(k * delay, s))
+    def _time_discount_func(delay, k, s):
+        return kernels.hyperboloid_rachlin(delay, k, s)
+
+    def _fused_parameters(self, θ):
+        return (self._derived(θ, "logk", np.exp), θ["s"])
 
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.hyperboloid_rachlin(delay, params[0, j], params[1, j])
 
-class HyperbolicNonLinearUtility(Model):
+
+class HyperbolicNonLinearUtility(DARCModel):
     """Hyperbolic time discounting + non-linear utility model.
     The a-model from ...
     Cheng, J., & González-Vallejo, C. (2014). Hyperbolic Discounting: Value and
@@ -372,28 +393,36 @@ class HyperbolicNonLinearUtility(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        a = np.exp(θ["a"].values)
-        VA = np.power(data["RA"].values, a) * self._time_discount_func(
-            data["DA"].values, θ["logk"].values
+    def _decision_variable(self, θ, data):
+        a = self._derived(θ, "a", np.exp)
+        k = self._derived(θ, "logk", np.exp)
+        # VB first, as VA is usually cheap (DA = 0), so fewer arrays are alive
+        VB = in_place(
+            np.multiply,
+            data.map_unique("RB", np.power, a),
+            data.map_unique("DB", self._time_discount_func, k),
         )
-        VB = np.power(data["RB"].values, a) * self._time_discount_func(
-            data["DB"].values, θ["logk"].values
+        VA = in_place(
+            np.multiply,
+            data.map_unique("RA", np.power, a),
+            data.map_unique("DA", self._time_discount_func, k),
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    def _time_discount_func(delay, logk):
-        k = np.exp(logk)
-        return 1 / (1 + k * delay)
+    def _time_discount_func(delay, k):
+        return kernels.hyperbolic(delay, k)
+
+    def _fused_parameters(self, θ):
+        return (self._derived(θ, "a", np.exp), self._derived(θ, "logk", np.exp))
 
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward ** params[0, j] * fused.hyperbolic(delay, params[1, j])
 
-class ITCH(Model):
+
+class ITCH(DARCModel):
     """ITCH model, as presented in:
     Ericson, K. M. M., White, J. M., Laibson, D., & Cohen, J. D. (2015). Money
     earlier or later? Simple heuristics explain intertemporal choices better
@@ -420,30 +449,25 @@ class ITCH(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
+    def _decision_variable(self, θ, data):
         # organised so that higher values of the decision variable will
         # mean higher probabability for the delayed option (prospect B)
 
-        reward_abs_diff = data["RB"].values - data["RA"].values
-        reward_rel_diff = self._rel_diff(data["RB"].values, data["RA"].values)
-        delay_abs_diff = data["DB"].values - data["DA"].values
-        delay_rel_diff = self._rel_diff(data["DB"].values, data["DA"].values)
-
-        decision_variable = (
-            θ["β_I"].values
-            + θ["β_abs_reward"].values * reward_abs_diff
-            + θ["β_rel_reward"].values * reward_rel_diff
-            + θ["β_abs_delay"].values * delay_abs_diff
-            + θ["β_rel_relay"].values * delay_rel_diff
+        reward_abs_diff = data["RB"] - data["RA"]
+        reward_rel_diff = self._rel_diff(data["RB"], data["RA"])
+        delay_abs_diff = data["DB"] - data["DA"]
+        delay_rel_diff = self._rel_diff(data["DB"], data["DA"])
+
+        return _weighted_sum(
+            θ["β_I"],
+            [
+                (θ["β_abs_reward"], reward_abs_diff),
+                (θ["β_rel_reward"], reward_rel_diff),
+                (θ["β_abs_delay"], delay_abs_diff),
+                (θ["β_rel_relay"], delay_rel_diff),
+            ],
         )
 
-        return decision_variable
-
     @staticmethod
     def _rel_diff(B, A):
         """Calculate the difference between B and A, normalised by the mean
@@ -451,7 +475,7 @@ class ITCH(Model):
         return (B - A) / ((B + A) / 2)
 
 
-class DRIFT(Model):
+class DRIFT(DARCModel):
     """DRIFT model, as presented in:
     Note that we use a choice function _without_ a slope parameter.
 
@@ -478,31 +502,24 @@ class DRIFT(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        reward_abs_diff = data["RB"].values - data["RA"].values
-        reward_diff = (data["RB"].values - data["RA"].values) / data["RA"].values
-        delay_abs_diff = data["DB"].values - data["DA"].values
-        delay_component = (data["RB"].values / data["RA"].values) ** (
-            1 / (delay_abs_diff)
-        ) - 1
-
-        decision_variable = (
-            θ["β0"].values
-            + θ["β1"].values * reward_abs_diff
-            + θ["β2"].values * reward_diff
-            + θ["β3"].values * delay_component
-            + θ["β4"].values * delay_abs_diff
+    def _decision_variable(self, θ, data):
+        reward_abs_diff = data["RB"] - data["RA"]
+        reward_diff = (data["RB"] - data["RA"]) / data["RA"]
+        delay_abs_diff = data["DB"] - data["DA"]
+        delay_component = (data["RB"] / data["RA"]) ** (1 / (delay_abs_diff)) - 1
+
+        return _weighted_sum(
+            θ["β0"],
+            [
+                (θ["β1"], reward_abs_diff),
+                (θ["β2"], reward_diff),
+                (θ["β3"], delay_component),
+                (θ["β4"], delay_abs_diff),
+            ],
         )
 
-        return decision_variable
-
 
-class TradeOff(Model):
+class TradeOff(DARCModel):
     """Tradeoff model by Scholten & Read (2010). Model forumulation as defined
     in Ericson et al (2015).
 
@@ -525,21 +542,37 @@ class TradeOff(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        return (
-            self._f(data["RB"].values, θ["gamma_reward"].values)
-            - self._f(data["RA"].values, θ["gamma_reward"].values)
-        ) - θ["k"].values * (
-            self._f(data["DB"].values, θ["gamma_delay"].values)
-            - self._f(data["DA"].values, θ["gamma_delay"].values)
+    def _decision_variable(self, θ, data):
+        reward_term = in_place(
+            np.subtract,
+            data.map_unique("RB", self._f, θ["gamma_reward"]),
+            data.map_unique("RA", self._f, θ["gamma_reward"]),
+        )
+        delay_term = in_place(
+            np.subtract,
+            data.map_unique("DB", self._f, θ["gamma_delay"]),
+            data.map_unique("DA", self._f, θ["gamma_delay"]),
         )
+        delay_term = in_place(np.multiply, delay_term, θ["k"])
+        return in_place(np.subtract, reward_term, delay_term)
 
     @staticmethod
     def _f(x, gamma):
         return np.log(1.0 + gamma * x) / gamma
 
+
+def _weighted_sum(intercept, terms):
+    """intercept + Σ weight * values, for (weight, values) in terms, summed left
+    to right. This gives the same result as writing out the sum, but reuses
+    one accumulator and one scratch array rather than allocating new arrays
+    for every term."""
+    weight, values = terms[0]
+    total = in_place(np.add, np.multiply(weight, values), intercept)
+    scratch = None
+    for weight, values in terms[1:]:
+        if scratch is None or scratch.shape != total.shape:
+            scratch = np.multiply(weight, values)
+        else:
+            np.multiply(weight, values, out=scratch)
+        total = in_place(np.add, total, scratch)
+    return total
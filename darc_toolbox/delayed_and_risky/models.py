@@ -1,22 +1,13 @@
 from scipy.stats import norm, halfnorm
 import numpy as np
-from badapted.model import Model
-from badapted.choice_functions import CumulativeNormalChoiceFunc
+from darc_toolbox.model import DARCModel
+from darc_toolbox.choice_functions import CumulativeNormalChoiceFunc
+from darc_toolbox import fused, kernels
+from darc_toolbox.kernels import in_place
+from darc_toolbox.kernels import prob_to_odds_against, odds_against_to_probs
 
 
-# TODO: THESE UTILITY FUNCTIONS ARE IN MULTIPLE PLACES !!!
-def prob_to_odds_against(probabilities):
-    """convert probabilities of getting reward to odds against getting it"""
-    odds_against = (1 - probabilities) / probabilities
-    return odds_against
-
-
-def odds_against_to_probs(odds):
-    probabilities = 1 / (1 + odds)
-    return probabilities
-
-
-class MultiplicativeHyperbolic(Model):
+class MultiplicativeHyperbolic(DARCModel):
     """Hyperbolic risk discounting model
     The idea is that we hyperbolically discount ODDS AGAINST the reward
 
@@ -41,33 +32,50 @@ class MultiplicativeHyperbolic(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = (
-            data["RA"].values
-            * self._time_discount_func(data["DA"].values, θ["logk"].values)
-            * self._odds_discount_func(data["PA"].values, θ["logh"].values)
+    def _decision_variable(self, θ, data):
+        # discount both rewards for delay, then both for risk, so that only one
+        # of k and h is alive at a time
+        k = self._derived(θ, "logk", np.exp)
+        VA = in_place(
+            np.multiply,
+            data.map_unique("DA", self._time_discount_func, k),
+            data["RA"],
+        )
+        VB = in_place(
+            np.multiply,
+            data.map_unique("DB", self._time_discount_func, k),
+            data["RB"],
         )
-        VB = (
-            data["RB"].values
-            * self._time_discount_func(data["DB"].values, θ["logk"].values)
-            * self._odds_discount_func(data["PB"].values, θ["logh"].values)
+        del k
+        h = self._derived(θ, "logh", np.exp)
+        VA = in_place(
+            np.multiply,
+            VA,
+            data.map_unique("PA", self._odds_discount_func, h),
         )
-        return VB - VA
+        VB = in_place(
+            np.multiply,
+            VB,
+            data.map_unique("PB", self._odds_discount_func, h),
+        )
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    def _time_discount_func(delay, logk):
-        k = np.exp(logk)
-        return 1 / (1 + k * delay)
+    def _time_discount_func(delay, k):
+        return kernels.hyperbolic(delay, k)
 
     @staticmethod
-    def _odds_discount_func(probabilities, logh):
-        # transform logh to h
-        h = np.exp(logh)
-        # convert probability to odds against
-        odds_against = prob_to_odds_against(probabilities)
-        return 1 / (1 + h * odds_against)
+    def _odds_discount_func(probabilities, h):
+        return kernels.hyperbolic_odds(probabilities, h)
+
+    def _fused_parameters(self, θ):
+        return (self._derived(θ, "logk", np.exp), self._derived(θ, "logh", np.exp))
+
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return (
+            reward
+            * fused.hyperbolic(delay, params[0, j])
+            * fused.hyperbolic_odds(prob, params[1, j])
+        )
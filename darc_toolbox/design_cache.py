@@ -0,0 +1,143 @@
+"""
+An on-disk cache of built design spaces.
+
+Building a design space is a startup cost, paid every time an experiment is
+launched, even though the same protocol always builds the same designs. So
+`DesignSpaceBuilder.build(cache_dir=...)` can save the designs it builds to a
+cache directory, and load them from there the next time.
+
+Each design space is saved as a .npy file holding a (6, n_designs) array, one
+row per design variable (RA, DA, PA, RB, DB, PB), which we load memory mapped.
+So loading is quick however big the space is, and each design variable is a
+contiguous array which a `DesignMatrix` can use without copying. If the
+filters dropped any designs, the DataFrame index (the row numbers in the full
+grid) goes alongside, in a second .npy file.
+
+Files are named by a hash of everything that determines the designs (the
+builder's lists of values, its constraints, `assume_discounting` and the
+dtype), plus `CACHE_VERSION` and a hash of the source of the modules which
+build design spaces (`BUILD_MODULES`). So editing how designs are built, or
+installing another version of the toolbox, invalidates the cache without
+anyone having to remember to. Bump `CACHE_VERSION` when the file format
+changes. Files written by other versions or other code are ignored, then
+deleted the next time we save to that directory.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+import numpy as np
+from darc_toolbox.design_matrix import DESIGN_VARIABLES
+
+CACHE_VERSION = 1
+
+# the modules (in this package) whose source determines what
+# `DesignSpaceBuilder.build` produces
+BUILD_MODULES = ("designs.py", "design_space.py", "design_matrix.py")
+
+
+def default_cache_dir():
+    """The cache directory to use if not told otherwise: $DARC_TOOLBOX_CACHE,
+    else darc_toolbox in the user's cache directory (eg ~/.cache)"""
+    if "DARC_TOOLBOX_CACHE" in os.environ:
+        return Path(os.environ["DARC_TOOLBOX_CACHE"])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "darc_toolbox"
+
+
+def cache_key(parameters):
+    """Hash a dict of parameters (lists of numbers or strings, or other JSON
+    values) into the key we file a design space under"""
+    parameters = {
+        name: [_json_value(v) for v in value] if isinstance(value, list) else value
+        for name, value in parameters.items()
+    }
+    parameters["cache_version"] = CACHE_VERSION
+    parameters["code"] = code_hash()
+    text = json.dumps(parameters, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def code_hash():
+    """Hash of the source of `BUILD_MODULES`, which goes into every key and
+    file name"""
+    digest = hashlib.sha256()
+    for name in BUILD_MODULES:
+        digest.update((Path(__file__).parent / name).read_bytes())
+    return digest.hexdigest()
+
+
+def _prefix():
+    """Start of the names of the files saved by this version of the cache"""
+    return f"designs-v{CACHE_VERSION}-{code_hash()[:12]}-"
+
+
+def _json_value(value):
+    return value if isinstance(value, str) else float(value)
+
+
+def _paths(cache_dir, key):
+    stem = Path(cache_dir) / f"{_prefix()}{key}"
+    return stem.with_suffix(".npy"), stem.with_suffix(".index.npy")
+
+
+def load(cache_dir, key):
+    """Return the design variables (a dict of read only arrays) and index
+    saved under `key`, or None if there is nothing usable in the cache"""
+    designs_path, index_path = _paths(cache_dir, key)
+    try:
+        designs = np.load(designs_path, mmap_mode="r")
+        index = np.load(index_path) if index_path.exists() else None
+    except (OSError, ValueError) as error:
+        if designs_path.exists():
+            logging.warning(f"Ignoring unreadable design space cache: {error}")
+        return None
+    if designs.ndim != 2 or designs.shape[0] != len(DESIGN_VARIABLES):
+        logging.warning(f"Ignoring malformed design space cache {designs_path}")
+        return None
+    logging.debug(f"loaded {designs.shape[1]} designs from {designs_path}")
+    return dict(zip(DESIGN_VARIABLES, designs)), index
+
+
+def save(cache_dir, key, columns, index=None):
+    """Save the design variables (a dict of equal length arrays) and index
+    under `key`. Each file is written to a temporary file first, then moved
+    into place, so we never leave a partly written file to be loaded."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _remove_stale(cache_dir)
+    designs_path, index_path = _paths(cache_dir, key)
+    designs = np.stack([columns[name] for name in DESIGN_VARIABLES])
+    # write the index first, because the designs file marks the entry complete
+    if index is not None:
+        _atomic_save(index_path, np.asarray(index, dtype=np.int64))
+    _atomic_save(designs_path, designs)
+    logging.debug(f"saved {designs.shape[1]} designs to {designs_path}")
+
+
+def clear(cache_dir):
+    """Delete all the cached design spaces in `cache_dir`"""
+    for path in Path(cache_dir).glob("designs-v*.npy"):
+        path.unlink()
+
+
+def _atomic_save(path, array):
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=".tmp-", suffix=".npy", delete=False
+    ) as file:
+        np.save(file, array)
+    os.replace(file.name, path)
+
+
+def _remove_stale(cache_dir):
+    """Delete design spaces saved by other versions of the cache, or by other
+    versions of the code which builds them"""
+    current = _prefix()
+    for path in cache_dir.glob("designs-v*.npy"):
+        if not path.name.startswith(current):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,415 @@
+"""
+A struct-of-arrays representation of a set of designs.
+
+A `DesignMatrix` holds each design variable (RA, DA, PA, RB, DB, PB) as its own
+contiguous float64 numpy array. The model classes can use these directly,
+which avoids pulling columns out of a pandas DataFrame on every evaluation.
+
+Float64 is the default, but float32 can be chosen instead (see
+`as_float_dtype`). This halves the memory used by the design space and by the
+(designs x particles) arrays the models produce from it.
+
+A `CodedDesignMatrix` stores the same designs more compactly, as a table of
+the distinct values of each design variable plus one small unsigned integer
+code per design (uint8 for up to 256 distinct values, and so on). A design
+space built as a grid has only a few dozen values per design variable, so this
+takes about 1/8 of the memory of float64 columns. Models decode it into a
+`DesignMatrix` when they evaluate it, which keeps the codes, so that
+`map_unique` can evaluate functions over the tables of values and index the
+results by code, rather than finding the unique values itself.
+"""
+
+import numpy as np
+import pandas as pd
+from darc_toolbox import Design
+
+DESIGN_VARIABLES = list(Design._fields)
+FLOAT_DTYPES = (np.dtype("float32"), np.dtype("float64"))
+CODE_DTYPES = (np.dtype("uint8"), np.dtype("uint16"), np.dtype("uint32"))
+
+
+def as_float_dtype(dtype):
+    """Return `dtype` as a numpy dtype, checking it is one of the floating
+    point precisions we support (float32 or float64)"""
+    dtype = np.dtype(dtype)
+    if dtype not in FLOAT_DTYPES:
+        raise ValueError(f"dtype must be float32 or float64, not {dtype}")
+    return dtype
+
+
+class DesignMatrix:
+    """
+    A set of designs (one design per row) stored as one array per design
+    variable, all of the same floating point `dtype` (float64 by default).
+
+    Index with a design variable name to get that column as a 1D array,
+    eg `designs["RA"]`. The `column_vectors()` method returns the same
+    columns shaped (n_designs, 1), ready to broadcast against particles which
+    are shaped (1, n_particles).
+
+    We also keep track of which design variables are constant (eg DA is
+    always 0 and PA is always 1 in most design spaces). See `map_unique` for
+    how the models use this.
+    """
+
+    def __init__(self, RA, DA, PA, RB, DB, PB, dtype="float64"):
+        columns = {"RA": RA, "DA": DA, "PA": PA, "RB": RB, "DB": DB, "PB": PB}
+        self.dtype = as_float_dtype(dtype)
+        self._columns = {
+            name: np.ascontiguousarray(values, dtype=self.dtype).reshape(-1)
+            for name, values in columns.items()
+        }
+        n_designs = {values.size for values in self._columns.values()}
+        if len(n_designs) != 1:
+            raise ValueError("All design variables must have the same length")
+        self._n_designs = n_designs.pop()
+        self._column_vectors = None
+        self._constants = dict()
+        self._astype = dict()
+        # (table, codes) for each design variable, if decoded from a
+        # CodedDesignMatrix
+        self._codes = None
+
+    @classmethod
+    def from_dataframe(cls, df, dtype="float64"):
+        """Create a DesignMatrix from a DataFrame with a column for each design
+        variable. Any other columns (eg responses) are ignored."""
+        columns = {name: df[name].to_numpy() for name in DESIGN_VARIABLES}
+        return cls(**columns, dtype=dtype)
+
+    @classmethod
+    def coerce(cls, data, dtype=None):
+        """Return `data` as a DesignMatrix. We accept a DesignMatrix, a
+        DataFrame, or a single `Design` named tuple. If `dtype` is given, the
+        result will have that dtype, otherwise a DesignMatrix is returned as is
+        and anything else is converted to float64."""
+        if isinstance(data, cls):
+            return data if dtype is None else data.astype(dtype)
+        elif isinstance(data, CodedDesignMatrix):
+            return data.decode(dtype)
+        elif isinstance(data, pd.DataFrame):
+            return cls.from_dataframe(data, dtype=dtype or "float64")
+        elif isinstance(data, Design):
+            return cls(**data._asdict(), dtype=dtype or "float64")
+        else:
+            raise TypeError(f"Cannot convert {type(data)} to a DesignMatrix")
+
+    def astype(self, dtype):
+        """Return these designs with the given dtype. Returns self if the dtype
+        already matches, and conversions are cached."""
+        dtype = as_float_dtype(dtype)
+        if dtype == self.dtype:
+            return self
+        if dtype not in self._astype:
+            self._astype[dtype] = DesignMatrix(**self._columns, dtype=dtype)
+        return self._astype[dtype]
+
+    def to_dataframe(self):
+        return pd.DataFrame({name: self[name] for name in DESIGN_VARIABLES})
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __len__(self):
+        return self._n_designs
+
+    @property
+    def shape(self):
+        return (self._n_designs, len(DESIGN_VARIABLES))
+
+    @property
+    def columns(self):
+        return DESIGN_VARIABLES
+
+    @property
+    def constant_variables(self):
+        """A dict of the design variables which take the same value for every
+        design, and that value"""
+        constants = {name: self.constant_value(name) for name in DESIGN_VARIABLES}
+        return {name: value for name, value in constants.items() if value is not None}
+
+    def constant_value(self, name):
+        """Return the value of design variable `name` if it is identical for
+        every design, otherwise None. Results are cached."""
+        if name not in self._constants:
+            values = self._columns[name]
+            if values.size > 0 and _all_identical(values):
+                self._constants[name] = values[0]
+            else:
+                self._constants[name] = None
+        return self._constants[name]
+
+    def column_vectors(self):
+        """Return a `ColumnVectors` view of these designs, where each design
+        variable is shaped (n_designs, 1). This is cached, so repeated calls
+        are free."""
+        if self._column_vectors is None:
+            self._column_vectors = ColumnVectors(self)
+        return self._column_vectors
+
+    def map_unique(self, names, func, *args):
+        """Return func(*columns, *args) where columns are the design variables
+        given by `names`. In this paired layout every design meets a different
+        particle, so there is nothing to gain from factorising by unique values.
+        But constant design variables are still short-circuited, see
+        `ColumnVectors.map_unique`."""
+        if _all_constant(self, names):
+            return _map_constant(self, names, (1,), func, *args)
+        return func(*_columns_from_names(self, names), *args)
+
+    def take(self, indices):
+        """Return a new DesignMatrix of the designs (rows) at `indices`"""
+        designs = DesignMatrix(
+            **{name: values[indices] for name, values in self._columns.items()},
+            dtype=self.dtype,
+        )
+        if self._codes is not None:
+            designs._codes = {
+                name: (table, codes[indices])
+                for name, (table, codes) in self._codes.items()
+            }
+        return designs
+
+    def get_design(self, index):
+        """Return the design (row) at `index` as a `Design` named tuple"""
+        return Design(
+            **{name: float(values[index]) for name, values in self._columns.items()}
+        )
+
+
+class ColumnVectors:
+    """
+    A view of a DesignMatrix for grid evaluation, where each design variable is
+    shaped (n_designs, 1) so that it broadcasts against particles shaped
+    (1, n_particles).
+
+    Design spaces are typically Cartesian products, so most design variables
+    only take a handful of unique values. `map_unique` takes advantage of this
+    by evaluating a function once per unique value, rather than once per
+    design.
+    """
+
+    def __init__(self, designs):
+        self._designs = designs
+        self._vectors = {
+            name: designs[name][:, np.newaxis] for name in DESIGN_VARIABLES
+        }
+        self._unique = dict()
+
+    def __getitem__(self, name):
+        return self._vectors[name]
+
+    def __len__(self):
+        return len(self._designs)
+
+    def map_unique(self, names, func, *args):
+        """Return func(*columns, *args), evaluated only over the unique values
+        (or unique combinations of values) of the design variables in `names`.
+        The result is then gathered back out to one row per design. Because
+        func is evaluated elementwise, the result is identical to calling it on
+        the full columns.
+
+        If the design variables are constant then we skip the gather, and the
+        result is a single row which broadcasts against the other terms. If
+        the result is also identical for every particle (eg the discount
+        fraction for DA = 0, or the probability weighting for PA = 1) we just
+        return that one value as a scalar. A term like RA * discount(DA) then
+        costs nothing more than RA itself, and the answer is bit-identical.
+        """
+        if _all_constant(self._designs, names):
+            return _map_constant(self._designs, names, (1, 1), func, *args)
+        unique_columns, inverse = self._get_unique(names)
+        if inverse is None:
+            return func(*_columns_from_names(self, names), *args)
+        return func(*unique_columns, *args)[inverse]
+
+    def _get_unique(self, names):
+        """Return (unique column vectors, inverse indices) for the named
+        design variables, or (None, None) if there are too few repeated values
+        for factorising to be worthwhile. Results are cached."""
+        names = _as_tuple(names)
+        if names not in self._unique:
+            if self._designs._codes is None:
+                columns = np.stack([self._designs[name] for name in names], axis=1)
+                unique_rows, inverse = np.unique(columns, axis=0, return_inverse=True)
+            else:
+                unique_rows, inverse = _unique_from_codes(self._designs, names)
+            if unique_rows.shape[0] > len(self) // 2:
+                self._unique[names] = (None, None)
+            else:
+                unique_columns = [unique_rows[:, [n]] for n in range(len(names))]
+                self._unique[names] = (unique_columns, inverse.reshape(-1))
+        return self._unique[names]
+
+
+class CodedDesignMatrix:
+    """
+    A set of designs stored as a table of the distinct values of each design
+    variable (`tables`, each sorted and of `dtype`) and one code per design
+    indexing into it (`codes`, of the smallest unsigned integer type which
+    can index the table). Create one with `CodedDesignMatrix.encode(designs)`
+    or `DesignSpaceBuilder.build_coded()`.
+
+    Indexing with a design variable name decodes that column, and `decode()`
+    decodes them all into a `DesignMatrix`. Models accept a CodedDesignMatrix
+    anywhere they accept a `DesignMatrix`.
+    """
+
+    def __init__(self, tables, codes, dtype="float64"):
+        self.dtype = as_float_dtype(dtype)
+        self.tables = {
+            name: np.ascontiguousarray(tables[name], dtype=self.dtype).reshape(-1)
+            for name in DESIGN_VARIABLES
+        }
+        self.codes = {
+            name: np.ascontiguousarray(codes[name]).reshape(-1)
+            for name in DESIGN_VARIABLES
+        }
+        n_designs = {values.size for values in self.codes.values()}
+        if len(n_designs) != 1:
+            raise ValueError("All design variables must have the same length")
+        self._n_designs = n_designs.pop()
+        for name in DESIGN_VARIABLES:
+            if self.codes[name].dtype not in CODE_DTYPES:
+                raise ValueError(
+                    f"Codes must be unsigned integers, not {self.codes[name].dtype}"
+                )
+            if self._n_designs > 0 and self.codes[name].max() >= self.tables[name].size:
+                raise ValueError(f"Codes for {name} are out of range of its table")
+
+    @classmethod
+    def encode(cls, designs, dtype=None):
+        """Encode `designs` (anything `DesignMatrix.coerce` accepts). The dtype
+        defaults to that of the designs."""
+        designs = DesignMatrix.coerce(designs, dtype)
+        tables, codes = dict(), dict()
+        for name in DESIGN_VARIABLES:
+            table, inverse = np.unique(designs[name], return_inverse=True)
+            tables[name] = table
+            codes[name] = inverse.reshape(-1).astype(code_dtype(table.size))
+        return cls(tables, codes, dtype=designs.dtype)
+
+    def __len__(self):
+        return self._n_designs
+
+    def __getitem__(self, name):
+        return self.tables[name][self.codes[name]]
+
+    @property
+    def shape(self):
+        return (self._n_designs, len(DESIGN_VARIABLES))
+
+    @property
+    def columns(self):
+        return DESIGN_VARIABLES
+
+    @property
+    def nbytes(self):
+        """Memory used by the tables and codes"""
+        return sum(
+            self.tables[name].nbytes + self.codes[name].nbytes
+            for name in DESIGN_VARIABLES
+        )
+
+    def decode(self, dtype=None):
+        """Return these designs as a `DesignMatrix` (of `dtype`, if given),
+        which keeps the codes for `map_unique`"""
+        dtype = self.dtype if dtype is None else as_float_dtype(dtype)
+        tables = {name: table.astype(dtype) for name, table in self.tables.items()}
+        designs = DesignMatrix(
+            **{name: tables[name][self.codes[name]] for name in DESIGN_VARIABLES},
+            dtype=dtype,
+        )
+        designs._codes = {name: (tables[name], self.codes[name]) for name in tables}
+        return designs
+
+    def map_values(self, name, func, *args):
+        """Return func(values, *args) for each design, where values is design
+        variable `name`, evaluating func once per value in its table"""
+        return func(self.tables[name], *args)[self.codes[name]]
+
+    def take(self, indices):
+        """Return a new CodedDesignMatrix of the designs (rows) at `indices`,
+        sharing the same tables"""
+        codes = {name: values[indices] for name, values in self.codes.items()}
+        return CodedDesignMatrix(self.tables, codes, dtype=self.dtype)
+
+    def get_design(self, index):
+        """Return the design (row) at `index` as a `Design` named tuple"""
+        return Design(
+            **{
+                name: float(self.tables[name][self.codes[name][index]])
+                for name in DESIGN_VARIABLES
+            }
+        )
+
+    def to_dataframe(self, categorical=False):
+        """Return these designs as a DataFrame. If `categorical` is True, each
+        column is a pandas Categorical over the table of values, which takes
+        as little memory as the codes do."""
+        if categorical:
+            columns = {
+                name: pd.Categorical.from_codes(self.codes[name], self.tables[name])
+                for name in DESIGN_VARIABLES
+            }
+        else:
+            columns = {name: self[name] for name in DESIGN_VARIABLES}
+        return pd.DataFrame(columns)
+
+
+def code_dtype(n_values):
+    """The smallest unsigned integer type which can index `n_values` values"""
+    for dtype in CODE_DTYPES:
+        if n_values <= np.iinfo(dtype).max + 1:
+            return dtype
+    raise ValueError(f"Too many distinct values ({n_values}) to encode")
+
+
+def _unique_from_codes(designs, names):
+    """Unique rows of the named design variables, and the inverse indices, as
+    np.unique would return them, but found from the codes of a decoded
+    CodedDesignMatrix. Combinations of codes are numbered as in a ravelled
+    grid of the tables, so we only need np.unique of integers."""
+    tables = [designs._codes[name][0] for name in names]
+    codes = [designs._codes[name][1] for name in names]
+    shape = tuple(table.size for table in tables)
+    combined = np.ravel_multi_index(codes, shape)
+    unique_combined, inverse = np.unique(combined, return_inverse=True)
+    unique_codes = np.unravel_index(unique_combined, shape)
+    unique_rows = np.stack(
+        [table[code] for table, code in zip(tables, unique_codes)], axis=1
+    )
+    return unique_rows, inverse
+
+
+def _all_constant(designs, names):
+    return all(designs.constant_value(name) is not None for name in _as_tuple(names))
+
+
+def _map_constant(designs, names, shape, func, *args):
+    """Evaluate func once for design variables which are all constant, passing
+    them in as arrays of the given shape. The result is reduced to a scalar if
+    it is identical for every particle."""
+    constants = [
+        np.full(shape, designs.constant_value(name)) for name in _as_tuple(names)
+    ]
+    result = np.asarray(func(*constants, *args))
+    if result.size > 0 and _all_identical(result):
+        return result.reshape(-1)[0]
+    return result
+
+
+def _all_identical(values):
+    """True if every element of values is bitwise identical (so 0.0 and -0.0
+    are different, and NaNs with the same payload are the same)"""
+    values = np.ascontiguousarray(values).reshape(-1)
+    bits = values.view(f"u{values.dtype.itemsize}")
+    return bool(np.all(bits == bits[0]))
+
+
+def _as_tuple(names):
+    return (names,) if isinstance(names, str) else tuple(names)
+
+
+def _columns_from_names(data, names):
+    return [data[name] for name in _as_tuple(names)]
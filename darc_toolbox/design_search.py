@@ -0,0 +1,414 @@
+"""
+Faster searches for the most informative design.
+
+Scoring every design in the space on every trial is wasteful when the utility
+(the mutual information between the response and the parameters) varies
+smoothly over the grid of design variable values, as it does over RA and DB.
+`coarse_to_fine_search` scores a coarse subgrid first, taking every `stride`'th
+level of some of the grid's axes (RA and DB by default) and every level of the
+others. It then scores the neighbourhoods of the best `n_candidates` of those
+at full resolution, ie every design within `stride - 1` levels of them along
+the coarse axes. With a stride of 4 over RA and DB, that evaluates roughly 1/16
+of a large space, plus a few hundred designs.
+
+The search can miss the best design if the utility has a narrow peak between
+coarse levels. `check_search` compares a result with `exhaustive_search`, and
+reports how much utility was lost and how many designs were evaluated.
+
+Designs are identified by their position in the grid, which is also the index
+`DesignSpaceBuilder.build` gives them.
+
+The presets only list RA at fixed steps (eg `100 * np.linspace(0.05, 0.95,
+91)`) so that the grid can be enumerated. `golden_section_search` treats RA
+(or RA_over_RB, or PB) as continuous instead. For each combination of the
+values of the other design variables (a "slice", eg one DB and RB) it finds
+the best RA by golden-section search, all slices at once, then snaps it to a
+display precision (eg whole pence). That needs about 20 evaluations per slice
+to reach a precision of 1/10000 of the range, whatever the resolution. It
+assumes the utility has a single peak along RA within each slice, which is
+usually the case, give or take some wiggles near the peak from sampling the
+particles.
+
+`streaming_search` is an exhaustive search which never holds more than a chunk
+of the design space. It consumes the chunks of `DesignSpaceBuilder.iter_chunks`
+(or `VirtualDesignSpace.chunks`) one at a time, keeping only the best design so
+far in a `RunningBest`. So its peak memory is set by the chunk size and the
+tile budget, however large the space.
+"""
+
+import logging
+from collections import namedtuple
+import numpy as np
+from darc_toolbox import Design
+from darc_toolbox.design_matrix import DESIGN_VARIABLES, DesignMatrix
+from darc_toolbox.design_space import grid_columns, keep_mask
+from darc_toolbox.model import DEFAULT_TILE_BYTES
+from darc_toolbox.reducers import MutualInformation
+
+DEFAULT_STRIDE = 4
+DEFAULT_N_CANDIDATES = 4
+DEFAULT_CHUNK_SIZE = 2**16
+DEFAULT_PRECISION = 0.01
+DEFAULT_N_SWEEPS = 2
+CONTINUOUS_VARIABLES = ("RA", "RA_over_RB", "PB")
+
+# 1 / golden ratio
+_INVPHI = (np.sqrt(5) - 1) / 2
+
+SearchResult = namedtuple(
+    "SearchResult", ["design", "index", "utility", "n_evaluated", "n_designs"]
+)
+SearchCheck = namedtuple(
+    "SearchCheck",
+    ["exact", "utility_loss", "rank", "n_evaluated", "n_designs", "best"],
+)
+
+
+def coarse_to_fine_search(
+    model,
+    builder,
+    stride=DEFAULT_STRIDE,
+    n_candidates=DEFAULT_N_CANDIDATES,
+    coarse=("RA", "DB"),
+    assume_discounting=True,
+    θ=None,
+):
+    """Find the design of `builder`'s design space with the highest mutual
+    information for `model`, given particles θ (the model's own by default),
+    searching a coarse subgrid then refining around the best candidates.
+
+    `coarse` names the design variables to take every `stride`'th level of.
+    RA and DB stand for RA_over_RB and IRI, if the builder uses those instead.
+    Returns a `SearchResult`."""
+    θ = model.θ if θ is None else θ
+    axes, complete, constraints = builder._grid_axes()
+    shape = tuple(len(values) for values in axes.values())
+    coarse_axes = [_axis_number(axes, name) for name in coarse]
+
+    # every stride'th level along the coarse axes, plus the last level
+    levels = [np.arange(n) for n in shape]
+    for axis in coarse_axes:
+        levels[axis] = np.union1d(np.arange(0, shape[axis], stride), [shape[axis] - 1])
+    grid = np.meshgrid(*levels, indexing="ij")
+    positions = _kept(
+        axes, complete, _ravel(grid, shape), assume_discounting, constraints
+    )
+    utility = _utility(model, θ, axes, complete, positions)
+
+    # the neighbourhoods of the best candidates, at full resolution
+    best = positions[np.argsort(-utility, kind="stable")[:n_candidates]]
+    offsets = np.meshgrid(*[np.arange(1 - stride, stride)] * len(coarse_axes))
+    offsets = np.stack([offset.reshape(-1) for offset in offsets])
+    indices = np.array(np.unravel_index(best, shape))[:, :, np.newaxis]
+    neighbours = np.repeat(indices, offsets.shape[1], axis=2)
+    neighbours[coarse_axes] += offsets[:, np.newaxis, :]
+    neighbours = neighbours.reshape(len(shape), -1)
+    in_grid = np.all((neighbours >= 0) & (neighbours < np.array(shape)[:, None]), 0)
+    fine_positions = np.setdiff1d(_ravel(neighbours[:, in_grid], shape), positions)
+    fine_positions = _kept(
+        axes, complete, fine_positions, assume_discounting, constraints
+    )
+    fine_utility = _utility(model, θ, axes, complete, fine_positions)
+
+    positions = np.concatenate([positions, fine_positions])
+    utility = np.concatenate([utility, fine_utility])
+    n_designs = builder.n_designs(assume_discounting)
+    logging.debug(f"coarse to fine search evaluated {positions.size} of {n_designs}")
+    with model._phase("choose"):
+        return _result(axes, complete, positions, utility, n_designs)
+
+
+def exhaustive_search(
+    model, builder, assume_discounting=True, θ=None, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    """Find the design with the highest mutual information by evaluating every
+    design (`chunk_size` at a time). Returns a `SearchResult`."""
+    result, _ = _exhaustive(model, builder, assume_discounting, θ, chunk_size)
+    return result
+
+
+def check_search(model, builder, result, assume_discounting=True, θ=None, rtol=1e-9):
+    """Compare the `SearchResult` of a faster search with an exhaustive search
+    over the same design space and particles. Returns a `SearchCheck`: whether
+    the best utility was found (within `rtol`), the utility lost if not, how
+    many designs have a higher utility, how many designs were evaluated out of
+    how many, and the exhaustive search's `SearchResult`."""
+    best, utility = _exhaustive(model, builder, assume_discounting, θ)
+    utility_loss = max(best.utility - result.utility, 0.0)
+    check = SearchCheck(
+        exact=bool(utility_loss <= rtol * abs(best.utility)),
+        utility_loss=utility_loss,
+        rank=int(np.count_nonzero(utility > result.utility)),
+        n_evaluated=result.n_evaluated,
+        n_designs=len(utility),
+        best=best,
+    )
+    logging.info(
+        f"Search evaluated {check.n_evaluated} of {check.n_designs} designs, "
+        f"losing {check.utility_loss:.3g} nats of utility (rank {check.rank})"
+    )
+    return check
+
+
+def _exhaustive(model, builder, assume_discounting, θ, chunk_size=DEFAULT_CHUNK_SIZE):
+    """The `SearchResult` of an exhaustive search, plus the utility of every
+    design in the order of `DesignSpaceBuilder.build`"""
+    θ = model.θ if θ is None else θ
+    axes, complete, _ = builder._grid_axes()
+    space = builder.build_virtual(assume_discounting, dtype=model.dtype)
+    utility = np.empty(len(space))
+    for chunk, designs in space.chunks(chunk_size):
+        utility[chunk] = model.reduce_predictive_y(θ, designs, MutualInformation())
+    with model._phase("choose"):
+        positions = space.grid_position(np.arange(len(space)))
+        return _result(axes, complete, positions, utility, len(space)), utility
+
+
+def streaming_search(model, chunks, θ=None, max_bytes=DEFAULT_TILE_BYTES):
+    """Find the design with the highest mutual information for `model`, given
+    particles θ (the model's own by default), from an iterable of
+    (index, designs) chunks, eg `builder.iter_chunks()`. Each chunk is scored
+    in tiles of about `max_bytes` (see `DARCModel.reduce_predictive_y`), then
+    discarded. Returns a `SearchResult`, where `n_designs` is the number of
+    designs in all of the chunks."""
+    θ = model.θ if θ is None else θ
+    best = RunningBest()
+    for index, designs in chunks:
+        utility = model.reduce_predictive_y(θ, designs, MutualInformation(), max_bytes)
+        with model._phase("choose"):
+            best.update(index, designs, utility)
+    logging.debug(f"streaming search evaluated {best.n_evaluated} designs")
+    return best.result()
+
+
+class RunningBest:
+    """Keeps track of the design with the highest utility over a stream of
+    chunks of designs. Ties go to the design seen first, as in the exhaustive
+    search."""
+
+    def __init__(self):
+        self.utility = -np.inf
+        self.index = None
+        self.design = None
+        self.n_evaluated = 0
+
+    def update(self, index, designs, utility):
+        """Consider a chunk of designs, with their `index` (an array of
+        indices, or a slice as yielded by `VirtualDesignSpace.chunks`) and
+        their utility"""
+        if isinstance(index, slice):
+            index = np.arange(index.start, index.stop)
+        self.n_evaluated += len(designs)
+        if len(designs) == 0:
+            return
+        best = int(np.argmax(utility))
+        if utility[best] > self.utility:
+            self.utility = float(utility[best])
+            self.index = int(index[best])
+            self.design = designs.get_design(best)
+
+    def result(self):
+        if self.design is None:
+            raise ValueError("No designs to search")
+        return SearchResult(
+            design=self.design,
+            index=self.index,
+            utility=self.utility,
+            n_evaluated=self.n_evaluated,
+            n_designs=self.n_evaluated,
+        )
+
+
+def golden_section_search(
+    model,
+    builder,
+    continuous=("RA",),
+    precision=DEFAULT_PRECISION,
+    n_sweeps=DEFAULT_N_SWEEPS,
+    assume_discounting=True,
+    θ=None,
+):
+    """Find the design with the highest mutual information for `model`, given
+    particles θ (the model's own by default), treating the design variables
+    named in `continuous` as continuous between the lowest and highest values
+    `builder` lists for them. RA stands for RA_over_RB if the builder uses
+    that instead.
+
+    We search each slice of the other design variables by golden-section
+    search, one continuous variable at a time, `n_sweeps` times over if there
+    are several. Values are snapped to multiples of `precision`, which is a
+    number, or a dict of numbers keyed by the names in `continuous` (and
+    applies to RA_over_RB, not RA, where RA stands for it). Searching several
+    variables one at a time can get stuck on a ridge where they trade off
+    against each other, as RA and PB do, so it is more reliable to leave all
+    but one of them discrete.
+
+    The builder's constraints on several design variables are only checked
+    for the best design of each slice, and a slice whose best design fails
+    them is dropped, rather than searched for a design which passes. The same
+    goes for constraints on a continuous variable alone: only the lowest and
+    highest values they allow bound the search.
+
+    Returns a `SearchResult`. Its `index` and `n_designs` are None, because the
+    design need not be one of the grid's."""
+    θ = model.θ if θ is None else θ
+    axes, complete, _ = builder._grid_axes()
+    axes = {name: np.asarray(values, dtype="float64") for name, values in axes.items()}
+    names = [list(axes)[_axis_number(axes, name)] for name in continuous]
+    if not set(names) <= set(CONTINUOUS_VARIABLES):
+        raise ValueError(f"Can only search {CONTINUOUS_VARIABLES} continuously")
+    if not isinstance(precision, dict):
+        precision = dict.fromkeys(continuous, precision)
+    precision = {axis: precision[name] for axis, name in zip(names, continuous)}
+
+    # every combination of the discrete axes, with the continuous axes at the
+    # middle of their range to start with
+    discrete = {name: values for name, values in axes.items() if name not in names}
+    grid = np.meshgrid(*discrete.values(), indexing="ij")
+    slices = {name: values.reshape(-1) for name, values in zip(discrete, grid)}
+    n_slices = grid[0].size if grid else 1
+    bounds = {name: _bounds(axes[name], n_slices) for name in names}
+    if assume_discounting and "RA" in names:
+        # keep RA <= RB
+        bounds["RA"][1][:] = np.minimum(bounds["RA"][1], slices["RB"])
+    values = {name: (lower + upper) / 2 for name, (lower, upper) in bounds.items()}
+
+    feasible = np.all([lower <= upper for lower, upper in bounds.values()], axis=0)
+    columns = complete({**slices, **values})
+    # the same conventions as keep_mask, which is exact for the slices when
+    # RA is discrete, and holds within the bounds above when it is continuous
+    feasible &= ~(columns["DA"] > columns["DB"])
+    if assume_discounting:
+        feasible &= ~(columns["RB"] < columns["RA"])
+    if not np.any(feasible):
+        raise ValueError("No designs to search")
+    slices = {name: values[feasible] for name, values in slices.items()}
+    bounds = {
+        name: (lower[feasible], upper[feasible])
+        for name, (lower, upper) in bounds.items()
+    }
+    values = {name: v[feasible] for name, v in values.items()}
+
+    n_evaluated = 0
+
+    def utility(values):
+        nonlocal n_evaluated
+        columns = complete({**slices, **values})
+        designs = DesignMatrix(
+            **{name: columns[name] for name in DESIGN_VARIABLES}, dtype=model.dtype
+        )
+        n_evaluated += len(designs)
+        return model.reduce_predictive_y(θ, designs, MutualInformation())
+
+    for _ in range(n_sweeps if len(names) > 1 else 1):
+        for name in names:
+            lower, upper = bounds[name]
+
+            def along(x):
+                return utility({**values, name: x})
+
+            values[name] = _golden_section(along, lower, upper, precision[name])
+
+    values = {
+        name: _snap(values[name], *bounds[name], precision[name]) for name in names
+    }
+    final_utility = utility(values)
+    columns = complete({**slices, **values})
+    # every constraint, including those pushed down onto the continuous axes
+    keep = keep_mask(columns, assume_discounting, builder.constraints)
+    if not np.any(keep):
+        raise ValueError("No designs which satisfy the constraints")
+    with model._phase("choose"):
+        final_utility = np.where(keep, final_utility, -np.inf)
+        best = np.argmax(final_utility)
+        design = Design(
+            **{name: float(columns[name][best]) for name in DESIGN_VARIABLES}
+        )
+    logging.debug(f"golden section search evaluated {n_evaluated} designs")
+    return SearchResult(
+        design=design,
+        index=None,
+        utility=float(final_utility[best]),
+        n_evaluated=n_evaluated,
+        n_designs=None,
+    )
+
+
+def _bounds(values, n_slices):
+    return (np.full(n_slices, values.min()), np.full(n_slices, values.max()))
+
+
+def _golden_section(f, lower, upper, tolerance):
+    """Maximise f, a function of one value per slice which returns one value
+    per slice, between lower and upper by golden-section search, until the
+    bracket around the maximum is narrower than `tolerance` in every slice"""
+    a, b = lower.copy(), upper.copy()
+    c, d = b - _INVPHI * (b - a), a + _INVPHI * (b - a)
+    fc, fd = f(c), f(d)
+    while np.any(b - a > tolerance):
+        # the maximum is in [a, d] if f(c) >= f(d), else in [c, b]
+        left = fc >= fd
+        a, b = np.where(left, a, c), np.where(left, d, b)
+        # one of the interior points carries over, and we need one new one
+        new = np.where(left, b - _INVPHI * (b - a), a + _INVPHI * (b - a))
+        f_new = f(new)
+        c, d, fc, fd = (
+            np.where(left, new, d),
+            np.where(left, c, new),
+            np.where(left, f_new, fd),
+            np.where(left, fc, f_new),
+        )
+    return np.where(fc >= fd, c, d)
+
+
+def _snap(values, lower, upper, precision):
+    """Round values to the nearest multiple of precision within [lower, upper]"""
+    lower = np.ceil(lower / precision - 1e-9) * precision
+    upper = np.floor(upper / precision + 1e-9) * precision
+    snapped = np.clip(np.round(values / precision) * precision, lower, upper)
+    # tidy up eg 65.10000000000001 where precision is a power of 10
+    decimals = max(0, -int(np.floor(np.log10(precision))))
+    return np.round(snapped, decimals)
+
+
+def _axis_number(axes, name):
+    """The axis of the grid for design variable `name`"""
+    stand_ins = {"RA": "RA_over_RB", "DB": "IRI"}
+    if name not in axes and stand_ins.get(name) in axes:
+        name = stand_ins[name]
+    if name not in axes:
+        raise ValueError(f"The design space has no axis for {name}")
+    return list(axes).index(name)
+
+
+def _ravel(indices, shape):
+    return np.ravel_multi_index([i.reshape(-1) for i in indices], shape)
+
+
+def _kept(axes, complete, positions, assume_discounting, constraints):
+    """The grid positions of the designs `DesignSpaceBuilder.build` keeps"""
+    columns = grid_columns(axes, complete, positions)
+    return positions[keep_mask(columns, assume_discounting, constraints)]
+
+
+def _utility(model, θ, axes, complete, positions):
+    columns = grid_columns(axes, complete, positions)
+    designs = DesignMatrix(**columns, dtype=model.dtype)
+    return model.reduce_predictive_y(θ, designs, MutualInformation())
+
+
+def _result(axes, complete, positions, utility, n_designs):
+    # ties go to the design which comes first in the grid, as in the
+    # exhaustive search
+    if positions.size == 0:
+        raise ValueError("No designs to search")
+    best = np.lexsort((positions, -utility))[0]
+    columns = grid_columns(axes, complete, positions[[best]])
+    design = DesignMatrix(**columns).get_design(0)
+    return SearchResult(
+        design=design,
+        index=int(positions[best]),
+        utility=float(utility[best]),
+        n_evaluated=int(positions.size),
+        n_designs=n_designs,
+    )
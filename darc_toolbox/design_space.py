@@ -0,0 +1,282 @@
+"""
+Design spaces as grids of design variable values.
+
+`DesignSpaceBuilder` describes a design space as the Cartesian product of a
+few lists of values (one list per design variable), less the designs removed
+by some filters (eg DA > DB). The helpers here work on that grid without
+materialising the product: `sparse_grid` gives one broadcastable array per
+design variable, and `keep_mask` the filters over them.
+
+Besides the built in filters, a builder can have any number of `Constraint`s,
+vectorised predicates over the design variables (eg RA >= 0.2 * RB). These are
+part of `keep_mask`, so designs they exclude are never materialised either. A
+constraint on a single design variable which spans an axis of the grid (eg
+DB <= 365) is pushed down further, by `push_down`, and removes values from
+that axis before the grid is formed.
+
+`VirtualDesignSpace` goes further, and never materialises the designs at all.
+It stores the lists of values, plus the filter mask as a bitset (one bit per
+point in the grid). Designs are numbered 0 to len(space) - 1 in the same order
+as `DesignSpaceBuilder.build`. Any of them can be decoded from their number on
+demand, either one at a time or as a chunk in a `DesignMatrix`. So a space of
+10^7 designs takes 1.25 MB, rather than the 480 MB it would as float64
+columns.
+
+`stream_designs` needs no bitset either. It walks the grid in order, applying
+the filters as it goes, and yields the designs in chunks of a fixed size. Its
+peak memory depends on the chunk size, not on the size of the space, so it can
+generate spaces of any size.
+"""
+
+import inspect
+from collections import namedtuple
+import numpy as np
+from darc_toolbox.design_matrix import DESIGN_VARIABLES, DesignMatrix, as_float_dtype
+
+# Bits per block of the bitset. We count the set bits in each block up front,
+# so finding the n'th design only needs the bits of one block unpacked.
+_BLOCK_BITS = 4096
+# Grid points per chunk when building the bitset (a multiple of 8)
+_MASK_CHUNK = 2**16
+# Number of set bits in each possible byte
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+DEFAULT_CHUNK_SIZE = 2**16
+
+Constraint = namedtuple("Constraint", ["predicate", "variables", "name"])
+
+
+def constraint(predicate, name=None):
+    """Return a `Constraint` which keeps the designs where `predicate` is
+    True. The predicate's arguments are named after the design variables it
+    depends on, eg `lambda RA, RB: RA >= 0.2 * RB`, and it is called with
+    arrays which broadcast against each other. `name`, along with a hash of
+    the predicate's code, identifies the constraint in the on-disk cache (see
+    `DesignSpaceBuilder.cache_key`)."""
+    variables = tuple(inspect.signature(predicate).parameters)
+    unknown = set(variables) - set(DESIGN_VARIABLES)
+    if not variables or unknown:
+        raise ValueError(
+            f"Constraint arguments must be design variables {DESIGN_VARIABLES}, "
+            f"not {list(variables)}"
+        )
+    return Constraint(predicate, variables, name)
+
+
+def push_down(axes, constraints):
+    """Apply the constraints on a single design variable which spans an axis
+    of the grid to the values of that axis. Returns the new axes, and the
+    constraints which still have to be applied over the grid."""
+    axes = dict(axes)
+    remaining = []
+    for c in constraints:
+        name = c.variables[0]
+        if len(c.variables) == 1 and name in axes:
+            values = np.asarray(axes[name], dtype="float64")
+            keep = np.broadcast_to(c.predicate(values), values.shape)
+            axes[name] = values[keep].tolist()
+        else:
+            remaining.append(c)
+    return axes, remaining
+
+
+def sparse_grid(axes):
+    """Return the Cartesian product of `axes` (a dict of lists of values, one
+    per design variable) as float64 arrays which broadcast against each
+    other, one grid axis per design variable in the order given"""
+    values = [np.asarray(v, dtype="float64") for v in axes.values()]
+    return dict(zip(axes, np.meshgrid(*values, indexing="ij", sparse=True)))
+
+
+def keep_mask(columns, assume_discounting=True, constraints=()):
+    """True for the designs we keep. By convention prospect B is the more
+    delayed reward, so we drop designs where DA > DB. If we are assuming
+    discounting, we also drop designs where RB < RA. We also drop designs
+    which fail any of the `constraints`."""
+    keep = ~(columns["DA"] > columns["DB"])
+    if assume_discounting:
+        keep = keep & ~(columns["RB"] < columns["RA"])
+    for c in constraints:
+        keep = keep & c.predicate(*[columns[name] for name in c.variables])
+    return keep
+
+
+def gather(values, indices):
+    """Pick out the values at `indices` (as returned by np.unravel_index) from
+    an array of a sparse grid, only indexing along the axes it varies over"""
+    if values.size == 1:
+        return np.full(indices[0].shape, values.reshape(-1)[0])
+    index = tuple(i if n != 1 else 0 for i, n in zip(indices, values.shape))
+    return values[index]
+
+
+def grid_columns(axes, complete, grid_position):
+    """The design variables (as float64) at the given positions in the
+    (flattened) grid spanned by `axes`, where `complete` turns values of the
+    axes into the design variables (see `VirtualDesignSpace`)"""
+    shape = tuple(len(values) for values in axes.values())
+    indices = np.unravel_index(grid_position, shape)
+    values = {
+        name: np.asarray(values, dtype="float64")[index]
+        for (name, values), index in zip(axes.items(), indices)
+    }
+    columns = complete(values)
+    return {name: columns[name] for name in DESIGN_VARIABLES}
+
+
+def stream_designs(
+    axes,
+    complete,
+    assume_discounting=True,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    dtype="float64",
+    constraints=(),
+):
+    """Yield (index, DesignMatrix) for successive chunks of `chunk_size`
+    designs (the last may be smaller) from the grid spanned by `axes`, in the
+    same order as `DesignSpaceBuilder.build`. `index` is each design's
+    position in the grid, ie the index `build` gives it."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    n_grid = int(np.prod([len(values) for values in axes.values()]))
+    pending_index, pending_columns = [], []
+    n_pending = 0
+    for start in range(0, n_grid, chunk_size):
+        positions = np.arange(start, min(start + chunk_size, n_grid))
+        columns = grid_columns(axes, complete, positions)
+        keep = keep_mask(columns, assume_discounting, constraints)
+        pending_index.append(positions[keep])
+        pending_columns.append({name: v[keep] for name, v in columns.items()})
+        n_pending += pending_index[-1].size
+        while n_pending >= chunk_size:
+            index, columns = _pop_chunk(pending_index, pending_columns, chunk_size)
+            n_pending -= chunk_size
+            yield index, DesignMatrix(**columns, dtype=dtype)
+    if n_pending > 0:
+        index, columns = _pop_chunk(pending_index, pending_columns, n_pending)
+        yield index, DesignMatrix(**columns, dtype=dtype)
+
+
+def _pop_chunk(pending_index, pending_columns, size):
+    """Take the first `size` designs off the pending lists of grid positions
+    and columns, leaving any remainder in place"""
+    index = np.concatenate(pending_index)
+    columns = {
+        name: np.concatenate([c[name] for c in pending_columns])
+        for name in DESIGN_VARIABLES
+    }
+    pending_index[:] = [index[size:]]
+    pending_columns[:] = [{name: v[size:] for name, v in columns.items()}]
+    return index[:size], {name: v[:size] for name, v in columns.items()}
+
+
+class VirtualDesignSpace:
+    """
+    The designs of a `DesignSpaceBuilder`, represented implicitly by the grid
+    of design variable values and a bitset of which grid points are kept.
+    Create one with `DesignSpaceBuilder.build_virtual()`.
+
+    `axes` are the lists of values spanning the grid, and `complete` turns
+    arrays of those values into the design variables (RA, DA, PA, RB, DB, PB),
+    for example computing RA from RA_over_RB. Designs which fail any of the
+    `constraints` are dropped, along with those the built in filters drop.
+    """
+
+    def __init__(
+        self,
+        axes,
+        complete,
+        assume_discounting=True,
+        dtype="float64",
+        constraints=(),
+    ):
+        self.axes = {name: np.asarray(v, dtype="float64") for name, v in axes.items()}
+        self.shape = tuple(values.size for values in self.axes.values())
+        self.dtype = as_float_dtype(dtype)
+        self._complete = complete
+        self._bits = self._build_bitset(assume_discounting, constraints)
+        # number of designs before each block of the bitset
+        per_block = _POPCOUNT[self._bits].reshape(-1, _BLOCK_BITS // 8).sum(axis=1)
+        self._designs_before_block = np.concatenate(
+            [[0], np.cumsum(per_block, dtype=np.int64)]
+        )
+        self._n_designs = int(self._designs_before_block[-1])
+
+    def __len__(self):
+        return self._n_designs
+
+    @property
+    def n_grid(self):
+        """Number of points in the grid, including designs we drop"""
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        """Memory used by the bitset"""
+        return self._bits.nbytes + self._designs_before_block.nbytes
+
+    def chunk(self, start, stop):
+        """Return designs start to stop - 1 as a `DesignMatrix`"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return self.take(np.arange(start, max(start, stop)))
+
+    def chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Iterate over the space in chunks of up to `chunk_size` designs,
+        yielding (slice, DesignMatrix) for each chunk"""
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            yield slice(start, stop), self.chunk(start, stop)
+
+    def take(self, indices):
+        """Return the designs numbered `indices` as a `DesignMatrix`"""
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if np.any((indices < 0) | (indices >= len(self))):
+            raise IndexError(f"design index out of range for {len(self)} designs")
+        columns = grid_columns(self.axes, self._complete, self.grid_position(indices))
+        return DesignMatrix(**columns, dtype=self.dtype)
+
+    def get_design(self, index):
+        """Return design number `index` as a `Design` named tuple"""
+        return self.take([index]).get_design(0)
+
+    def to_design_matrix(self):
+        """Materialise the whole space, as `DesignSpaceBuilder.build` would"""
+        return self.chunk(0, len(self))
+
+    def grid_position(self, indices):
+        """Return the position in the (flattened) grid of the designs numbered
+        `indices`, ie the index `DesignSpaceBuilder.build` gives them"""
+        indices = np.asarray(indices, dtype=np.int64)
+        block = np.searchsorted(self._designs_before_block, indices, side="right") - 1
+        blocks, which_block = np.unique(block, return_inverse=True)
+        # unpack just the blocks we need, then find the set bits in them. The
+        # designs in block b are numbered from _designs_before_block[b].
+        bits = np.unpackbits(self._bits.reshape(-1, _BLOCK_BITS // 8)[blocks], axis=1)
+        set_bits = np.flatnonzero(bits)
+        designs_in_blocks = np.concatenate(
+            [[0], np.cumsum(np.count_nonzero(bits, axis=1))]
+        )
+        nth = (
+            designs_in_blocks[which_block.reshape(-1)]
+            + indices.reshape(-1)
+            - self._designs_before_block[block.reshape(-1)]
+        )
+        position = set_bits[nth]
+        grid_position = (
+            blocks[position // _BLOCK_BITS] * _BLOCK_BITS + position % _BLOCK_BITS
+        )
+        return grid_position.reshape(indices.shape)
+
+    def _build_bitset(self, assume_discounting, constraints):
+        """Evaluate the filters over the grid in chunks of `_MASK_CHUNK` grid
+        points, packing each chunk into one bit per grid point as we go, so we
+        never hold more than a chunk of design variables or mask at once"""
+        # padded with zeros to a whole number of blocks
+        n_blocks = -(-self.n_grid // _BLOCK_BITS)
+        bits = np.zeros(n_blocks * (_BLOCK_BITS // 8), dtype=np.uint8)
+        for start in range(0, self.n_grid, _MASK_CHUNK):
+            positions = np.arange(start, min(start + _MASK_CHUNK, self.n_grid))
+            columns = grid_columns(self.axes, self._complete, positions)
+            packed = np.packbits(keep_mask(columns, assume_discounting, constraints))
+            bits[start // 8 : start // 8 + packed.size] = packed
+        return bits
@@ -1,9 +1,24 @@
-from darc_toolbox import Design
+from darc_toolbox import Design, design_cache
+from darc_toolbox.canonical import DEFAULT_TOLERANCE, DesignIndex
+from darc_toolbox.design_matrix import CodedDesignMatrix, DesignMatrix, as_float_dtype
+from darc_toolbox.design_space import (
+    DEFAULT_CHUNK_SIZE,
+    VirtualDesignSpace,
+    constraint,
+    gather,
+    keep_mask,
+    push_down,
+    sparse_grid,
+    stream_designs,
+)
+from badapted import designs as badapted_designs
+from badapted.optimisation import design_optimisation
+import contextlib
+import hashlib
+import inspect
 import pandas as pd
 import numpy as np
 import logging
-import itertools
-
 
 DEFAULT_DB = np.concatenate(
     [
@@ -17,6 +32,110 @@ DEFAULT_DB = np.concatenate(
 ).tolist()
 
 
+class DARCDesignGenerator(badapted_designs.DesignGeneratorABC):
+    """Adds the DARC specifics to a design generator: the trial data is kept
+    as a DataFrame with one column per design variable, plus the response R"""
+
+    def __init__(self):
+        badapted_designs.DesignGeneratorABC.__init__(self)
+        self.data = pd.DataFrame(columns=list(Design._fields) + ["R"])
+
+    def add_design_response_to_dataframe(self, design, response):
+        trial_data = pd.DataFrame([design], columns=Design._fields)
+        trial_data["R"] = int(response)
+        if len(self.data) == 0:
+            self.data = trial_data
+        else:
+            self.data = pd.concat([self.data, trial_data], ignore_index=True)
+        self.data["R"] = self.data["R"].astype("int64")
+
+    @staticmethod
+    def df_to_design_tuple(df):
+        """Convert the first row of a DataFrame into a `Design`"""
+        return Design(**{name: df[name].values[0] for name in Design._fields})
+
+
+class BayesianAdaptiveDesignGenerator(
+    DARCDesignGenerator, badapted_designs.BayesianAdaptiveDesignGenerator
+):
+    """Bayesian adaptive design, choosing designs from `design_space` (a
+    DataFrame, eg from `DesignSpaceBuilder.build`)"""
+
+    def __init__(
+        self,
+        design_space,
+        max_trials=20,
+        allow_repeats=True,
+        penalty_function_option="default",
+        λ=2,
+    ):
+        # the order matters, as both set up self.data
+        badapted_designs.BayesianAdaptiveDesignGenerator.__init__(
+            self,
+            design_space,
+            max_trials=max_trials,
+            allow_repeats=allow_repeats,
+            penalty_function_option=penalty_function_option,
+            λ=λ,
+        )
+        DARCDesignGenerator.__init__(self)
+
+    def get_next_design(self, model):
+        """Return the design for the next trial, or None after `max_trials`.
+
+        If the model has a recorder (see `darc_toolbox.instrumentation`), we
+        record refining the design space and every evaluation of p(chose B)
+        as the "evaluate" phase, the design optimisation as "utility" (which
+        includes the evaluations it makes), and picking out the chosen design
+        as "choose". These are recorded as a trial of their own unless a trial
+        is already being recorded, in which case they are part of that one."""
+        if self.trial > self.max_trials - 1:
+            return None
+        recorder = model.recorder
+        if recorder is None or recorder.recording:
+            trial = contextlib.nullcontext()
+        else:
+            trial = recorder.trial(model, n_designs=len(self.all_possible_designs))
+        with trial:
+            return self._choose_design(model)
+
+    def _choose_design(self, model):
+        """The steps of badapted's get_next_design, each in its phase"""
+        logging.info(f"Getting design for trial {self.trial}")
+        with model._phase("evaluate"):
+            # a copy, as badapted adds columns to it
+            allowable_designs = self._refine_design_space(
+                model, self.all_possible_designs.copy()
+            )
+        if allowable_designs.shape[0] == 0:
+            logging.error(f"No ({allowable_designs.shape[0]}) designs left")
+        elif allowable_designs.shape[0] < 10:
+            logging.warning(f"Very few ({allowable_designs.shape[0]}) designs left")
+
+        penalty_func = None
+        if self.penalty_function_option == "default":
+
+            def penalty_func(designs):
+                return self._default_penalty_func(designs, λ=self.λ)
+
+        def predictive_y(θ, designs):
+            with model._phase("evaluate"):
+                return model.predictive_y(θ, designs)
+
+        with model._phase("utility"):
+            chosen_design_df, _ = design_optimisation(
+                allowable_designs,
+                predictive_y,
+                model.θ,
+                n_steps=50,
+                penalty_func=penalty_func,
+            )
+        with model._phase("choose"):
+            design = self.df_to_design_tuple(chosen_design_df)
+        logging.debug(f"chosen design is: {design}")
+        return design
+
+
 class DesignSpaceBuilder:
     """
     A class to generate a design space.
@@ -42,6 +161,8 @@ class DesignSpaceBuilder:
         self.PB = PB
         self.RA_over_RB = RA_over_RB
         self.IRI = IRI
+        self.constraints = []
+        self._n_designs = dict()
 
         self._input_type_validation()
         self._input_value_validation()
@@ -89,14 +210,102 @@ class DesignSpaceBuilder:
         if np.any((np.array(self.RA_over_RB) < 0) | (np.array(self.RA_over_RB) > 1)):
             raise ValueError("Expect all values of RA_over_RB to be between 0-1")
 
-    def build(self, assume_discounting=True):
+    def constrain(self, predicate, name=None):
+        """Only keep designs where `predicate` is True, eg
+        `builder.constrain(lambda DB: DB <= 365)` or
+        `builder.constrain(lambda RA, PA, RB, PB: RB * PB - RA * PA >= 5)`.
+        The predicate's arguments are named after the design variables it
+        depends on, and are arrays which broadcast against each other. It is
+        evaluated as the designs are generated, so excluded designs are never
+        materialised, and one which depends only on a design variable that
+        spans the grid (eg DB, unless it comes from IRI) just removes values
+        from that design variable's list.
+
+        The index of the designs is their position in the grid of the values
+        left after that. `name` is needed to cache the designs (see
+        `cache_key`). Returns the builder, so calls can be chained."""
+        self.constraints.append(constraint(predicate, name))
+        return self
+
+    def build(
+        self,
+        assume_discounting=True,
+        as_design_matrix=False,
+        dtype="float64",
+        cache_dir=None,
+    ):
         """Create a dataframe of all possible designs (one design is one row)
         based upon the set of design variables (RA, DA, PA, RB, DB, PB)
         provided. We do this generation process ONCE. There may be additional
         trial-level processes which choose subsets of all of the possible
         designs. But here, we generate the largest set of designs that we
         will ever consider
+
+        If `as_design_matrix` is True then we return a `DesignMatrix` rather
+        than a DataFrame. The model classes accept either.
+
+        All design variables are stored as `dtype`, which can be float64 (the
+        default) or float32.
+
+        If `cache_dir` is given, we look for these designs in that directory
+        first (see `darc_toolbox.design_cache`), and save them there if they
+        are not found. So launching the same protocol again loads its designs
+        rather than building them. `design_cache.default_cache_dir()` is a
+        reasonable choice.
         """
+        dtype = as_float_dtype(dtype)
+        if cache_dir is None:
+            columns, index = self._build_columns(assume_discounting, dtype)
+        else:
+            key = self.cache_key(assume_discounting, dtype)
+            cached = design_cache.load(cache_dir, key)
+            if cached is None:
+                columns, index = self._build_columns(assume_discounting, dtype)
+                design_cache.save(cache_dir, key, columns, index)
+            else:
+                # in the same order as we would have built them
+                axes, complete, _ = self._grid_axes()
+                order = complete(dict.fromkeys(axes, 0.0))
+                columns = {name: cached[0][name] for name in order}
+                index = cached[1]
+
+        if as_design_matrix:
+            return DesignMatrix(**columns, dtype=dtype)
+        return pd.DataFrame(columns, index=index)
+
+    def cache_key(self, assume_discounting=True, dtype="float64"):
+        """Return the key `build` files these designs under in the cache,
+        a hash of everything which determines them. Every constraint needs a
+        name. Constraints are identified by their names plus their predicate's
+        code, and the values it uses from outside (see
+        `_predicate_fingerprint`). That can't see inside functions the
+        predicate calls, so if what one of those does changes, the constraint
+        MUST be given a new name, or the cache will return stale designs."""
+        parameters = {
+            "DA": self.DA,
+            "DB": self.DB,
+            "RA": self.RA,
+            "RB": self.RB,
+            "RA_over_RB": self.RA_over_RB,
+            "IRI": self.IRI,
+            "PA": self.PA,
+            "PB": self.PB,
+            "assume_discounting": bool(assume_discounting),
+            "dtype": as_float_dtype(dtype).name,
+        }
+        if self.constraints:
+            names = [c.name for c in self.constraints]
+            if None in names:
+                raise ValueError("Name every constraint to cache the design space")
+            parameters["constraints"] = names
+            parameters["constraint_code"] = [
+                _predicate_fingerprint(c.predicate) for c in self.constraints
+            ]
+        return design_cache.cache_key(parameters)
+
+    def _build_columns(self, assume_discounting, dtype):
+        """Build the design variables as a dict of arrays, plus the index of
+        the designs in the full grid (None if no designs were dropped)"""
 
         # Log the raw values to help with debugging
         logging.debug(f"provided RA = {self.RA}")
@@ -108,6 +317,121 @@ class DesignSpaceBuilder:
         logging.debug(f"provided RA_over_RB = {self.RA_over_RB}")
         logging.debug(f"provided IRI = {self.IRI}")
 
+        axes, complete, constraints = self._grid_axes()
+        grid = complete(sparse_grid(axes))
+        shape = np.broadcast_shapes(*[values.shape for values in grid.values()])
+        logging.debug(f"{np.prod(shape)} designs generated initially")
+
+        # eliminate any designs where DA>DB, because by convention ProspectB is
+        # our more delayed reward, (if assume_discounting) where RB<RA, and any
+        # which fail the constraints. We only build a mask over the grid here,
+        # so designs we drop are never materialised.
+        keep = np.broadcast_to(keep_mask(grid, assume_discounting, constraints), shape)
+        logging.debug(f"{np.count_nonzero(keep)} left after filtering")
+
+        # Row numbers in the full grid of the designs we keep. These are in
+        # the same order as itertools.product, and become the DataFrame index.
+        rows = np.flatnonzero(keep)
+        indices = np.unravel_index(rows, shape)
+
+        # check we actually have some designs!
+        if rows.size == 0:
+            logging.error(f"No ({rows.size}) designs generated!")
+
+        columns = {
+            name: gather(values, indices).astype(dtype, copy=False)
+            for name, values in grid.items()
+        }
+        index = None if rows.size == np.prod(shape) else rows
+        return columns, index
+
+    def build_coded(self, assume_discounting=True, dtype="float64", cache_dir=None):
+        """Build the designs as `build` does, but return them as a
+        `CodedDesignMatrix`: a table of the values of each design variable,
+        plus a small integer code per design. This takes about 1/8 of the
+        memory, and models accept it in place of a `DesignMatrix`."""
+        designs = self.build(
+            assume_discounting,
+            as_design_matrix=True,
+            dtype=dtype,
+            cache_dir=cache_dir,
+        )
+        return CodedDesignMatrix.encode(designs)
+
+    def build_canonical(
+        self,
+        tolerance=DEFAULT_TOLERANCE,
+        assume_discounting=True,
+        dtype="float64",
+        cache_dir=None,
+    ):
+        """Build the designs as `build` does, then snap the design variables to
+        multiples of `tolerance` and remove duplicate designs. Returns a
+        `DesignIndex`, which numbers the designs that are left with stable
+        IDs and can look up the ID of any design."""
+        designs = self.build(
+            assume_discounting,
+            as_design_matrix=True,
+            dtype=dtype,
+            cache_dir=cache_dir,
+        )
+        return DesignIndex(designs, tolerance)
+
+    def n_designs(self, assume_discounting=True):
+        """The number of designs `build` makes, counted without building them.
+        The count is cached, so searches can report it on every trial for
+        free."""
+        axes, complete, constraints = self._grid_axes()
+        key = (
+            bool(assume_discounting),
+            tuple(
+                (name, np.asarray(values, dtype="float64").tobytes())
+                for name, values in axes.items()
+            ),
+            tuple(id(c) for c in self.constraints),
+        )
+        if key not in self._n_designs:
+            grid = complete(sparse_grid(axes))
+            shape = np.broadcast_shapes(*[values.shape for values in grid.values()])
+            keep = keep_mask(grid, assume_discounting, constraints)
+            self._n_designs[key] = int(np.count_nonzero(np.broadcast_to(keep, shape)))
+        return self._n_designs[key]
+
+    def build_virtual(self, assume_discounting=True, dtype="float64"):
+        """Return the same designs as `build`, but as a `VirtualDesignSpace`
+        which decodes designs from the grid of design variable values on
+        demand, rather than storing them. Use this for design spaces too big
+        to hold in memory."""
+        axes, complete, constraints = self._grid_axes()
+        return VirtualDesignSpace(
+            axes, complete, assume_discounting, dtype, constraints=constraints
+        )
+
+    def iter_chunks(
+        self, chunk_size=DEFAULT_CHUNK_SIZE, assume_discounting=True, dtype="float64"
+    ):
+        """Iterate over the same designs as `build`, in the same order, as
+        chunks of `chunk_size` designs. Yields (index, DesignMatrix) for each
+        chunk, where index is the index `build` would give those designs.
+        Only a chunk or two is ever in memory, so this works for design spaces
+        far too big to build (see `design_search.streaming_search`)."""
+        axes, complete, constraints = self._grid_axes()
+        return stream_designs(
+            axes, complete, assume_discounting, chunk_size, dtype, constraints
+        )
+
+    def _grid_axes(self):
+        """Return the lists of values which span the grid of designs, a
+        function which turns arrays of those values into the design variables
+        (RA, DA, PA, RB, DB, PB), and the constraints to apply over the grid.
+        Constraints on a single axis have already been applied to its values."""
+        axes, complete = self._axes()
+        axes, constraints = push_down(axes, self.constraints)
+        return axes, complete, constraints
+
+    def _axes(self):
+        """Return the lists of values which span the grid of designs, and a
+        function which turns arrays of those values into the design variables"""
         if len(self.IRI) > 1:
             """
             We have been given IRI values. We want to
@@ -127,73 +451,40 @@ class DesignSpaceBuilder:
                     "You might know what you are doing, but a fixed reward ratio is recommended when using front-end delays"
                 )
 
-            column_list = ["RA", "DA", "PA", "RB", "IRI", "PB"]
-            list_of_lists = [self.RA, self.DA, self.PA, self.RB, self.IRI, self.PB]
-            all_combinations = list(itertools.product(*list_of_lists))
-            D = pd.DataFrame(all_combinations, columns=column_list)
-            D["DB"] = D["DA"] + D["IRI"]
-            D = D.drop(columns=["IRI"])
+            axes = dict(
+                RA=self.RA, DA=self.DA, PA=self.PA, RB=self.RB, IRI=self.IRI, PB=self.PB
+            )
+            return axes, _DB_from_IRI
 
         elif not self.RA_over_RB:
             """assuming we are not doing magnitude effect, as this is
             when we normally would be providing RA_over_RB values"""
 
-            # NOTE: the order of the two lists below HAVE to be the same
-            column_list = ["RA", "DA", "PA", "RB", "DB", "PB"]
-            list_of_lists = [self.RA, self.DA, self.PA, self.RB, self.DB, self.PB]
-            all_combinations = list(itertools.product(*list_of_lists))
-            D = pd.DataFrame(all_combinations, columns=column_list)
+            axes = dict(
+                RA=self.RA, DA=self.DA, PA=self.PA, RB=self.RB, DB=self.DB, PB=self.PB
+            )
+            return axes, _as_is
 
         elif not self.RA:
             """now assume we are dealing with magnitude effect"""
 
-            # create all designs, but using RA_over_RB
-            # NOTE: the order of the two lists below HAVE to be the same
-            column_list = ["RA_over_RB", "DA", "PA", "RB", "DB", "PB"]
-            list_of_lists = [
-                self.RA_over_RB,
-                self.DA,
-                self.PA,
-                self.RB,
-                self.DB,
-                self.PB,
-            ]
-            all_combinations = list(itertools.product(*list_of_lists))
-            D = pd.DataFrame(all_combinations, columns=column_list)
-
-            # now we will convert RA_over_RB to RA for each design then remove it
-            D["RA"] = D["RB"] * D["RA_over_RB"]
-            D = D.drop(columns=["RA_over_RB"])
+            # create all designs, but using RA_over_RB, then convert RA_over_RB
+            # to RA for each design
+            axes = dict(
+                RA_over_RB=self.RA_over_RB,
+                DA=self.DA,
+                PA=self.PA,
+                RB=self.RB,
+                DB=self.DB,
+                PB=self.PB,
+            )
+            return axes, _RA_from_RA_over_RB
 
         else:
-            logging.error(
+            raise ValueError(
                 "Failed to work out what we want. Confusion over RA and RA_over_RB"
             )
 
-        logging.debug(f"{D.shape[0]} designs generated initially")
-
-        # eliminate any designs where DA>DB, because by convention ProspectB is
-        # our more delayed reward
-        D.drop(D[D.DA > D.DB].index, inplace=True)
-        logging.debug(f"{D.shape[0]} left after dropping DA>DB")
-
-        if assume_discounting:
-            D.drop(D[D.RB < D.RA].index, inplace=True)
-            logging.debug(f"{D.shape[0]} left after dropping RB<RA")
-
-        # NOTE: we may want to do further trimming and refining of the possible
-        # set of designs, based upon domain knowledge etc.
-
-        # check we actually have some designs!
-        if D.shape[0] == 0:
-            logging.error(f"No ({D.shape[0]}) designs generated!")
-
-        # convert all columns to float64.
-        for col_name in D.columns:
-            D[col_name] = D[col_name].astype("float64")
-
-        return D
-
     """ Define alternate constructors here
     These methods are convenient in order to set up design spaces without
     having to define all the design dimensions individually.
@@ -279,3 +570,67 @@ class DesignSpaceBuilder:
             RB=[100],
         )
 
+
+def _predicate_fingerprint(predicate):
+    """Hash what a constraint's predicate does, for the cache key: its
+    bytecode and constants, and the values of the names it uses from outside
+    (defaults, closure variables and globals). Functions it calls are hashed by
+    name only. Predicates which aren't Python functions hash to their repr."""
+    code = getattr(predicate, "__code__", None)
+    if code is None:
+        return repr(predicate)
+    closure = [cell.cell_contents for cell in predicate.__closure__ or ()]
+    used_globals = {
+        name: predicate.__globals__[name]
+        for name in _names(code)
+        if name in predicate.__globals__
+    }
+    digest = hashlib.sha256(_code_bytes(code))
+    for value in [predicate.__defaults__, *closure, *used_globals.items()]:
+        digest.update(_value_bytes(value))
+    return digest.hexdigest()
+
+
+def _names(code):
+    """The global names used by a code object, or by those nested in it"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _names(const)
+    return sorted(names)
+
+
+def _code_bytes(code):
+    parts = [code.co_code, repr(code.co_names).encode()]
+    for const in code.co_consts:
+        parts.append(
+            _code_bytes(const) if inspect.iscode(const) else repr(const).encode()
+        )
+    return b"\0".join(parts)
+
+
+def _value_bytes(value):
+    if isinstance(value, tuple):
+        return b"\0".join(_value_bytes(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return f"{value.dtype}{value.shape}".encode() + value.tobytes()
+    if inspect.ismodule(value) or callable(value):
+        # the repr of a function includes its address, which changes from run
+        # to run
+        name = getattr(value, "__qualname__", getattr(value, "__name__", ""))
+        return f"{getattr(value, '__module__', '')}.{name}".encode()
+    return repr(value).encode()
+
+
+def _as_is(columns):
+    return columns
+
+
+def _DB_from_IRI(columns):
+    columns["DB"] = columns["DA"] + columns.pop("IRI")
+    return columns
+
+
+def _RA_from_RA_over_RB(columns):
+    columns["RA"] = columns["RB"] * columns.pop("RA_over_RB")
+    return columns
@@ -0,0 +1,205 @@
+"""
+Optional compiled backend which fuses a model's discount functions, decision
+variable and cumulative normal choice function into a single pass.
+
+The NumPy path builds several temporary (designs x particles) arrays (VA, VB,
+VB - VA, and so on) before the choice function is applied. Here we loop over
+designs and particles once, writing p(chose B) straight into the output array,
+and spread the designs over all cores.
+
+This needs Numba. If it is not installed, `HAVE_NUMBA` is False, `jit` does
+nothing, and models always use the NumPy path.
+
+A model class opts in by providing:
+- `_fused_parameters(θ)`, returning a tuple of 1D particle arrays (eg
+  `np.exp(θ["logk"])`), computed once per call with NumPy.
+- `_fused_value(reward, delay, prob, params, j)`, a `jit` compiled function
+  returning the present subjective value of one prospect for particle j,
+  where `params[n, j]` is element j of the nth array from `_fused_parameters`.
+
+The decision variable is then VB - VA. The scalar functions below mirror the
+broadcasting ones in `darc_toolbox.kernels`, including their special cases.
+"""
+
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+if HAVE_NUMBA:
+    # error_model="numpy" so that 1 / 0 gives inf rather than raising
+    jit = numba.njit(cache=True, error_model="numpy")
+    _jit_parallel = numba.njit(parallel=True, error_model="numpy")
+    prange = numba.prange
+else:
+
+    def jit(func):
+        return func
+
+    def _jit_parallel(func):
+        return func
+
+    prange = range
+
+
+# SCALAR DISCOUNT AND WEIGHTING FUNCTIONS =====================================
+
+
+@jit
+def hyperbolic(delay, k):
+    if delay == 0:
+        return 1.0
+    return 1 / (1 + k * delay)
+
+
+@jit
+def exponential(delay, k):
+    if delay == 0:
+        return 1.0
+    return math.exp(-k * delay)
+
+
+@jit
+def hyperboloid_myerson(delay, k, s):
+    return 1 / (1 + k * delay) ** s
+
+
+@jit
+def hyperboloid_rachlin(delay, k, s):
+    if delay == 0:
+        return 1.0
+    return 1 / (1 + (k * delay) ** s)
+
+
+@jit
+def constant_sensitivity(delay, a, b):
+    return math.exp(-((a * delay) ** b))
+
+
+@jit
+def magnitude_effect_k(reward, m, c):
+    return math.exp(m * math.log(reward) + c)
+
+
+@jit
+def hyperbolic_odds(probability, h):
+    if probability == 0:
+        return 0.0
+    return 1 / (1 + h * ((1 - probability) / probability))
+
+
+@jit
+def prelec(p, γ):
+    if p == 0:
+        return 0.0
+    return math.exp(-((-math.log(p)) ** γ))
+
+
+@jit
+def linear_in_log_odds(p, δ, γ):
+    if p == 0.0 or p == 1.0:
+        return p
+    numerator = δ * p**γ
+    return numerator / (numerator + (1 - p) ** γ)
+
+
+# CHOICE FUNCTION =============================================================
+
+_SQRT1_2 = 1 / math.sqrt(2)
+
+
+@jit
+def ndtr(x):
+    """Cumulative normal distribution, computed as in `scipy.special.ndtr`"""
+    z = x * _SQRT1_2
+    if z >= 6:
+        # 0.5 * erfc(6) < 2^-54, so 1 - y rounds to exactly 1. This saves
+        # calling erfc for the many particles which are sure to choose B.
+        return 1.0
+    if abs(z) < _SQRT1_2:
+        return 0.5 + 0.5 * math.erf(z)
+    y = 0.5 * math.erfc(abs(z))
+    return 1 - y if z > 0 else y
+
+
+@jit
+def cumulative_normal_choice(decision_variable, α, ϵ):
+    """As `choice_functions.CumulativeNormalChoiceFunc`, for one value"""
+    return ϵ + (1 - 2 * ϵ) * ndtr(decision_variable / α)
+
+
+# FUSED KERNELS ===============================================================
+
+_kernels = dict()
+
+
+def _grid_kernel(value):
+    @_jit_parallel
+    def kernel(RA, DA, PA, RB, DB, PB, params, α, ϵ, out):
+        for i in prange(out.shape[0]):
+            for j in range(out.shape[1]):
+                VA = value(RA[i], DA[i], PA[i], params, j)
+                VB = value(RB[i], DB[i], PB[i], params, j)
+                out[i, j] = cumulative_normal_choice(VB - VA, α[j], ϵ)
+
+    return kernel
+
+
+def _paired_kernel(value):
+    @_jit_parallel
+    def kernel(RA, DA, PA, RB, DB, PB, params, α, ϵ, out):
+        design_stride = 1 if RA.shape[0] > 1 else 0
+        particle_stride = 1 if α.shape[0] > 1 else 0
+        for n in prange(out.shape[0]):
+            i = n * design_stride
+            j = n * particle_stride
+            VA = value(RA[i], DA[i], PA[i], params, j)
+            VB = value(RB[i], DB[i], PB[i], params, j)
+            out[n] = cumulative_normal_choice(VB - VA, α[j], ϵ)
+
+    return kernel
+
+
+def _get_kernel(layout, value):
+    """Compiled kernels are built (and cached) per model value function"""
+    key = (layout, value)
+    if key not in _kernels:
+        _kernels[key] = {"grid": _grid_kernel, "paired": _paired_kernel}[layout](value)
+    return _kernels[key]
+
+
+def _arguments(model, θ, designs):
+    params = np.stack(model._fused_parameters(θ)).astype(designs.dtype, copy=False)
+    α = np.asarray(θ["α"], dtype=designs.dtype).reshape(-1)
+    columns = [designs[name] for name in ("RA", "DA", "PA", "RB", "DB", "PB")]
+    return columns, np.ascontiguousarray(params), α
+
+
+def predictive_y_grid(model, θ, designs):
+    """p(chose B) for every design (a `DesignMatrix`) and particle (a dict of
+    1D arrays), shaped (n_designs, n_particles)"""
+    columns, params, α = _arguments(model, θ, designs)
+    out = np.empty((len(designs), α.size), dtype=designs.dtype)
+    kernel = _get_kernel("grid", model._fused_value)
+    kernel(*columns, params, α, model.θ_fixed["ϵ"], out)
+    return out
+
+
+def predictive_y(model, θ, designs):
+    """p(chose B) for designs and particles matched up row by row, where
+    either can have a single row which is used for every pair"""
+    columns, params, α = _arguments(model, θ, designs)
+    n_designs, n_particles = len(designs), α.size
+    if n_designs != n_particles and 1 not in (n_designs, n_particles):
+        raise ValueError(
+            f"Cannot pair {n_designs} designs with {n_particles} particles"
+        )
+    out = np.empty(max(n_designs, n_particles), dtype=designs.dtype)
+    kernel = _get_kernel("paired", model._fused_value)
+    kernel(*columns, params, α, model.θ_fixed["ϵ"], out)
+    return out
@@ -0,0 +1,100 @@
+"""
+Profiling hooks on model evaluation.
+
+A hook is a callable `hook(model, method, shapes, elapsed_ns)`, which is
+called after each evaluation of a model with
+
+- model: the model
+- method: "predictive_y", "predictive_y_grid", "_calc_decision_variable" (for
+  every evaluation of the decision variable, including those within
+  predictive_y) or the name of the choice function (eg
+  "CumulativeNormalChoiceFunc")
+- shapes: the shape of each input, eg ((n_particles, n_parameters),
+  (n_designs, 6)) for predictive_y(θ, designs) with θ a DataFrame
+- elapsed_ns: the wall time the call took, in nanoseconds
+
+Register hooks with `DARCModel.add_hook(hook)` for every model, or eg
+`Hyperbolic.add_hook(hook)` for one model class and its subclasses. They can
+collect counters, or start and stop cProfile or tracemalloc around the
+evaluations of interest. Hooks run in the calling process only, not in the
+worker processes of `model.n_workers`, and the fused Numba kernels are timed
+as a whole by predictive_y(_grid).
+
+When no hooks are registered, each evaluation only checks `hooks.active`.
+"""
+
+import time
+import numpy as np
+
+# True whenever any hook is registered
+active = False
+
+_hooks = dict()
+_hooks_by_class = dict()
+
+
+def add(model_class, hook):
+    """Call `hook` after evaluations of `model_class` and its subclasses"""
+    global active
+    _hooks.setdefault(model_class, []).append(hook)
+    _hooks_by_class.clear()
+    active = True
+
+
+def remove(model_class, hook):
+    """Stop calling a hook registered on `model_class`. Raises ValueError if
+    it was not registered."""
+    global active
+    _hooks.get(model_class, []).remove(hook)
+    if not _hooks.get(model_class, True):
+        del _hooks[model_class]
+    _hooks_by_class.clear()
+    active = bool(_hooks)
+
+
+def clear():
+    """Remove every hook, from every model class"""
+    global active
+    _hooks.clear()
+    _hooks_by_class.clear()
+    active = False
+
+
+def hooks_for(model_class):
+    """The hooks which apply to `model_class`, including those registered on
+    its base classes"""
+    hooks = _hooks_by_class.get(model_class)
+    if hooks is None:
+        hooks = tuple(
+            hook for cls in model_class.__mro__ for hook in _hooks.get(cls, ())
+        )
+        _hooks_by_class[model_class] = hooks
+    return hooks
+
+
+def call(model, method, function, *args, **kwargs):
+    """Return function(*args, **kwargs), then pass how long it took to the
+    hooks of the model's class"""
+    hooks = hooks_for(type(model))
+    if not hooks:
+        return function(*args, **kwargs)
+    start = time.perf_counter_ns()
+    result = function(*args, **kwargs)
+    elapsed_ns = time.perf_counter_ns() - start
+    shapes = tuple(shape(arg) for arg in args)
+    for hook in hooks:
+        hook(model, method, shapes, elapsed_ns)
+    return result
+
+
+def shape(value):
+    """The shape of a model input: an array, a DataFrame, a `DesignMatrix`, or
+    a dict of particle arrays (whose shapes are broadcast together)"""
+    if isinstance(value, dict):
+        return np.broadcast_shapes(*(np.shape(v) for v in value.values()))
+    if hasattr(value, "shape"):
+        return tuple(value.shape)
+    if hasattr(value, "__len__"):
+        # ColumnVectors, which are shaped (n_designs, 1) for grid evaluation
+        return (len(value), 1)
+    return np.shape(value)
@@ -0,0 +1,202 @@
+"""
+Optional instrumentation of the time (and memory) each trial takes.
+
+A `TrialRecorder` records, for each trial, the wall time and peak memory of
+each phase of the trial:
+
+- evaluate: evaluating p(chose B) over the design space
+- utility: scoring designs (eg mutual information) from those evaluations
+- choose: picking the best design
+- update: updating beliefs given the response
+- resample: resampling (and moving) particles, where that is separate from
+  the update
+
+along with the model, the number of particles and the number of designs.
+The last `capacity` trials are kept in memory (`records`), and can be saved
+with `to_csv` or `to_json`, or summarised with `summary`.
+
+Give a model a recorder with `model.recorder = TrialRecorder()`. The model
+then records the phases it runs (`reduce_predictive_y`, `update_beliefs`, and
+the searches in `darc_toolbox.design_search`), within a trial you mark with
+
+    with model.recorder.trial(model, n_designs=len(designs)):
+        ...
+
+`BatchSimulation` marks its own trials, when its model has a recorder. So does
+`designs.BayesianAdaptiveDesignGenerator.get_next_design`, unless it is called
+within a trial, but its trials end when it returns the design, so they miss the
+update. To record the update too, mark the trial around both
+
+    with model.recorder.trial(model, n_designs=len(design_space)):
+        design = generator.get_next_design(model)
+        ...
+        model.update_beliefs(generator.data)
+
+Phases run outside of a trial are not recorded, and models without a recorder
+(the default) skip all of this.
+
+Peak memory is measured with `tracemalloc`, which NumPy reports its
+allocations to. It is the most memory allocated at once during a phase, over
+what was allocated when the phase started. Tracing slows Python code down, so
+pass `track_memory=False` to only record times.
+"""
+
+import contextlib
+import json
+import time
+import tracemalloc
+from collections import deque
+import pandas as pd
+
+PHASES = ("evaluate", "utility", "choose", "update", "resample")
+DEFAULT_CAPACITY = 10_000
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+# a phase for models without a recorder, which does nothing
+NO_PHASE = contextlib.nullcontext()
+
+
+class TrialRecorder:
+    """
+    Records the phases of each trial, keeping the last `capacity` trials in
+    `records` (a ring buffer). Each record is a dict with the trial number,
+    model, n_particles and n_designs (plus any labels given to `trial`), the
+    trial's total seconds and peak_bytes, and then {phase}_seconds and
+    {phase}_peak_bytes for each phase which ran during the trial.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, track_memory=True):
+        self.records = deque(maxlen=capacity)
+        self.track_memory = track_memory
+        self.n_trials = 0
+        self._trial = None
+
+    @contextlib.contextmanager
+    def trial(self, model, n_designs, n_particles=None, **labels):
+        """Record one trial of `model`, over `n_designs` designs, while in this
+        context. n_particles defaults to the number of the model's particles.
+        Yields the record, which is added to `records` at the end."""
+        if self._trial is not None:
+            raise RuntimeError("Already recording a trial")
+        if n_particles is None:
+            n_particles = len(model.θ)
+        record = dict(
+            trial=self.n_trials,
+            model=type(model).__name__,
+            n_particles=int(n_particles),
+            n_designs=int(n_designs),
+            **labels,
+        )
+        started_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        self._trial = _Trial(self.track_memory)
+        try:
+            yield record
+        finally:
+            record.update(self._trial.finish())
+            self._trial = None
+            if started_tracing:
+                tracemalloc.stop()
+            self.records.append(record)
+            self.n_trials += 1
+
+    @property
+    def recording(self):
+        """True while a trial is being recorded"""
+        return self._trial is not None
+
+    def phase(self, name):
+        """A context which records its time (and memory) as phase `name` of the
+        current trial. Time in a phase entered more than once in a trial is
+        summed, and the peak memory is the largest."""
+        if self._trial is None:
+            return NO_PHASE
+        return self._trial.phase(name)
+
+    def clear(self):
+        self.records.clear()
+
+    def to_dataframe(self):
+        """The records as a DataFrame, one row per trial"""
+        return pd.DataFrame(list(self.records))
+
+    def to_csv(self, path):
+        self.to_dataframe().to_csv(path, index=False)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(list(self.records), f, indent=2)
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        """Quantiles of the time taken by each phase (and the whole trial), for
+        each model, particle count and design count"""
+        df = self.to_dataframe()
+        columns = [name for name in df.columns if name.endswith("seconds")]
+        groups = df.groupby(["model", "n_particles", "n_designs"])[columns]
+        return groups.quantile(list(quantiles)).unstack()
+
+
+class _Trial:
+    """The phases of the trial being recorded. Phases may be nested, in which
+    case time in the inner phase also counts towards the outer one."""
+
+    def __init__(self, track_memory):
+        self.track_memory = track_memory
+        self.seconds = dict()
+        self.peak_bytes = dict()
+        self._open = []
+        self._start = time.perf_counter()
+        self._baseline = self._current_memory()
+        self._peak = self._baseline
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self._update_peaks()
+        entry = _OpenPhase(self._current_memory())
+        self._open.append(entry)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._update_peaks()
+            self._open.remove(entry)
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+            peak = entry.peak - entry.baseline
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+
+    def finish(self):
+        self._update_peaks()
+        result = dict(seconds=time.perf_counter() - self._start)
+        if self.track_memory:
+            result["peak_bytes"] = self._peak - self._baseline
+        names = [name for name in PHASES if name in self.seconds]
+        names += [name for name in self.seconds if name not in PHASES]
+        for name in names:
+            result[f"{name}_seconds"] = self.seconds[name]
+            if self.track_memory:
+                result[f"{name}_peak_bytes"] = self.peak_bytes[name]
+        return result
+
+    def _current_memory(self):
+        return tracemalloc.get_traced_memory()[0] if self.track_memory else 0
+
+    def _update_peaks(self):
+        """Fold the peak since the last call into every open phase, then reset
+        it, so the next call sees only what happened since"""
+        if not self.track_memory:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        self._peak = max(self._peak, peak)
+        for entry in self._open:
+            entry.peak = max(entry.peak, peak)
+
+
+class _OpenPhase:
+    __slots__ = ("baseline", "peak")
+
+    def __init__(self, baseline):
+        self.baseline = baseline
+        self.peak = baseline
@@ -0,0 +1,163 @@
+"""
+Discount and probability weighting functions shared by the model classes.
+
+Every function here is written in terms of plain numpy ufuncs so that it
+broadcasts over whatever shapes it is given. The model classes pass in design
+variables and parameter particles as arrays, so one call evaluates every
+(particle, design) pair without any Python level looping. Special cases (such
+as a delay of zero or a probability of exactly 0 or 1) are handled with masks
+rather than branches, so these functions never need wrapping in
+`np.vectorize`.
+
+Each function allocates its result once, then works on it in place (see
+`in_place`), rather than allocating a new array at every step.
+"""
+
+import numpy as np
+
+# IN PLACE ARITHMETIC =========================================================
+
+
+def in_place(ufunc, temporary, *others):
+    """Return ufunc(temporary, *others), writing the result over `temporary`
+    if it is an array with the shape and dtype of the result. Only pass in
+    intermediate results which nothing else refers to, never a design variable
+    or particle array. The operands are always passed in this order, so the
+    result is identical to ufunc(temporary, *others)."""
+    shape = np.broadcast_shapes(np.shape(temporary), *[np.shape(x) for x in others])
+    dtype = np.result_type(temporary, *others)
+    if is_temporary(temporary, shape, dtype):
+        return ufunc(temporary, *others, out=temporary)
+    return ufunc(temporary, *others)
+
+
+def is_temporary(values, shape, dtype):
+    """True if `values` is an array we can write over: it owns its memory
+    (so it is not a view of a design variable or particle array), and has the
+    given shape and dtype"""
+    return (
+        isinstance(values, np.ndarray)
+        and values.base is None
+        and values.flags.writeable
+        and values.shape == shape
+        and values.dtype == dtype
+    )
+
+
+def _where(condition, x, temporary):
+    """np.where(condition, x, temporary), overwriting `temporary` if we can"""
+    shape = np.broadcast_shapes(np.shape(condition), np.shape(x), np.shape(temporary))
+    dtype = np.result_type(x, temporary)
+    if is_temporary(temporary, shape, dtype):
+        np.copyto(temporary, x, where=condition)
+        return temporary
+    return np.where(condition, x, temporary)
+
+
+# PROBABILITY / ODDS CONVERSIONS ==============================================
+
+
+def prob_to_odds_against(probabilities):
+    """convert probabilities of getting reward to odds against getting it"""
+    odds_against = (1 - probabilities) / probabilities
+    return odds_against
+
+
+def odds_against_to_probs(odds):
+    probabilities = 1 / (1 + odds)
+    return probabilities
+
+
+# TIME DISCOUNT FUNCTIONS =====================================================
+
+
+def hyperbolic(delay, k):
+    """Hyperbolic discount fraction, 1 / (1 + k * delay).
+
+    Rewards with zero delay are never discounted, even if k has overflowed to
+    inf (which happens far sooner in float32). This is deliberate: the formula
+    alone gives 1 / (1 + inf * 0) = NaN there, which would make p(chose B)
+    NaN for every design with an immediate reward. For finite k the result is
+    exactly that of the formula.
+    """
+    with np.errstate(invalid="ignore"):
+        discount_fraction = in_place(np.add, np.multiply(k, delay), 1)
+    discount_fraction = in_place(np.reciprocal, discount_fraction)
+    return _where(delay == 0, 1.0, discount_fraction)
+
+
+def exponential(delay, k):
+    """Exponential discount fraction, exp(-k * delay). Rewards with zero delay
+    are never discounted, even for k = inf (where the formula gives NaN), as
+    for `hyperbolic`."""
+    with np.errstate(invalid="ignore"):
+        discount_fraction = in_place(np.negative, np.multiply(k, delay))
+    discount_fraction = in_place(np.exp, discount_fraction)
+    return _where(delay == 0, 1.0, discount_fraction)
+
+
+def hyperboloid_myerson(delay, k, s):
+    """Myerson & Green (1995) hyperboloid, 1 / (1 + k * delay)^s"""
+    discount_fraction = in_place(np.add, np.multiply(k, delay), 1)
+    discount_fraction = in_place(np.power, discount_fraction, s)
+    return in_place(np.reciprocal, discount_fraction)
+
+
+def hyperboloid_rachlin(delay, k, s):
+    """Modified Rachlin hyperboloid, 1 / (1 + (k * delay)^s).
+
+    Rewards with zero delay are never discounted, whatever the value of s.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discount_fraction = in_place(np.power, np.multiply(k, delay), s)
+        discount_fraction = in_place(np.add, discount_fraction, 1)
+        discount_fraction = in_place(np.reciprocal, discount_fraction)
+    return _where(delay == 0, 1.0, discount_fraction)
+
+
+def constant_sensitivity(delay, a, b):
+    """Ebert & Prelec (2007) constant sensitivity, exp(-(a * delay)^b)"""
+    discount_fraction = in_place(np.power, np.multiply(a, delay), b)
+    discount_fraction = in_place(np.negative, discount_fraction)
+    return in_place(np.exp, discount_fraction)
+
+
+def magnitude_effect_k(reward, m, c):
+    """Discount rate for a given reward magnitude, where log(k) is a linear
+    function of log(reward) with slope m and intercept c"""
+    k = in_place(np.add, np.multiply(m, np.log(reward)), c)
+    return in_place(np.exp, k)
+
+
+# PROBABILITY WEIGHTING FUNCTIONS =============================================
+
+
+def hyperbolic_odds(probabilities, h):
+    """Hyperbolic discounting of the odds against getting the reward,
+    1 / (1 + h * odds_against). A reward with p = 0 has zero value."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        odds_against = prob_to_odds_against(probabilities)
+        discount_fraction = in_place(np.add, np.multiply(h, odds_against), 1)
+        discount_fraction = in_place(np.reciprocal, discount_fraction)
+    return _where(probabilities == 0, 0.0, discount_fraction)
+
+
+def prelec(p, γ):
+    """Prelec (1998) one parameter probability weighting function,
+    exp(-(-log(p))^γ). Maps p = 0 to 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w = in_place(np.power, np.negative(np.log(p)), γ)
+        w = in_place(np.negative, w)
+        w = in_place(np.exp, w)
+    return _where(p == 0, 0.0, w)
+
+
+def linear_in_log_odds(p, δ, γ):
+    """Gonzalez & Wu (1999) linear in log odds probability weighting function,
+    δp^γ / (δp^γ + (1-p)^γ). The end points p = 0 and p = 1 are fixed points.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        numerator = in_place(np.multiply, np.power(p, γ), δ)
+        denominator = in_place(np.add, np.power(1 - p, γ), numerator)
+        w = in_place(np.divide, numerator, denominator)
+    return _where((p == 0.0) | (p == 1.0), p, w)
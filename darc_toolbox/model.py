@@ -0,0 +1,444 @@
+"""
+The base class for all of the DARC model classes.
+
+`badapted.model.Model` hands our models particles θ and designs as pandas
+DataFrames. `DARCModel` converts these into plain numpy arrays once per call
+(particles into a dict of arrays, designs into a `DesignMatrix`) so that the
+concrete model classes only ever deal with arrays. Concrete classes just
+implement `_decision_variable(θ, data)` where `θ["logk"]`, `data["RA"]` etc are
+numpy arrays which broadcast against each other.
+
+Models compute in float64 by default. Setting `model.dtype = "float32"` makes
+a model convert particles and designs to float32, so every intermediate array
+(and the returned p(chose B)) is float32 as well.
+
+Setting `model.backend = "numba"` evaluates p(chose B) with the compiled,
+fused kernels in `darc_toolbox.fused` instead, for models which provide them.
+
+For large design spaces and particle sets, `reduce_predictive_y` evaluates the
+grid in tiles which fit within a memory budget, passing each tile to a
+streaming reducer (see `darc_toolbox.reducers`).
+
+Particles are converted to arrays once, and any parameters derived from them
+(eg k = exp(logk)) are computed once, then cached. The cache is looked up by
+the particles' values, so it also serves the copies and subsets of `model.θ`
+which badapted passes in, and never goes stale (see `DARCModel._particles`).
+
+Setting `model.n_workers` to more than 1 splits the particles over a pool of
+worker processes (see `darc_toolbox.parallel`).
+
+Setting `model.recorder` to a `darc_toolbox.instrumentation.TrialRecorder`
+records the time (and memory) taken by each phase of a trial.
+
+`DARCModel.add_hook` registers a callback which is told how long each
+evaluation took (see `darc_toolbox.hooks`).
+
+Concrete classes combine (designs x particles) intermediate arrays with
+`kernels.in_place`, and the choice function writes p(chose B) over the decision
+variable, so evaluating a model allocates as few full size arrays as possible.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from scipy.stats import bernoulli
+from badapted.model import Model
+from darc_toolbox import fused, hooks, parallel
+from darc_toolbox.choice_functions import (
+    CumulativeNormalChoiceFunc,
+    StandardCumulativeNormalChoiceFunc,
+)
+from darc_toolbox.design_matrix import DesignMatrix, as_float_dtype
+from darc_toolbox.instrumentation import NO_PHASE
+from darc_toolbox.kernels import is_temporary
+
+BACKENDS = ("numpy", "numba")
+# Default memory budget for one tile of a tiled grid evaluation
+DEFAULT_TILE_BYTES = 256 * 2**20
+# Rough number of (n_designs, n_particles) arrays alive at once while a model
+# is evaluated (eg VA, VB, VB - VA and p(chose B))
+_TEMPORARIES_PER_TILE = 4
+# Number of particle sets a model caches the arrays of (see `_particles`).
+# Enough for a trial: the particles, their shuffled copy in design
+# optimisation, θ_true, and the proposals of update_beliefs.
+_MAX_PARTICLE_CACHES = 8
+# Choice functions which accept an `out` array
+_IN_PLACE_CHOICE_FUNCTIONS = (
+    CumulativeNormalChoiceFunc,
+    StandardCumulativeNormalChoiceFunc,
+)
+
+
+class DARCModel(Model):
+    """
+    Base class for the DARC models. We evaluate models in two contexts:
+
+    PAIRED
+    `predictive_y(θ, data)` follows the badapted convention. Particles and
+    designs are matched up row by row (or either one broadcasts if it has a
+    single row). The output is 1D.
+
+    GRID
+    `predictive_y_grid(θ, designs)` evaluates every particle against every
+    design. Designs are used as column vectors and particles as row vectors,
+    so the output has shape (n_designs, n_particles).
+
+    Concrete classes should evaluate any function of a single design variable
+    (or a few design variables) and the particles, such as a discount function,
+    with `data.map_unique`. In the grid context this evaluates the function only
+    over the unique values of those design variables.
+
+    Concrete classes can also provide `_fused_parameters` and `_fused_value`
+    (see `darc_toolbox.fused`) to support the "numba" backend.
+    """
+
+    _dtype = np.dtype("float64")
+    _backend = "numpy"
+    _fused_value = None
+    _evaluator = None
+    _θ = None
+    _particle_caches = None
+    _particle_cache_hits = 0
+    _particle_cache_misses = 0
+    # a TrialRecorder, see darc_toolbox.instrumentation
+    recorder = None
+
+    @property
+    def θ(self):
+        """The particles, a DataFrame with one column per parameter. badapted
+        replaces them when it samples from the prior or updates beliefs."""
+        return self._θ
+
+    @θ.setter
+    def θ(self, θ):
+        self._θ = θ
+
+    @property
+    def dtype(self):
+        """The floating point precision this model computes in"""
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        self._dtype = as_float_dtype(dtype)
+
+    @property
+    def backend(self):
+        """How p(chose B) is evaluated, either "numpy" (the default) or "numba".
+        The "numba" backend falls back to NumPy if Numba is not installed, or if
+        this model has no fused kernel."""
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}, not {backend}")
+        if backend == "numba" and not fused.HAVE_NUMBA:
+            logging.warning("Numba is not installed, using the numpy backend")
+        self._backend = backend
+
+    @property
+    def n_workers(self):
+        """The number of worker processes the particles are split over when
+        evaluating p(chose B). 1 (the default) means no worker processes."""
+        return 1 if self._evaluator is None else self._evaluator.n_workers
+
+    @n_workers.setter
+    def n_workers(self, n_workers):
+        if self._evaluator is not None:
+            self._evaluator.close()
+            self._evaluator = None
+        if n_workers > 1:
+            self._evaluator = parallel.ShardedEvaluator(self, n_workers)
+
+    def __getstate__(self):
+        # worker processes get a copy of the model, but not the worker pool
+        state = self.__dict__.copy()
+        state.pop("_evaluator", None)
+        state.pop("_particle_caches", None)
+        state.pop("recorder", None)
+        # badapted stores the parameter names as a dict_keys view, which
+        # cannot be pickled
+        if "parameter_names" in state:
+            state["parameter_names"] = list(state["parameter_names"])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # the caches were not pickled, so start afresh
+        self._particle_caches = []
+
+    def _use_sharded(self, n_particles):
+        return self._evaluator is not None and self._evaluator.worthwhile(n_particles)
+
+    def _use_fused(self):
+        return (
+            self._backend == "numba"
+            and fused.HAVE_NUMBA
+            and self._fused_value is not None
+            and self.choiceFunction is CumulativeNormalChoiceFunc
+        )
+
+    @classmethod
+    def add_hook(cls, hook):
+        """Call hook(model, method, shapes, elapsed_ns) after each evaluation
+        of this model class (or any of its subclasses). See
+        `darc_toolbox.hooks`."""
+        hooks.add(cls, hook)
+
+    @classmethod
+    def remove_hook(cls, hook):
+        hooks.remove(cls, hook)
+
+    def predictive_y(self, θ, data):
+        if hooks.active:
+            return hooks.call(self, "predictive_y", self._predictive_y, θ, data)
+        return self._predictive_y(θ, data)
+
+    def _predictive_y(self, θ, data):
+        θ = self._particles(θ)
+        data = DesignMatrix.coerce(data, self.dtype)
+        if self._use_sharded(max(_n_particles(θ), len(data))):
+            return self._evaluator.predictive_y(θ, data)
+        if self._use_fused():
+            return fused.predictive_y(self, θ, data)
+        decision_variable = self._evaluate_decision_variable(θ, data)
+        return self._apply_choice_function(decision_variable, θ)
+
+    def predictive_y_grid(self, θ, designs):
+        """Return p(chose B) for every combination of design and particle, as an
+        array of shape (n_designs, n_particles)"""
+        if hooks.active:
+            return hooks.call(
+                self, "predictive_y_grid", self._predictive_y_grid, θ, designs
+            )
+        return self._predictive_y_grid(θ, designs)
+
+    def _predictive_y_grid(self, θ, designs):
+        if self._use_sharded(_n_particles(θ)):
+            θ = self._particles(θ)
+            designs = DesignMatrix.coerce(designs, self.dtype)
+            return self._evaluator.predictive_y_grid(θ, designs)
+        if self._use_fused():
+            θ = self._particles(θ)
+            designs = DesignMatrix.coerce(designs, self.dtype)
+            return fused.predictive_y_grid(self, θ, designs)
+        θ = self._particles(θ, as_rows=True)
+        data = DesignMatrix.coerce(designs, self.dtype).column_vectors()
+        decision_variable = self._evaluate_decision_variable(θ, data)
+        return self._apply_choice_function(decision_variable, θ)
+
+    def predictive_y_tiles(self, θ, designs, max_bytes=DEFAULT_TILE_BYTES):
+        """Evaluate the same grid as `predictive_y_grid`, but one tile at a
+        time, so that no more than about `max_bytes` is needed at once. Yields
+        (design_slice, particle_slice, p_chose_B) for each tile.
+
+        Tiles span all particles where possible, and only split the particles
+        when a single design would not fit in the budget."""
+        θ = self._particles(θ)
+        designs = DesignMatrix.coerce(designs, self.dtype)
+        n_designs, n_particles = len(designs), _n_particles(θ)
+        design_step, particle_step = _tile_shape(
+            n_designs, n_particles, self.dtype.itemsize, max_bytes
+        )
+        for design_start in range(0, n_designs, design_step):
+            design_slice = slice(design_start, design_start + design_step)
+            designs_tile = designs.take(design_slice)
+            for particle_start in range(0, n_particles, particle_step):
+                particle_slice = slice(particle_start, particle_start + particle_step)
+                θ_tile = {key: values[particle_slice] for key, values in θ.items()}
+                p_chose_B = self.predictive_y_grid(θ_tile, designs_tile)
+                yield design_slice, particle_slice, p_chose_B
+
+    def reduce_predictive_y(self, θ, designs, reducer, max_bytes=DEFAULT_TILE_BYTES):
+        """Evaluate p(chose B) for every design and particle in tiles (see
+        `predictive_y_tiles`), streaming each tile into `reducer`. Returns
+        `reducer.result()`."""
+        reducer.start(len(designs), _n_particles(θ))
+        tiles = self.predictive_y_tiles(θ, designs, max_bytes)
+        while True:
+            with self._phase("evaluate"):
+                tile = next(tiles, None)
+            if tile is None:
+                break
+            with self._phase("utility"):
+                reducer.update(*tile)
+        with self._phase("utility"):
+            return reducer.result()
+
+    def update_beliefs(self, data):
+        with self._phase("update"):
+            return super().update_beliefs(data)
+
+    def _phase(self, name):
+        """A context which records the time taken as phase `name` of the
+        current trial, if this model has a recorder"""
+        if self.recorder is None:
+            return NO_PHASE
+        return self.recorder.phase(name)
+
+    def _apply_choice_function(self, decision_variable, θ):
+        """Apply the choice function. The decision variable is a temporary, so
+        if it already has the shape of the output we let the choice function
+        overwrite it."""
+        if hooks.active:
+            return hooks.call(
+                self,
+                self.choiceFunction.__name__,
+                self._call_choice_function,
+                decision_variable,
+                θ,
+            )
+        return self._call_choice_function(decision_variable, θ)
+
+    def _call_choice_function(self, decision_variable, θ):
+        if self.choiceFunction in _IN_PLACE_CHOICE_FUNCTIONS:
+            shapes = [np.shape(values) for values in θ.values()]
+            shape = np.broadcast_shapes(np.shape(decision_variable), *shapes)
+            if is_temporary(decision_variable, shape, self.dtype):
+                return self.choiceFunction(
+                    decision_variable, θ, self.θ_fixed, out=decision_variable
+                )
+        return self.choiceFunction(decision_variable, θ, self.θ_fixed)
+
+    def _calc_decision_variable(self, θ, data):
+        return self._evaluate_decision_variable(
+            self._particles(θ), DesignMatrix.coerce(data, self.dtype)
+        )
+
+    def _evaluate_decision_variable(self, θ, data):
+        if hooks.active:
+            return hooks.call(
+                self, "_calc_decision_variable", self._decision_variable, θ, data
+            )
+        return self._decision_variable(θ, data)
+
+    def _particles(self, θ, as_rows=False):
+        """Return the particles θ as a dict of read only 1D arrays, or of row
+        vectors shaped (1, n_particles) for grid evaluation.
+
+        The arrays are cached (per dtype), along with parameters derived from
+        them (see `_derived`), for the last few sets of particles. The cache is
+        looked up by value rather than by identity, because badapted rarely
+        passes the same object twice: design optimisation evaluates a new
+        subset of a shuffled copy of `model.θ` at every step, for example.
+        Looking up by value also means particles modified in place just miss
+        the cache, rather than getting stale values from it."""
+        cache = self._particle_cache(_particle_arrays(θ, self.dtype))
+        return cache.rows if as_rows else cache.flat
+
+    def _particle_cache(self, particles):
+        if self._particle_caches is None:
+            self._particle_caches = []
+        caches = self._particle_caches
+        for cache in reversed(caches):
+            if cache.matches(particles):
+                self._particle_cache_hits += 1
+                # most recently used last
+                caches.remove(cache)
+                caches.append(cache)
+                return cache
+        self._particle_cache_misses += 1
+        caches.append(_ParticleCache(particles))
+        del caches[:-_MAX_PARTICLE_CACHES]
+        return caches[-1]
+
+    def _derived(self, θ, key, transform):
+        """Return transform(θ[key]), eg `self._derived(θ, "logk", np.exp)`,
+        where θ came from `_particles`. This is computed once, then cached
+        along with the particles. Cached arrays are read only, so that they are
+        never mistaken for temporaries (see `kernels.in_place`)."""
+        for cache in self._particle_caches or ():
+            if θ is cache.flat:
+                return cache.derived(key, transform)
+            if θ is cache.rows:
+                return cache.derived(key, transform)[np.newaxis, :]
+        return transform(θ[key])
+
+    def _decision_variable(self, θ, data):
+        """Calculate the decision variable. Concrete model classes implement
+        this. θ and data can be indexed by parameter or design variable names
+        and return numpy arrays. The result must be a new array (not θ or a
+        design variable), as the choice function may overwrite it."""
+        raise NotImplementedError
+
+    def log_likelihood(self, θ, data):
+        """
+        Calculate the log likelihood of the data for given θ particles.
+        Σ log(p(data|θ))
+        This gives the same result as `badapted.model.Model.log_likelihood`, but
+        evaluates all trials in one go rather than looping over trials.
+        """
+        responses = data.R.values[:, np.newaxis]
+        p_chose_B = self.predictive_y_grid(θ, data)
+        ll = bernoulli.logpmf(responses, p_chose_B)
+        # badapted's convention is (particles, trials), so we sum over trials
+        # in that layout to get exactly the same answer
+        return np.sum(np.ascontiguousarray(ll.T), axis=1)
+
+
+def _n_particles(θ):
+    return len(θ) if isinstance(θ, pd.DataFrame) else len(next(iter(θ.values())))
+
+
+def _tile_shape(n_designs, n_particles, itemsize, max_bytes):
+    """Return (designs per tile, particles per tile) for a memory budget"""
+    max_elements = max(1, max_bytes // (itemsize * _TEMPORARIES_PER_TILE))
+    n_particles = max(n_particles, 1)
+    if max_elements >= n_particles:
+        return max(1, min(n_designs, max_elements // n_particles)), n_particles
+    return 1, max_elements
+
+
+class _ParticleCache:
+    """A copy of some particles as read only arrays, in both the paired (flat)
+    and grid (rows) layouts, along with parameters derived from them"""
+
+    def __init__(self, particles):
+        self.flat = {
+            key: _read_only(values.copy()) for key, values in particles.items()
+        }
+        self.rows = {key: values[np.newaxis, :] for key, values in self.flat.items()}
+        self._derived = dict()
+
+    def matches(self, particles):
+        """Whether `particles` (a dict of 1D arrays) have the same values"""
+        if particles.keys() != self.flat.keys():
+            return False
+        for key, values in particles.items():
+            cached = self.flat[key]
+            if values.dtype != cached.dtype or values.shape != cached.shape:
+                return False
+            if values.size == 0 or _same_memory(values, cached):
+                continue
+            # check the first value before comparing them all
+            if values.flat[0] != cached.flat[0] or not np.array_equal(values, cached):
+                return False
+        return True
+
+    def derived(self, key, transform):
+        if (key, transform) not in self._derived:
+            self._derived[key, transform] = _read_only(transform(self.flat[key]))
+        return self._derived[key, transform]
+
+
+def _same_memory(a, b):
+    """Whether a and b are views of the same memory, in the same layout"""
+    return (
+        a.__array_interface__["data"][0] == b.__array_interface__["data"][0]
+        and a.strides == b.strides
+    )
+
+
+def _read_only(values):
+    values = values.view()
+    values.flags.writeable = False
+    return values
+
+
+def _particle_arrays(θ, dtype):
+    """Return the particles θ as a dict of 1D numpy arrays, one per parameter"""
+    if isinstance(θ, pd.DataFrame):
+        return {key: θ[key].to_numpy(dtype=dtype) for key in θ.columns}
+    else:
+        return {key: np.asarray(values, dtype=dtype) for key, values in θ.items()}
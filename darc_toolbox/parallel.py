@@ -0,0 +1,207 @@
+"""
+Evaluate a model over many particles with a persistent pool of worker
+processes.
+
+Setting `model.n_workers = 8` gives a model a `ShardedEvaluator`. Each call to
+`predictive_y` or `predictive_y_grid` then splits the particles into one shard
+per worker. Particles, designs and the output all live in shared memory, so
+the only thing sent to a worker for each call is a small description of its
+shard. The model itself is pickled and sent once, when the pool starts.
+
+Small problems are evaluated in the calling process, as it is not worth the
+round trip to the workers.
+
+Workers are started by a fresh server process ("forkserver") rather than forked
+from the calling process, which may be running threads (eg Numba's thread pool)
+that do not survive a fork. As with any multiprocessing code, scripts which
+use worker processes need an `if __name__ == "__main__":` guard.
+"""
+
+import math
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from darc_toolbox.design_matrix import DESIGN_VARIABLES, DesignMatrix
+
+# Don't shard unless each worker gets at least this many particles
+DEFAULT_MIN_SHARD_SIZE = 10_000
+
+
+class ShardedEvaluator:
+    """Evaluates a model's predictions in a pool of `n_workers` processes.
+    The model's current settings (dtype, backend, θ_fixed) are passed along
+    with every call, so workers always agree with the model."""
+
+    def __init__(self, model, n_workers, min_shard_size=DEFAULT_MIN_SHARD_SIZE):
+        if n_workers < 2:
+            raise ValueError("n_workers must be at least 2")
+        self.model = model
+        self.n_workers = int(n_workers)
+        self.min_shard_size = int(min_shard_size)
+        self._buffers = {
+            name: _SharedBuffer() for name in ("particles", "designs", "out")
+        }
+        self._executor = ProcessPoolExecutor(
+            self.n_workers,
+            mp_context=mp_context(),
+            initializer=_init_worker,
+            initargs=(model,),
+        )
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self._executor, list(self._buffers.values())
+        )
+
+    def close(self):
+        """Shut down the worker pool and free the shared memory"""
+        self._finalizer()
+
+    def worthwhile(self, n_particles):
+        return n_particles >= 2 * self.min_shard_size
+
+    def predictive_y(self, θ, designs):
+        """As `DARCModel.predictive_y`, with θ a dict of 1D arrays and designs
+        a `DesignMatrix`"""
+        n_particles, n_designs = _n_rows(θ), len(designs)
+        n = max(n_particles, n_designs)
+        out = self._buffers["out"].array((n,), designs.dtype)
+        self._run("paired", θ, designs, n)
+        return out.copy()
+
+    def predictive_y_grid(self, θ, designs):
+        """As `DARCModel.predictive_y_grid`, with θ a dict of 1D arrays and
+        designs a `DesignMatrix`"""
+        n_particles = _n_rows(θ)
+        out = self._buffers["out"].array((len(designs), n_particles), designs.dtype)
+        self._run("grid", θ, designs, n_particles)
+        return out.copy()
+
+    def _run(self, layout, θ, designs, n):
+        """Copy particles and designs into shared memory, then have each worker
+        evaluate one shard of [0, n)"""
+        dtype = designs.dtype
+        keys = list(θ.keys())
+        particles = self._buffers["particles"].array((len(keys), _n_rows(θ)), dtype)
+        for row, key in enumerate(keys):
+            particles[row] = θ[key]
+        design_array = self._buffers["designs"].array(
+            (len(DESIGN_VARIABLES), len(designs)), dtype
+        )
+        for row, name in enumerate(DESIGN_VARIABLES):
+            design_array[row] = designs[name]
+
+        shared = {
+            name: (buffer.name, buffer.shape, dtype.str)
+            for name, buffer in self._buffers.items()
+        }
+        settings = {
+            "dtype": self.model.dtype,
+            "backend": self.model.backend,
+            "θ_fixed": self.model.θ_fixed,
+        }
+        bounds = np.linspace(0, n, self.n_workers + 1).astype(int)
+        tasks = [
+            (layout, shared, keys, settings, start, stop)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+            if stop > start
+        ]
+        # list() so that any exception in a worker is raised here
+        list(self._executor.map(_evaluate_shard, tasks))
+
+
+def _n_rows(θ):
+    return len(next(iter(θ.values())))
+
+
+def mp_context():
+    """The multiprocessing context for worker pools: forkserver where it is
+    available, otherwise spawn (see above)"""
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def _shutdown(executor, buffers):
+    executor.shutdown(wait=True)
+    for buffer in buffers:
+        buffer.close()
+
+
+class _SharedBuffer:
+    """A block of shared memory which is replaced by a bigger one whenever an
+    array does not fit"""
+
+    def __init__(self):
+        self._shm = None
+        self.shape = None
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def array(self, shape, dtype):
+        nbytes = max(1, math.prod(shape) * np.dtype(dtype).itemsize)
+        if self._shm is None or self._shm.size < nbytes:
+            self.close()
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.shape = shape
+        return np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+# WORKER PROCESSES ============================================================
+
+_worker_model = None
+_worker_shm = dict()
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _attach(name, shape, dtype):
+    """Return a view of the named shared memory block, attaching to it the
+    first time we see it. A new name for the same role means the parent has
+    replaced the block, so we detach from the old one."""
+    if name not in _worker_shm:
+        # workers share the parent's resource tracker, so attaching here does
+        # not change who is responsible for unlinking the block
+        _worker_shm[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=_worker_shm[name].buf)
+
+
+def _evaluate_shard(task):
+    layout, shared, keys, settings, start, stop = task
+    for name in list(_worker_shm):
+        if name not in {name for name, _, _ in shared.values()}:
+            _worker_shm.pop(name).close()
+    particles = _attach(*shared["particles"])
+    design_array = _attach(*shared["designs"])
+    out = _attach(*shared["out"])
+
+    model = _worker_model
+    model.dtype = settings["dtype"]
+    model.backend = settings["backend"]
+    model.θ_fixed = settings["θ_fixed"]
+
+    designs = DesignMatrix(*design_array, dtype=settings["dtype"])
+    shard = slice(start, stop)
+    if layout == "grid":
+        θ = {key: particles[row, shard] for row, key in enumerate(keys)}
+        out[:, shard] = model.predictive_y_grid(θ, designs)
+    else:
+        # either particles or designs may be a single row, used for every pair
+        if particles.shape[1] > 1:
+            θ = {key: particles[row, shard] for row, key in enumerate(keys)}
+        else:
+            θ = {key: particles[row] for row, key in enumerate(keys)}
+        if len(designs) > 1:
+            designs = designs.take(shard)
+        out[shard] = model.predictive_y(θ, designs)
@@ -0,0 +1,65 @@
+"""
+Prior-predictive pruning of uninformative designs.
+
+Many designs in a design space tell us nothing about a participant, whatever
+their parameters. For example, with RA=95 vs RB=100 at a delay of 25 years,
+almost every particle sampled from the prior predicts that the participant
+chooses A, so observing their choice barely changes our beliefs. Design
+optimisation will never pick designs like this, but it still evaluates them on
+every trial.
+
+We measure how informative each design could be by the mutual information
+between the response and the parameters under the prior, I(y; θ | design).
+This is the same utility design optimisation maximises, and it is close to 0
+exactly when (nearly) all particles make the same prediction. `prune_designs`
+drops the designs where it is below a tolerance (in nats), once, before the
+experiment starts. Alternatively `prior_information` returns it for every
+design, eg to use as weights.
+
+Updating our beliefs only reweights the prior particles, so a design on which
+all of them agree stays uninformative. A few particles might disagree though,
+and those could come to dominate the posterior. So keep the tolerance small
+(the default drops designs which could tell us less than 10^-4 nats).
+"""
+
+import logging
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from darc_toolbox.model import DEFAULT_TILE_BYTES
+from darc_toolbox.reducers import MutualInformation
+
+DEFAULT_TOLERANCE = 1e-4
+
+PruningReport = namedtuple("PruningReport", ["n_designs", "n_dropped", "tolerance"])
+
+
+def prior_information(model, designs, θ=None, max_bytes=DEFAULT_TILE_BYTES):
+    """Return the mutual information (in nats) between the response and the
+    parameters for each design, given particles θ. These default to the
+    model's particles, which are samples from the prior until the model's
+    beliefs are updated. We evaluate the designs in tiles of about
+    `max_bytes` (see `DARCModel.reduce_predictive_y`)."""
+    θ = model.θ if θ is None else θ
+    return model.reduce_predictive_y(θ, designs, MutualInformation(), max_bytes)
+
+
+def prune_designs(
+    model, designs, tolerance=DEFAULT_TOLERANCE, θ=None, max_bytes=DEFAULT_TILE_BYTES
+):
+    """Drop the designs which could tell us less than `tolerance` nats about
+    the parameters of `model`, according to `prior_information`.
+
+    `designs` can be a DataFrame (the index of the designs we keep is
+    unchanged) or a `DesignMatrix`. Returns the designs we keep, in the same
+    form, and a `PruningReport` of how many were dropped."""
+    information = prior_information(model, designs, θ, max_bytes)
+    keep = information >= tolerance
+    report = PruningReport(len(designs), int(np.count_nonzero(~keep)), tolerance)
+    logging.info(
+        f"Pruned {report.n_dropped} of {report.n_designs} designs which could "
+        f"tell us less than {tolerance} nats about the parameters"
+    )
+    if isinstance(designs, pd.DataFrame):
+        return designs[keep], report
+    return designs.take(np.flatnonzero(keep)), report
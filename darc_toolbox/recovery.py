@@ -0,0 +1,410 @@
+"""
+Parameter recovery studies: simulate an experiment for each of many sets of
+true parameters, and record how well each is recovered, trial by trial.
+
+A `RecoveryStudy` runs one simulated participant per row of `θ_true`. Each
+gets a fresh model and design generator, and on every trial we record the
+design, the simulated response, and the posterior mean and standard deviation
+of each parameter. Participants run on a pool of worker processes.
+
+Results go to a directory, which doubles as a checkpoint:
+
+- study.json describes the study, so a rerun can check it is resuming the
+  same one.
+- One file per participant holds their trials. It is written when the
+  participant finishes (to a temporary name, then renamed), so an interrupted
+  run leaves only complete files. Rerunning the study skips those
+  participants, and reruns any participant who was part way through from
+  their first trial. So a study resumes per participant, not per trial.
+
+The files are Parquet when pyarrow is installed, and otherwise NumPy .npz
+archives. Both hold one array per column. Use `read_results` to load them all
+as one DataFrame.
+
+Each participant draws random numbers from their own stream, derived from the
+study's seed and their row number. So results don't depend on the number of
+workers, on which worker runs which participant, or on whether the run was
+resumed.
+
+Run from the command line with eg:
+    python -m darc_toolbox.recovery delayed.Hyperbolic Kirby2009 results/ \\
+        --participants 1000 --trials 30 --workers 8
+
+As with any multiprocessing code, scripts which run a study with several
+workers need an `if __name__ == "__main__":` guard.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from darc_toolbox import Design
+from darc_toolbox.designs import BayesianAdaptiveDesignGenerator, DesignSpaceBuilder
+from darc_toolbox.parallel import mp_context
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover - depends on the environment
+    pyarrow = None
+
+HAVE_PYARROW = pyarrow is not None
+
+BAYESIAN = "bayesian"
+# the heuristic design generators, found in the designs module of a model's kind
+HEURISTIC_GENERATORS = {
+    "delayed": [
+        "Kirby2009",
+        "Frye",
+        "Koffarnus_Bickel",
+        "DuGreenMyerson2002",
+        "Griskevicius2011",
+    ],
+    "risky": ["DuGreenMyerson2002", "Griskevicius2011"],
+    "delayed_and_risky": [],
+}
+MANIFEST = "study.json"
+DEFAULT_N_PARTICLES = 2000
+
+
+def model_kind(model_class):
+    """The kind of model (delayed, risky or delayed_and_risky), from its
+    module"""
+    return model_class.__module__.split(".")[-2]
+
+
+def find_model(name):
+    """The model class for eg "delayed.Hyperbolic" """
+    kind, _, class_name = name.rpartition(".")
+    module = importlib.import_module(f"darc_toolbox.{kind}.models")
+    return getattr(module, class_name)
+
+
+def design_generator(name, model_class, n_trials, design_space=None):
+    """A callable which returns a new design generator, for one participant.
+    `name` is "bayesian", for Bayesian adaptive design over `design_space`
+    (by default the preset of the model's kind), or the name of a heuristic
+    design generator for the model's kind, eg "Kirby2009"."""
+    kind = model_kind(model_class)
+    if name == BAYESIAN:
+        if design_space is None:
+            design_space = getattr(DesignSpaceBuilder, kind)().build()
+        return _Factory(
+            BayesianAdaptiveDesignGenerator,
+            design_space=design_space,
+            max_trials=n_trials,
+        )
+    if name not in HEURISTIC_GENERATORS[kind]:
+        available = [BAYESIAN] + HEURISTIC_GENERATORS[kind]
+        raise ValueError(
+            f"no design generator {name!r} for {kind} models, use one of {available}"
+        )
+    module = importlib.import_module(f"darc_toolbox.{kind}.designs")
+    return _Factory(getattr(module, name))
+
+
+def draw_true_parameters(model_class, n_participants, seed=None):
+    """Draw true parameters for `n_participants` from the model's prior, as a
+    DataFrame with one row per participant"""
+    prior = model_class(n_particles=1).prior
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            name: distribution.rvs(size=n_participants, random_state=rng)
+            for name, distribution in prior.items()
+        }
+    )
+
+
+class RecoveryStudy:
+    """
+    A parameter recovery study of `model_class`, with one simulated
+    participant for each row of `θ_true` (a DataFrame with one column per
+    parameter). `make_generator` returns a new design generator for each
+    participant (see `design_generator`), which runs for up to `n_trials`
+    trials. Results are saved in `directory`.
+
+    `n_particles` (unless given in `model_kwargs`) and `model_kwargs` are
+    passed to the model. Everything is
+    pickled and sent to the worker processes, so `make_generator` must be
+    picklable (a class, or the result of `design_generator`).
+    """
+
+    def __init__(
+        self,
+        model_class,
+        make_generator,
+        θ_true,
+        n_trials,
+        directory,
+        n_particles=DEFAULT_N_PARTICLES,
+        seed=0,
+        model_kwargs=None,
+        file_format=None,
+    ):
+        self.model_class = model_class
+        self.make_generator = make_generator
+        self.θ_true = pd.DataFrame(θ_true).reset_index(drop=True)
+        self.n_trials = int(n_trials)
+        self.directory = Path(directory)
+        self.seed = int(seed)
+        self.model_kwargs = dict(model_kwargs or {})
+        self.model_kwargs.setdefault("n_particles", int(n_particles))
+        if file_format is None:
+            file_format = "parquet" if HAVE_PYARROW else "npz"
+        if file_format not in ("parquet", "npz"):
+            raise ValueError('file_format must be "parquet" or "npz"')
+        if file_format == "parquet" and not HAVE_PYARROW:
+            raise ImportError("Parquet files need pyarrow")
+        self.file_format = file_format
+
+    @property
+    def n_participants(self):
+        return len(self.θ_true)
+
+    def manifest(self):
+        """A description of the study, which a resumed run must match"""
+        return {
+            "model": f"{self.model_class.__module__}.{self.model_class.__name__}",
+            "generator": _describe(self.make_generator),
+            "n_trials": self.n_trials,
+            "seed": self.seed,
+            "model_kwargs": self.model_kwargs,
+            "file_format": self.file_format,
+            "θ_true": self.θ_true.to_dict(orient="list"),
+        }
+
+    def path(self, participant):
+        return self.directory / f"participant-{participant:06d}.{self.file_format}"
+
+    def completed(self):
+        """The participants whose results are already saved"""
+        return [p for p in range(self.n_participants) if self.path(p).exists()]
+
+    def run(self, n_workers=1):
+        """Run every participant whose results are not already saved, with
+        `n_workers` processes (or in this process, for 1 worker). Returns the
+        number of participants run."""
+        self._prepare_directory()
+        done = set(self.completed())
+        remaining = [p for p in range(self.n_participants) if p not in done]
+        if done:
+            logging.info(f"resuming: {len(done)} participants already done")
+        tasks = [self._task(p) for p in remaining]
+        if n_workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                _run_participant(task)
+                logging.info(f"participant {task['participant']} complete")
+            return len(tasks)
+
+        with ProcessPoolExecutor(n_workers, mp_context=mp_context()) as executor:
+            futures = [executor.submit(_run_participant, task) for task in tasks]
+            for n_done, future in enumerate(as_completed(futures), start=1):
+                # raises any exception from the worker
+                participant = future.result()
+                logging.info(
+                    f"participant {participant} complete "
+                    f"({n_done} of {len(tasks)} in this run)"
+                )
+        return len(tasks)
+
+    def results(self):
+        """Every saved trial, as one DataFrame"""
+        return read_results(self.directory)
+
+    def _prepare_directory(self):
+        manifest = self.manifest()
+        path = self.directory / MANIFEST
+        if path.exists():
+            saved = json.loads(path.read_text())
+            if saved != json.loads(json.dumps(manifest)):
+                raise ValueError(
+                    f"{self.directory} holds the results of a different study"
+                )
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _replace(path, lambda f: f.write(json.dumps(manifest).encode()))
+
+    def _task(self, participant):
+        return {
+            "participant": participant,
+            "model_class": self.model_class,
+            "model_kwargs": self.model_kwargs,
+            "make_generator": self.make_generator,
+            "θ_true": self.θ_true.iloc[[participant]].reset_index(drop=True),
+            "n_trials": self.n_trials,
+            "seed": np.random.SeedSequence(self.seed, spawn_key=(participant,)),
+            "path": self.path(participant),
+            "file_format": self.file_format,
+        }
+
+
+def read_results(directory):
+    """Load the saved trials of a study, as one DataFrame sorted by
+    participant and trial"""
+    directory = Path(directory)
+    parts = []
+    for path in sorted(directory.glob("participant-*.parquet")):
+        parts.append(pd.read_parquet(path))
+    for path in sorted(directory.glob("participant-*.npz")):
+        with np.load(path, allow_pickle=False) as columns:
+            parts.append(pd.DataFrame({name: columns[name] for name in columns.files}))
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat(parts, ignore_index=True)
+    return df.sort_values(["participant", "trial"], ignore_index=True)
+
+
+def simulate_participant(model, generator, n_trials):
+    """Run a simulated experiment with `model` (whose θ_true is set), returning
+    a dict of columns with one entry per trial"""
+    names = model.parameter_names
+    columns = {name: [] for name in ["trial"] + list(Design._fields) + ["R"]}
+    for name in names:
+        columns[f"{name}_mean"] = []
+        columns[f"{name}_sd"] = []
+
+    for trial in range(n_trials):
+        design = generator.get_next_design(model)
+        if design is None:
+            break
+        response = model.simulate_y(pd.DataFrame([design], columns=Design._fields))
+        generator.enter_trial_design_and_response(design, response)
+        model.update_beliefs(generator.data)
+
+        columns["trial"].append(trial)
+        for name in Design._fields:
+            columns[name].append(getattr(design, name))
+        columns["R"].append(int(response))
+        for name in names:
+            columns[f"{name}_mean"].append(model.θ[name].mean())
+            columns[f"{name}_sd"].append(model.θ[name].std())
+    return columns
+
+
+def _run_participant(task):
+    # badapted and scipy draw from the global random number generators
+    seed = task["seed"].generate_state(2)
+    np.random.seed(seed[0])
+    random.seed(int(seed[1]))
+
+    model = task["model_class"](**task["model_kwargs"])
+    model.θ_true = task["θ_true"]
+    generator = task["make_generator"]()
+    columns = simulate_participant(model, generator, task["n_trials"])
+
+    n = len(columns["trial"])
+    df = pd.DataFrame(
+        {"participant": np.full(n, task["participant"]), **columns},
+    )
+    for name, value in task["θ_true"].iloc[0].items():
+        df[f"{name}_true"] = value
+    df = df.astype({name: "float64" for name in Design._fields})
+    if task["file_format"] == "parquet":
+        _replace(task["path"], lambda f: df.to_parquet(f, index=False))
+    else:
+        _replace(
+            task["path"],
+            lambda f: np.savez(f, **{name: df[name].to_numpy() for name in df}),
+        )
+    return task["participant"]
+
+
+def _replace(path, write):
+    """Write a file by calling write(file) on a temporary file, which is then
+    renamed, so that `path` is only ever complete or missing"""
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "wb") as f:
+        write(f)
+    os.replace(temporary, path)
+
+
+class _Factory:
+    """A picklable callable which makes a design generator"""
+
+    def __init__(self, generator_class, **kwargs):
+        self.generator_class = generator_class
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.generator_class(**self.kwargs)
+
+    def __repr__(self):
+        return self.generator_class.__name__
+
+
+def _describe(make_generator):
+    if isinstance(make_generator, _Factory):
+        description = {"class": repr(make_generator)}
+        if "design_space" in make_generator.kwargs:
+            space = make_generator.kwargs["design_space"]
+            description["n_designs"] = len(space)
+            description["max_trials"] = make_generator.kwargs["max_trials"]
+        return description
+    return {"class": getattr(make_generator, "__name__", repr(make_generator))}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run a parameter recovery study, resuming it if interrupted"
+    )
+    parser.add_argument("model", help='a model class, eg "delayed.Hyperbolic"')
+    parser.add_argument(
+        "generator", help='"bayesian", or a design generator eg "Kirby2009"'
+    )
+    parser.add_argument("directory", help="where to save (and resume) the results")
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument(
+        "--participants",
+        type=int,
+        help="draw this many true parameters from the prior",
+    )
+    parser.add_argument(
+        "--true-parameters",
+        help="a CSV file of true parameters, one row per participant",
+    )
+    parser.add_argument(
+        "--particles",
+        type=int,
+        default=DEFAULT_N_PARTICLES,
+        help=f"particles per model (default: {DEFAULT_N_PARTICLES})",
+    )
+    parser.add_argument(
+        "--preset",
+        help="DesignSpaceBuilder preset for bayesian (default: the model's kind)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    model_class = find_model(args.model)
+    if args.true_parameters:
+        θ_true = pd.read_csv(args.true_parameters)
+    elif args.participants:
+        θ_true = draw_true_parameters(model_class, args.participants, args.seed)
+    else:
+        parser.error("give either --participants or --true-parameters")
+    design_space = None
+    if args.preset:
+        design_space = getattr(DesignSpaceBuilder, args.preset)().build()
+    study = RecoveryStudy(
+        model_class,
+        design_generator(args.generator, model_class, args.trials, design_space),
+        θ_true,
+        args.trials,
+        args.directory,
+        n_particles=args.particles,
+        seed=args.seed,
+    )
+    n_run = study.run(args.workers)
+    print(f"{n_run} participants run, results in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Streaming reducers for tiled model evaluation.
+
+`DARCModel.reduce_predictive_y` evaluates p(chose B) for every design and
+particle one tile at a time, so the full (n_designs, n_particles) matrix never
+has to exist. Each tile is handed to a reducer, which keeps only what it needs
+to produce its result (usually one number per design, or per particle).
+
+A reducer implements:
+- `start(n_designs, n_particles)`, called once before the first tile.
+- `update(design_slice, particle_slice, p_chose_B)`, called for each tile,
+  where p_chose_B has shape (design_slice size, particle_slice size).
+- `result()`, called once after the last tile.
+"""
+
+import numpy as np
+from scipy.stats import bernoulli
+
+
+class Reducer:
+    """Base class for streaming reducers"""
+
+    def start(self, n_designs, n_particles):
+        self.n_designs = n_designs
+        self.n_particles = n_particles
+
+    def update(self, design_slice, particle_slice, p_chose_B):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class Materialise(Reducer):
+    """Assemble the full (n_designs, n_particles) matrix. Only useful when it
+    fits in memory, eg for testing."""
+
+    def start(self, n_designs, n_particles):
+        super().start(n_designs, n_particles)
+        self.p_chose_B = None
+
+    def update(self, design_slice, particle_slice, p_chose_B):
+        if self.p_chose_B is None:
+            shape = (self.n_designs, self.n_particles)
+            self.p_chose_B = np.empty(shape, dtype=p_chose_B.dtype)
+        self.p_chose_B[design_slice, particle_slice] = p_chose_B
+
+    def result(self):
+        return self.p_chose_B
+
+
+class MeanOverParticles(Reducer):
+    """The marginal p(chose B | design), averaged over particles"""
+
+    def start(self, n_designs, n_particles):
+        super().start(n_designs, n_particles)
+        self.total = np.zeros(n_designs)
+
+    def update(self, design_slice, particle_slice, p_chose_B):
+        self.total[design_slice] += np.sum(p_chose_B, axis=1, dtype="float64")
+
+    def result(self):
+        return self.total / self.n_particles
+
+
+class MutualInformation(Reducer):
+    """Mutual information between the response and the parameters, for each
+    design. This is the utility which badapted's design optimisation
+    estimates by sampling. We use
+        I(y; θ | design) = H(p̄) - mean over particles of H(p)
+    where H is the binary entropy and p̄ is p(chose B) averaged over particles.
+    Both terms are running sums, so one pass over the tiles is enough."""
+
+    def start(self, n_designs, n_particles):
+        super().start(n_designs, n_particles)
+        self.total_p = np.zeros(n_designs)
+        self.total_entropy = np.zeros(n_designs)
+
+    def update(self, design_slice, particle_slice, p_chose_B):
+        self.total_p[design_slice] += np.sum(p_chose_B, axis=1, dtype="float64")
+        self.total_entropy[design_slice] += np.sum(
+            _binary_entropy(p_chose_B), axis=1, dtype="float64"
+        )
+
+    def result(self):
+        p_mean = self.total_p / self.n_particles
+        mutual_information = (
+            _binary_entropy(p_mean) - self.total_entropy / self.n_particles
+        )
+        # negative values are just rounding error
+        return np.maximum(mutual_information, 0.0)
+
+
+class LogLikelihood(Reducer):
+    """Σ log(p(response|θ)) over designs (trials) for each particle, as in
+    `DARCModel.log_likelihood`. Responses are 1 (chose B) or 0 (chose A), one
+    per design."""
+
+    def __init__(self, responses):
+        self.responses = np.asarray(responses)
+
+    def start(self, n_designs, n_particles):
+        super().start(n_designs, n_particles)
+        if self.responses.size != n_designs:
+            raise ValueError("Need one response per design")
+        self.total = np.zeros(n_particles)
+
+    def update(self, design_slice, particle_slice, p_chose_B):
+        responses = self.responses[design_slice, np.newaxis]
+        ll = bernoulli.logpmf(responses, p_chose_B)
+        self.total[particle_slice] += np.sum(ll, axis=0, dtype="float64")
+
+    def result(self):
+        return self.total
+
+
+def _binary_entropy(p):
+    """Entropy (in nats) of a Bernoulli(p) variable, with 0 log 0 = 0"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -(p * np.log(p) + (1 - p) * np.log1p(-p))
+    return np.where((p == 0) | (p == 1), 0.0, h)
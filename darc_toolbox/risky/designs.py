@@ -5,12 +5,12 @@ approaches in the literature.
 """
 
 import logging
-from badapted.designs import DesignGeneratorABC
 from darc_toolbox import Design
+from darc_toolbox.designs import DARCDesignGenerator
 import pandas as pd
 
 
-class Griskevicius2011(DesignGeneratorABC):
+class Griskevicius2011(DARCDesignGenerator):
     """
     A class to provide designs from the Griskevicius et al (2011) risky
     choice task.
@@ -41,7 +41,7 @@ class Griskevicius2011(DesignGeneratorABC):
                 DA=self._DA,
                 RA=self._RA[self.trial],
                 PA=self._PA,
-                DB=self._DB[self._delay_counter],
+                DB=self._DB,
                 RB=self._RB,
                 PB=self._PB,
             )
@@ -50,7 +50,7 @@ class Griskevicius2011(DesignGeneratorABC):
             return None
 
 
-class DuGreenMyerson2002(DesignGeneratorABC):
+class DuGreenMyerson2002(DARCDesignGenerator):
     """
     A class to provide designs based on the Du et al (2002) protocol.
 
@@ -1,22 +1,13 @@
 from scipy.stats import norm, halfnorm, beta, truncnorm
 import numpy as np
-from badapted.model import Model
-from badapted.choice_functions import CumulativeNormalChoiceFunc
+from darc_toolbox.model import DARCModel
+from darc_toolbox.choice_functions import CumulativeNormalChoiceFunc
+from darc_toolbox import fused, kernels
+from darc_toolbox.kernels import in_place
+from darc_toolbox.kernels import prob_to_odds_against, odds_against_to_probs
 
 
-# TODO: THESE UTILITY FUNCTIONS ARE IN MULTIPLE PLACES !!!
-def prob_to_odds_against(probabilities):
-    """convert probabilities of getting reward to odds against getting it"""
-    odds_against = (1 - probabilities) / probabilities
-    return odds_against
-
-
-def odds_against_to_probs(odds):
-    probabilities = 1 / (1 + odds)
-    return probabilities
-
-
-class Hyperbolic(Model):
+class Hyperbolic(DARCModel):
     """Hyperbolic risk discounting model
     The idea is that we hyperbolically discount ODDS AGAINST the reward.
     """
@@ -31,30 +22,34 @@ class Hyperbolic(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._odds_discount_func(
-            data["PA"].values, θ["logh"].values
+    def _decision_variable(self, θ, data):
+        h = self._derived(θ, "logh", np.exp)
+        VA = in_place(
+            np.multiply,
+            data.map_unique("PA", self._odds_discount_func, h),
+            data["RA"],
         )
-        VB = data["RB"].values * self._odds_discount_func(
-            data["PB"].values, θ["logh"].values
+        VB = in_place(
+            np.multiply,
+            data.map_unique("PB", self._odds_discount_func, h),
+            data["RB"],
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    def _odds_discount_func(probabilities, logh):
-        # transform logh to h
-        h = np.exp(logh)
-        # convert probability to odds against
-        odds_against = prob_to_odds_against(probabilities)
-        return 1 / (1 + h * odds_against)
+    def _odds_discount_func(probabilities, h):
+        return kernels.hyperbolic_odds(probabilities, h)
 
+    def _fused_parameters(self, θ):
+        return (self._derived(θ, "logh", np.exp),)
 
-class PrelecOneParameter(Model):
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.hyperbolic_odds(prob, params[0, j])
+
+
+class PrelecOneParameter(DARCModel):
     """Prelec (1998) one parameter probability bias model
     Prelec, D. (1998). The probability weighting function. Econometrica, 66,
     497–527.
@@ -68,22 +63,25 @@ class PrelecOneParameter(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._w(data["PA"].values, θ["γ"].values)
-        VB = data["RB"].values * self._w(data["PB"].values, θ["γ"].values)
-        return VB - VA
+    def _decision_variable(self, θ, data):
+        VA = in_place(np.multiply, data.map_unique("PA", self._w, θ["γ"]), data["RA"])
+        VB = in_place(np.multiply, data.map_unique("PB", self._w, θ["γ"]), data["RB"])
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
     def _w(p, γ):
-        return np.exp(-(-np.log(p)) ** γ)
+        return kernels.prelec(p, γ)
 
+    def _fused_parameters(self, θ):
+        return (θ["γ"],)
+
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.prelec(prob, params[0, j])
 
-class LinearInLogOdds(Model):
+
+class LinearInLogOdds(DARCModel):
     """Prelec (1998) one parameter probability bias model.
     Gonzalez, R., & Wu, G. (1999). On the shape of the probability weighting
     function. Cognitive Psychology, 38(1), 129–166.
@@ -107,30 +105,29 @@ class LinearInLogOdds(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
-        VA = data["RA"].values * self._w(
-            data["PA"].values, θ["δ"].values, θ["γ"].values
+    def _decision_variable(self, θ, data):
+        VA = in_place(
+            np.multiply, data.map_unique("PA", self._w, θ["δ"], θ["γ"]), data["RA"]
         )
-        VB = data["RB"].values * self._w(
-            data["PB"].values, θ["δ"].values, θ["γ"].values
+        VB = in_place(
+            np.multiply, data.map_unique("PB", self._w, θ["δ"], θ["γ"]), data["RB"]
         )
-        return VB - VA
+        return in_place(np.subtract, VB, VA)
 
     @staticmethod
-    @np.vectorize
     def _w(p, δ, γ):
-        if p == 0.0 or p == 1.0:
-            return p
-        else:
-            return (δ * p ** γ) / ((δ * p ** γ) + (1 - p) ** γ)
+        return kernels.linear_in_log_odds(p, δ, γ)
+
+    def _fused_parameters(self, θ):
+        return (θ["δ"], θ["γ"])
+
+    @staticmethod
+    @fused.jit
+    def _fused_value(reward, delay, prob, params, j):
+        return reward * fused.linear_in_log_odds(prob, params[0, j], params[1, j])
 
 
-class ProportionalDifference(Model):
+class ProportionalDifference(DARCModel):
     """Proportional difference model for risky rewards
 
     González-Vallejo, C. (2002). Making trade-offs: A probabilistic and
@@ -148,35 +145,20 @@ class ProportionalDifference(Model):
         self.θ_fixed = {"ϵ": 0.01}
         self.choiceFunction = CumulativeNormalChoiceFunc
 
-    def predictive_y(self, θ, data):
-        decision_variable = self._calc_decision_variable(θ, data)
-        p_chose_B = self.choiceFunction(decision_variable, θ, self.θ_fixed)
-        return p_chose_B
-
-    def _calc_decision_variable(self, θ, data):
+    def _decision_variable(self, θ, data):
         # organised so that higher values of the decision variable will
         # mean higher probabability for the delayed option (prospect B)
 
-        prop_reward = self._proportion(data["RA"].values, data["RB"].values)
-
-        prop_risk = self._proportion(data["PA"].values, data["PB"].values)
-
-        prop_difference = prop_reward - prop_risk
-        decision_variable = prop_difference + θ["δ"].values
-        return decision_variable
-
-    @staticmethod
-    def _max_abs(x, y):
-        return np.max(
-            np.array([np.absolute(x), np.absolute(y)]).astype("float"), axis=0
-        ).T
+        prop_reward = data.map_unique(["RA", "RB"], self._proportion)
+        prop_risk = data.map_unique(["PA", "PB"], self._proportion)
+        prop_difference = in_place(np.subtract, prop_reward, prop_risk)
+        return in_place(np.add, prop_difference, θ["δ"])
 
     @staticmethod
-    def _min_abs(x, y):
-        return np.min(
-            np.array([np.absolute(x), np.absolute(y)]).astype("float"), axis=0
-        ).T
-
-    def _proportion(self, x, y):
-        diff = self._max_abs(x, y) - self._min_abs(x, y)
-        return diff / self._max_abs(x, y)
+    def _proportion(x, y):
+        """(max(|x|, |y|) - min(|x|, |y|)) / max(|x|, |y|), where the
+        difference is computed as ||x| - |y||, which is exactly equal"""
+        abs_x, abs_y = np.absolute(x), np.absolute(y)
+        max_abs = np.maximum(abs_x, abs_y)
+        diff = in_place(np.absolute, in_place(np.subtract, abs_x, abs_y))
+        return in_place(np.divide, diff, max_abs)
@@ -12,6 +12,7 @@ exactly what you want to run.
 import logging
 import numpy as np
 import darc_toolbox
+from darc_toolbox.design_cache import default_cache_dir
 
 
 # define what is available
@@ -144,12 +145,14 @@ def act_on_choices(desired_experiment_type, desired_model, expInfo):
         if (desired_model is "HyperbolicMagnitudeEffect") or (
             desired_model is "ExponentialMagnitudeEffect"
         ):
-            D = DesignSpaceBuilder.delay_magnitude_effect().build()
+            D = DesignSpaceBuilder.delay_magnitude_effect().build(
+                cache_dir=default_cache_dir()
+            )
             design_thing = BayesianAdaptiveDesignGenerator(
                 D, max_trials=expInfo["trials"]
             )
         else:
-            D = DesignSpaceBuilder.delayed().build()
+            D = DesignSpaceBuilder.delayed().build(cache_dir=default_cache_dir())
             design_thing = BayesianAdaptiveDesignGenerator(
                 D, max_trials=expInfo["trials"]
             )
@@ -200,7 +203,7 @@ def act_on_choices(desired_experiment_type, desired_model, expInfo):
         )
 
         # create an appropriate design object
-        D = DesignSpaceBuilder.risky().build()
+        D = DesignSpaceBuilder.risky().build(cache_dir=default_cache_dir())
         design_thing = BayesianAdaptiveDesignGenerator(
             D, max_trials=expInfo["trials"]
         )
@@ -211,7 +214,9 @@ def act_on_choices(desired_experiment_type, desired_model, expInfo):
         from darc_toolbox.designs import BayesianAdaptiveDesignGenerator
 
         # create an appropriate design object
-        D = DesignSpaceBuilder.delayed_and_risky().build()
+        D = DesignSpaceBuilder.delayed_and_risky().build(
+            cache_dir=default_cache_dir()
+        )
         design_thing = BayesianAdaptiveDesignGenerator(
             D, max_trials=expInfo["trials"]
         )
@@ -22,6 +22,13 @@ setuptools.setup(
     ],
     packages=setuptools.find_packages(),
     install_requires=["badapted=0.0.3", "matplotlib", "numpy", "pandas", "scipy"],
+    extras_require={
+        "numba": ["numba"],
+        "parquet": ["pyarrow"],
+        # numba so that the fused kernels are tested, rather than skipped
+        "test": ["pytest", "numba"],
+    },
+    entry_points={"console_scripts": ["darc-recovery = darc_toolbox.recovery:main"]},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,93 @@
+"""
+Regression tests on how much memory evaluating each model allocates.
+
+We measure the peak memory allocated during one call (with tracemalloc, which
+numpy reports its array allocations to), in units of the size of the output.
+The output itself counts as 1. The counts below are what each model needs
+once intermediate results are combined in place (see `kernels.in_place`), so
+a new temporary array in a hot path will fail these tests.
+"""
+
+import tracemalloc
+import numpy as np
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+
+# model: (full size arrays for grid evaluation, for paired evaluation)
+# In paired evaluation every design variable and parameter array is full size,
+# so eg ITCH needs one for each of its four design terms.
+allocations = {
+    delayed_models.DelaySlice: (1, 2),
+    delayed_models.Hyperbolic: (1, 3),
+    delayed_models.Exponential: (1, 2),
+    delayed_models.HyperbolicMagnitudeEffect: (2, 4),
+    delayed_models.ExponentialMagnitudeEffect: (2, 4),
+    delayed_models.ConstantSensitivity: (1, 2),
+    delayed_models.MyersonHyperboloid: (1, 3),
+    delayed_models.ModifiedRachlin: (1, 3),
+    delayed_models.HyperbolicNonLinearUtility: (2, 5),
+    delayed_models.ITCH: (2, 6),
+    delayed_models.DRIFT: (2, 6),
+    delayed_models.TradeOff: (2, 4),
+    risky_models.Hyperbolic: (1, 4),
+    risky_models.PrelecOneParameter: (1, 3),
+    risky_models.LinearInLogOdds: (1, 4),
+    risky_models.ProportionalDifference: (1, 4),
+    delayed_and_risky_models.MultiplicativeHyperbolic: (2, 5),
+}
+
+# allows for boolean masks and other small arrays
+TOLERANCE = 0.25
+
+
+@pytest.fixture(scope="module")
+def design_space():
+    return DesignSpaceBuilder.delayed_and_risky().build(as_design_matrix=True)
+
+
+def _peak_allocation(func):
+    """Peak memory allocated while calling func, and its result"""
+    func()  # warm up any caches
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline, result
+
+
+def _particles(model, n_particles):
+    model_instance = model(n_particles=n_particles)
+    θ = {key: model_instance.θ[key].to_numpy() for key in model_instance.θ}
+    return model_instance, θ
+
+
+@pytest.mark.parametrize("model", allocations.keys())
+def test_grid_allocations(model, design_space):
+    model_instance, θ = _particles(model, 500)
+    designs = design_space.take(
+        np.random.RandomState(0).randint(len(design_space), size=2000)
+    )
+    with np.errstate(all="ignore"):
+        peak, p_chose_B = _peak_allocation(
+            lambda: model_instance.predictive_y_grid(θ, designs)
+        )
+    assert peak / p_chose_B.nbytes <= allocations[model][0] + TOLERANCE
+
+
+@pytest.mark.parametrize("model", allocations.keys())
+def test_paired_allocations(model, design_space):
+    model_instance, θ = _particles(model, 50_000)
+    designs = design_space.take(
+        np.random.RandomState(0).randint(len(design_space), size=50_000)
+    )
+    with np.errstate(all="ignore"):
+        peak, p_chose_B = _peak_allocation(
+            lambda: model_instance.predictive_y(θ, designs)
+        )
+    assert peak / p_chose_B.nbytes <= allocations[model][1] + TOLERANCE
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox import batch
+from darc_toolbox.batch import BatchSimulation
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox import reducers
+
+
+@pytest.fixture(scope="module")
+def designs():
+    D = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    return D.take(np.random.RandomState(1).randint(len(D), size=200))
+
+
+def true_parameters(n, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({"logk": rng.normal(-4.5, 1, n), "α": rng.uniform(1, 3, n)})
+
+
+# a small budget splits participants (and designs) into several tiles
+@pytest.mark.parametrize("max_bytes", [8 * 1024, 2**30])
+def test_choose_designs_matches_mutual_information(designs, max_bytes):
+    model = delayed_models.Hyperbolic(n_particles=50)
+    sim = BatchSimulation(model, designs, true_parameters(7), seed=1, n_candidates=None)
+    sim.max_bytes = max_bytes
+    chosen = sim.choose_designs()
+    for participant in range(sim.n_participants):
+        θ = pd.DataFrame({n: v[participant] for n, v in sim.θ.items()})
+        utility = model.reduce_predictive_y(θ, designs, reducers.MutualInformation())
+        assert utility[chosen[participant]] == pytest.approx(utility.max())
+
+
+def _utility(model, sim, participant, designs):
+    θ = pd.DataFrame({n: v[participant] for n, v in sim.θ.items()})
+    p_chose_B = model.predictive_y_grid(θ, designs)
+    return batch._mutual_information(
+        p_chose_B[:, np.newaxis, :], np.exp(sim.log_weights[[participant]])
+    )[:, 0]
+
+
+@pytest.mark.parametrize("max_bytes", [8 * 1024, 2**30])
+def test_top_designs(designs, max_bytes):
+    model = delayed_models.Hyperbolic(n_particles=50)
+    sim = BatchSimulation(model, designs, true_parameters(5), seed=4)
+    sim.max_bytes = max_bytes
+    sim.run(2)
+    top = sim._top_designs(sim.θ, np.exp(sim.log_weights), 10)
+    assert top.shape == (5, 10)
+    for participant in range(sim.n_participants):
+        utility = _utility(model, sim, participant, designs)
+        np.testing.assert_allclose(
+            np.sort(utility[top[participant]]), np.sort(utility)[-10:], rtol=1e-12
+        )
+
+
+def test_choose_designs_from_candidates(designs):
+    model = delayed_models.Hyperbolic(n_particles=200)
+    sim = BatchSimulation(
+        model,
+        designs,
+        true_parameters(6),
+        seed=5,
+        n_candidates=16,
+        n_screening_particles=40,
+    )
+    sim.run(2)
+    chosen = sim.choose_designs()
+    for participant in range(sim.n_participants):
+        utility = _utility(model, sim, participant, designs)
+        # screening can miss the best design, but not by much
+        assert utility[chosen[participant]] > 0.9 * utility.max()
+
+
+def test_history_log_likelihood(designs, monkeypatch):
+    # a few trials per call
+    monkeypatch.setattr(batch, "_PAIRED_CHUNK", 100)
+    model = delayed_models.Hyperbolic(n_particles=20)
+    sim = BatchSimulation(model, designs, true_parameters(3), seed=6)
+    sim.ess_threshold = 0
+    sim.run(7)
+    participants = np.array([0, 2])
+    θ = {name: values[participants] for name, values in sim.θ.items()}
+    ll = sim._history_log_likelihood(θ, participants)
+    np.testing.assert_allclose(ll, sim.log_likelihood[participants], rtol=1e-12)
+
+
+def test_trial_log_likelihood(designs):
+    model = delayed_models.Hyperbolic(n_particles=50)
+    sim = BatchSimulation(model, designs, true_parameters(3), seed=1)
+    chosen = np.array([0, 5, 9])
+    responses = np.array([True, False, True])
+    ll = sim._trial_log_likelihood(sim.θ, chosen, responses)
+    for participant in range(3):
+        θ = {n: v[participant] for n, v in sim.θ.items()}
+        p_chose_B = model.predictive_y_grid(θ, designs.take([chosen[participant]]))
+        p = p_chose_B[0] if responses[participant] else 1 - p_chose_B[0]
+        np.testing.assert_allclose(ll[participant], np.log(p))
+
+
+def test_recovers_parameters():
+    truth = true_parameters(20)
+    model = delayed_models.Hyperbolic(n_particles=200)
+    sim = BatchSimulation(model, DesignSpaceBuilder.delayed().build(), truth, seed=2)
+    trials = sim.run(12)
+    assert trials.shape == (20 * 12, 10)
+    assert list(trials.groupby("participant").size()) == [12] * 20
+    assert np.all(np.isin(trials.R, [0, 1]))
+    estimates = sim.posterior_mean()
+    assert np.corrcoef(estimates.logk, truth.logk)[0, 1] > 0.9
+    # weights stay normalised through resampling
+    np.testing.assert_allclose(np.exp(sim.log_weights).sum(axis=1), 1)
+
+
+def test_resampling_keeps_particles_from_the_prior_support(designs):
+    model = delayed_models.Hyperbolic(n_particles=50)
+    sim = BatchSimulation(model, designs, true_parameters(4), seed=3)
+    sim.ess_threshold = 1.1
+    sim.run(3)
+    assert np.all(sim.θ["α"] > 0)
+    assert np.all(sim.effective_sample_size() == pytest.approx(50))
+
+
+def test_no_trials():
+    model = delayed_models.Hyperbolic(n_particles=10)
+    sim = BatchSimulation(
+        model, DesignSpaceBuilder.delayed().build(), true_parameters(2)
+    )
+    assert len(sim.trials_dataframe()) == 0
+    assert sim.n_trials == 0
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox import Design
+from darc_toolbox.canonical import DesignIndex
+from darc_toolbox.design_matrix import DesignMatrix
+from darc_toolbox.designs import DesignSpaceBuilder
+
+presets = [
+    "delayed",
+    "risky",
+    "delayed_and_risky",
+    "frontend_delay",
+    "delay_magnitude_effect",
+]
+
+
+@pytest.mark.parametrize("preset", presets)
+def test_ids_of_built_designs(preset):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    D = builder.build()
+    index = builder.build_canonical()
+    # the presets have no duplicates, so every design gets its row number
+    assert len(index) == len(D)
+    np.testing.assert_array_equal(index.ids, np.arange(len(D)))
+    np.testing.assert_array_equal(index.lookup(D), np.arange(len(D)))
+    # values move by no more than half the tolerance
+    np.testing.assert_allclose(
+        index.to_dataframe()[D.columns].to_numpy(), D.to_numpy(), rtol=0, atol=5e-10
+    )
+
+
+def test_near_duplicates_removed():
+    # 0.1 + 0.2 != 0.3 in floating point
+    designs = pd.DataFrame(
+        {
+            "RA": [50.0, 50.0, 50.0, 60.0],
+            "DA": [0.1 + 0.2, 0.3, 0.3, 0.3],
+            "PA": [1.0] * 4,
+            "RB": [100.0] * 4,
+            "DB": [7.0, 7.0, 7.0 + 1e-12, 7.0],
+            "PB": [1.0] * 4,
+        }
+    )
+    index = DesignIndex(designs)
+    assert len(index) == 2
+    assert index.n_duplicates == 2
+    np.testing.assert_array_equal(index.ids, [0, 0, 0, 1])
+    assert index.get_design(0) == Design(
+        RA=50.0, DA=0.3, PA=1.0, RB=100.0, DB=7.0, PB=1.0
+    )
+    # with a finer tolerance, the delays differ
+    assert len(DesignIndex(designs, tolerance=1e-14)) == 3
+
+
+def test_lookup():
+    index = DesignSpaceBuilder.delayed().build_canonical()
+    design = Design(RA=50.0, DA=0.0, PA=1.0, RB=100.0, DB=7.0, PB=1.0)
+    design_id = index.id_of(design)
+    assert index.get_design(design_id) == design
+    assert index.id_of(design._replace(RA=50.0 + 1e-11)) == design_id
+    with pytest.raises(KeyError):
+        index.id_of(design._replace(RA=50.1))
+    designs = DesignMatrix.coerce(design._replace(RB=1000.0))
+    np.testing.assert_array_equal(index.lookup(designs), [-1])
+
+
+def test_ids_are_stable():
+    builder = DesignSpaceBuilder.delay_magnitude_effect()
+    first = builder.build_canonical()
+    second = builder.build_canonical()
+    np.testing.assert_array_equal(first.ids, second.ids)
+    # and do not depend on the order of the keys
+    reversed_designs = first.designs.take(np.arange(len(first))[::-1])
+    np.testing.assert_array_equal(
+        DesignIndex(reversed_designs).lookup(first.designs), np.arange(len(first))[::-1]
+    )
+
+
+def test_empty():
+    index = DesignSpaceBuilder(RA=[200.0], RB=[100.0]).build_canonical()
+    assert len(index) == 0
+    design = Design(RA=50.0, DA=0.0, PA=1.0, RB=100.0, DB=7.0, PB=1.0)
+    with pytest.raises(KeyError):
+        index.id_of(design)
+    with pytest.raises(ValueError):
+        DesignIndex(DesignSpaceBuilder.delayed().build(), tolerance=0)
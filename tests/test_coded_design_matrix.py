@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.design_matrix import (
+    CodedDesignMatrix,
+    DesignMatrix,
+    DESIGN_VARIABLES,
+    code_dtype,
+)
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+
+presets = [
+    "delayed",
+    "risky",
+    "delayed_and_risky",
+    "frontend_delay",
+    "delay_magnitude_effect",
+]
+
+
+@pytest.mark.parametrize("preset", presets)
+def test_coded_round_trip(preset):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    designs = builder.build(as_design_matrix=True)
+    coded = builder.build_coded()
+    assert len(coded) == len(designs)
+    decoded = coded.decode()
+    for name in DESIGN_VARIABLES:
+        np.testing.assert_array_equal(coded[name], designs[name])
+        np.testing.assert_array_equal(decoded[name], designs[name])
+        assert coded.codes[name].dtype == np.uint8
+    assert coded.get_design(len(coded) - 1) == designs.get_design(len(designs) - 1)
+    # one byte per design variable per design, plus the tables
+    tables = sum(table.nbytes for table in coded.tables.values())
+    assert coded.nbytes == len(designs) * 6 + tables
+
+
+def test_code_dtype():
+    assert code_dtype(256) == np.uint8
+    assert code_dtype(257) == np.uint16
+    assert code_dtype(2**16 + 1) == np.uint32
+
+
+def test_export():
+    coded = DesignSpaceBuilder.delayed().build_coded(dtype="float32")
+    df = coded.to_dataframe()
+    pd.testing.assert_frame_equal(df, coded.decode().to_dataframe())
+    categorical = coded.to_dataframe(categorical=True)
+    assert isinstance(categorical["DB"].dtype, pd.CategoricalDtype)
+    np.testing.assert_array_equal(categorical["DB"].astype("float32"), df["DB"])
+    assert categorical.memory_usage().sum() < df.memory_usage().sum() / 2
+
+
+def test_take_and_map_values():
+    coded = DesignSpaceBuilder.delayed().build_coded()
+    indices = np.arange(10, 100, 7)
+    some = coded.take(indices)
+    assert np.shares_memory(some.tables["DB"], coded.tables["DB"])
+    np.testing.assert_array_equal(some["RA"], coded["RA"][indices])
+    np.testing.assert_array_equal(coded.map_values("DB", np.sqrt), np.sqrt(coded["DB"]))
+
+
+def test_invalid_codes():
+    coded = DesignSpaceBuilder.risky().build_coded()
+    codes = dict(coded.codes, PB=coded.codes["PB"] + 10)
+    with pytest.raises(ValueError):
+        CodedDesignMatrix(coded.tables, codes)
+    codes = dict(coded.codes, PB=coded.codes["PB"].astype("int64"))
+    with pytest.raises(ValueError):
+        CodedDesignMatrix(coded.tables, codes)
+
+
+@pytest.mark.parametrize(
+    "preset,model",
+    [
+        ("delayed", delayed_models.Hyperbolic),
+        ("delay_magnitude_effect", delayed_models.HyperbolicMagnitudeEffect),
+        ("delay_magnitude_effect", delayed_models.ModifiedRachlin),
+        ("risky", risky_models.Hyperbolic),
+        ("delayed_and_risky", delayed_and_risky_models.MultiplicativeHyperbolic),
+    ],
+)
+def test_models_accept_coded_designs(preset, model):
+    np.random.seed(1)
+    model_instance = model(n_particles=200)
+    builder = getattr(DesignSpaceBuilder, preset)()
+    designs = builder.build(as_design_matrix=True)
+    coded = builder.build_coded()
+    θ = model_instance.θ
+    # the same unique values, in the same order, so the same answer to the bit
+    np.testing.assert_array_equal(
+        model_instance.predictive_y_grid(θ, coded),
+        model_instance.predictive_y_grid(θ, designs),
+    )
+    np.testing.assert_array_equal(
+        model_instance.predictive_y(θ, coded.take(np.arange(200))),
+        model_instance.predictive_y(θ, designs.take(np.arange(200))),
+    )
+
+
+def test_unique_from_codes_matches_np_unique():
+    coded = DesignSpaceBuilder.delay_magnitude_effect().build_coded()
+    from_codes = coded.decode().take(np.arange(0, 2000, 3)).column_vectors()
+    plain = DesignMatrix.coerce(coded.decode().to_dataframe())
+    plain = plain.take(np.arange(0, 2000, 3)).column_vectors()
+    for names in [("RA", "DA"), ("RB", "DB"), "DB"]:
+        unique_coded, inverse_coded = from_codes._get_unique(names)
+        unique_plain, inverse_plain = plain._get_unique(names)
+        for a, b in zip(unique_coded, unique_plain):
+            np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(inverse_coded, inverse_plain)
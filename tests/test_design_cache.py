@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox import design_cache
+from darc_toolbox.designs import DesignSpaceBuilder
+
+presets = [
+    "delayed",
+    "risky",
+    "delayed_and_risky",
+    "frontend_delay",
+    "delay_magnitude_effect",
+]
+
+
+def cached_files(cache_dir):
+    return sorted(path.name for path in cache_dir.glob("designs-*.npy"))
+
+
+@pytest.mark.parametrize("assume_discounting", [True, False])
+@pytest.mark.parametrize("preset", presets)
+def test_cached_matches_build(preset, assume_discounting, tmp_path):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    expected = builder.build(assume_discounting=assume_discounting)
+    for _ in range(2):
+        # the first build saves to the cache, the second loads from it
+        D = builder.build(assume_discounting=assume_discounting, cache_dir=tmp_path)
+        pd.testing.assert_frame_equal(D, expected, check_exact=True)
+    assert len(cached_files(tmp_path)) > 0
+
+
+def test_cache_hit_does_not_build(tmp_path, monkeypatch):
+    builder = DesignSpaceBuilder.delayed()
+    builder.build(cache_dir=tmp_path)
+
+    def fail(*args):
+        raise AssertionError("should have loaded the designs from the cache")
+
+    monkeypatch.setattr(builder, "_build_columns", fail)
+    D = builder.build(cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(D, DesignSpaceBuilder.delayed().build())
+
+
+def test_cached_design_matrix(tmp_path):
+    builder = DesignSpaceBuilder.delayed_and_risky()
+    expected = builder.build(as_design_matrix=True, dtype="float32")
+    builder.build(as_design_matrix=True, dtype="float32", cache_dir=tmp_path)
+    designs = builder.build(as_design_matrix=True, dtype="float32", cache_dir=tmp_path)
+    assert designs.dtype == np.float32
+    for name in ["RA", "DA", "PA", "RB", "DB", "PB"]:
+        np.testing.assert_array_equal(designs[name], expected[name])
+
+
+def test_cache_key():
+    builder = DesignSpaceBuilder.delayed()
+    key = builder.cache_key()
+    assert key == DesignSpaceBuilder.delayed().cache_key()
+    assert key != builder.cache_key(assume_discounting=False)
+    assert key != builder.cache_key(dtype="float32")
+    assert key != DesignSpaceBuilder(RA=builder.RA[:-1]).cache_key()
+    # ints and floats give the same designs, so share a key
+    assert (
+        DesignSpaceBuilder(RA=[50], RB=[100]).cache_key()
+        == DesignSpaceBuilder(RA=[50.0], RB=[100.0]).cache_key()
+    )
+
+
+def test_cache_invalidated_by_version(tmp_path, monkeypatch):
+    builder = DesignSpaceBuilder.delayed()
+    builder.build(cache_dir=tmp_path)
+    old_files = cached_files(tmp_path)
+    monkeypatch.setattr(design_cache, "CACHE_VERSION", design_cache.CACHE_VERSION + 1)
+    assert design_cache.load(tmp_path, builder.cache_key()) is None
+    builder.build(cache_dir=tmp_path)
+    # the files from the old version are replaced
+    new_files = cached_files(tmp_path)
+    assert len(new_files) == len(old_files)
+    assert set(new_files).isdisjoint(old_files)
+
+
+def test_cache_invalidated_by_code(tmp_path, monkeypatch):
+    builder = DesignSpaceBuilder.delayed()
+    key = builder.cache_key()
+    builder.build(cache_dir=tmp_path)
+    old_files = cached_files(tmp_path)
+    # as if the modules which build the designs had been edited
+    monkeypatch.setattr(design_cache, "code_hash", lambda: "edited")
+    assert builder.cache_key() != key
+    assert design_cache.load(tmp_path, builder.cache_key()) is None
+    builder.build(cache_dir=tmp_path)
+    assert set(cached_files(tmp_path)).isdisjoint(old_files)
+
+
+def test_unreadable_cache_is_rebuilt(tmp_path):
+    builder = DesignSpaceBuilder.risky()
+    expected = builder.build()
+    builder.build(cache_dir=tmp_path)
+    for path in tmp_path.glob("designs-*.npy"):
+        path.write_bytes(b"not a numpy file")
+    D = builder.build(cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(D, expected)
+    # and the cache is repaired
+    assert design_cache.load(tmp_path, builder.cache_key()) is not None
+
+
+def test_cache_no_designs(tmp_path):
+    builder = DesignSpaceBuilder(RA=[200.0], RB=[100.0])
+    for _ in range(2):
+        D = builder.build(cache_dir=tmp_path)
+        assert len(D) == 0
+        assert list(D.columns) == ["RA", "DA", "PA", "RB", "DB", "PB"]
+
+
+def test_clear(tmp_path):
+    DesignSpaceBuilder.delayed().build(cache_dir=tmp_path)
+    DesignSpaceBuilder.risky().build(cache_dir=tmp_path)
+    design_cache.clear(tmp_path)
+    assert cached_files(tmp_path) == []
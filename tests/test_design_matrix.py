@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox import Design
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.design_matrix import DesignMatrix, DESIGN_VARIABLES
+
+
+def test_build_as_design_matrix():
+    D = DesignSpaceBuilder.delayed().build()
+    designs = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    assert isinstance(designs, DesignMatrix)
+    assert designs.shape == D.shape
+    for name in DESIGN_VARIABLES:
+        np.testing.assert_array_equal(designs[name], D[name].values)
+
+
+def test_columns_are_contiguous_float64():
+    designs = DesignSpaceBuilder.risky().build(as_design_matrix=True)
+    for name in DESIGN_VARIABLES:
+        assert designs[name].dtype == np.float64
+        assert designs[name].flags["C_CONTIGUOUS"]
+
+
+def test_column_vectors_are_cached():
+    designs = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    vectors = designs.column_vectors()
+    assert vectors["DB"].shape == (len(designs), 1)
+    assert designs.column_vectors() is vectors
+
+
+def test_dataframe_round_trip():
+    D = DesignSpaceBuilder.delay_magnitude_effect().build().reset_index(drop=True)
+    D = D[DESIGN_VARIABLES]
+    pd.testing.assert_frame_equal(DesignMatrix.from_dataframe(D).to_dataframe(), D)
+
+
+def test_coerce_design_tuple():
+    design = Design(RA=50.0, DA=0.0, PA=1.0, RB=100.0, DB=7.0, PB=1.0)
+    designs = DesignMatrix.coerce(design)
+    assert len(designs) == 1
+    assert designs.get_design(0) == design
+
+
+def test_take():
+    designs = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    subset = designs.take([0, 10, 20])
+    assert len(subset) == 3
+    assert subset.get_design(1) == designs.get_design(10)
+
+
+def test_mismatched_lengths():
+    with pytest.raises(ValueError):
+        DesignMatrix(RA=[1, 2], DA=[0], PA=[1], RB=[3], DB=[4], PB=[1])
+
+
+def test_map_unique_evaluates_unique_values_only():
+    designs = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    k = np.array([[0.001, 0.01, 0.1]])
+    evaluated = []
+
+    def discount(delay, k):
+        evaluated.append(delay.size)
+        return 1 / (1 + k * delay)
+
+    grid = designs.column_vectors()
+    result = grid.map_unique("DB", discount, k)
+    assert evaluated == [np.unique(designs["DB"]).size]
+    np.testing.assert_array_equal(result, 1 / (1 + k * grid["DB"]))
+
+
+def test_map_unique_multiple_design_variables():
+    designs = DesignSpaceBuilder.delay_magnitude_effect().build(as_design_matrix=True)
+    grid = designs.column_vectors()
+    result = grid.map_unique(("RB", "DB"), lambda reward, delay: reward / (1 + delay))
+    np.testing.assert_array_equal(result, grid["RB"] / (1 + grid["DB"]))
+
+
+def test_map_unique_falls_back_when_values_are_unique():
+    designs = DesignMatrix(
+        RA=np.arange(10),
+        DA=np.zeros(10),
+        PA=np.ones(10),
+        RB=np.full(10, 100),
+        DB=np.arange(10) + 1,
+        PB=np.ones(10),
+    )
+    evaluated = []
+    designs.column_vectors().map_unique(
+        "DB", lambda delay: evaluated.append(delay.size)
+    )
+    assert evaluated == [10]
+
+
+def test_constant_variables():
+    designs = DesignSpaceBuilder.risky().build(as_design_matrix=True)
+    assert designs.constant_variables == {"DA": 0.0, "PA": 1.0, "RB": 100.0, "DB": 0.0}
+    assert designs.constant_value("RA") is None
+
+
+def test_map_unique_constant_collapses_to_scalar():
+    designs = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    k = np.array([[0.001, 0.01, 0.1]])
+    discount = designs.column_vectors().map_unique(
+        "DA", lambda d, k: 1 / (1 + k * d), k
+    )
+    assert np.ndim(discount) == 0 and discount == 1.0
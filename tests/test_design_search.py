@@ -0,0 +1,231 @@
+import numpy as np
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.design_search import (
+    _golden_section,
+    _snap,
+    check_search,
+    coarse_to_fine_search,
+    exhaustive_search,
+    golden_section_search,
+    streaming_search,
+)
+from darc_toolbox.reducers import MutualInformation
+
+
+def model_with_seed(model, seed, n_particles=1000):
+    np.random.seed(seed)
+    return model(n_particles=n_particles)
+
+
+@pytest.mark.parametrize(
+    "preset,model",
+    [
+        ("delayed", delayed_models.Hyperbolic),
+        ("frontend_delay", delayed_models.Hyperbolic),
+        ("delay_magnitude_effect", delayed_models.HyperbolicMagnitudeEffect),
+    ],
+)
+def test_result_matches_build(preset, model):
+    model_instance = model_with_seed(model, 1)
+    builder = getattr(DesignSpaceBuilder, preset)()
+    D = builder.build()
+    for result in [
+        coarse_to_fine_search(model_instance, builder),
+        exhaustive_search(model_instance, builder),
+    ]:
+        assert result.design._asdict() == D.loc[result.index].to_dict()
+        assert result.n_designs == len(D)
+        utility = model_instance.reduce_predictive_y(
+            model_instance.θ, D.loc[[result.index]], MutualInformation()
+        )
+        assert result.utility == pytest.approx(utility[0], rel=1e-12)
+
+
+def test_exhaustive_search():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 2)
+    builder = DesignSpaceBuilder.delayed()
+    D = builder.build()
+    utility = model_instance.reduce_predictive_y(
+        model_instance.θ, D, MutualInformation()
+    )
+    result = exhaustive_search(model_instance, builder, chunk_size=1000)
+    assert result.index == D.index[np.argmax(utility)]
+    assert result.n_evaluated == len(D)
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 100_000])
+def test_streaming_search(chunk_size):
+    model_instance = model_with_seed(
+        delayed_and_risky_models.MultiplicativeHyperbolic, 13
+    )
+    builder = DesignSpaceBuilder.delayed_and_risky()
+    expected = exhaustive_search(model_instance, builder)
+    result = streaming_search(
+        model_instance, builder.iter_chunks(chunk_size), max_bytes=2**20
+    )
+    assert result == expected
+    # and from the chunks of a virtual design space, numbered 0, 1, 2...
+    space = builder.build_virtual()
+    result = streaming_search(model_instance, space.chunks(chunk_size))
+    assert space.grid_position(result.index) == expected.index
+    with pytest.raises(ValueError):
+        streaming_search(model_instance, iter([]))
+
+
+def test_stride_one_is_exhaustive():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 3)
+    builder = DesignSpaceBuilder.delayed()
+    result = coarse_to_fine_search(model_instance, builder, stride=1)
+    check = check_search(model_instance, builder, result)
+    assert check.exact
+    assert check.rank == 0
+    assert check.utility_loss == 0.0
+    assert result.n_evaluated == check.n_designs
+    assert check.best == result
+
+
+@pytest.mark.parametrize("seed", [4, 5, 6])
+def test_coarse_to_fine_saves_evaluations(seed):
+    model_instance = model_with_seed(
+        delayed_and_risky_models.MultiplicativeHyperbolic, seed
+    )
+    builder = DesignSpaceBuilder.delayed_and_risky()
+    result = coarse_to_fine_search(model_instance, builder)
+    check = check_search(model_instance, builder, result)
+    assert check.n_evaluated * 10 < check.n_designs
+    # the utility surface is smooth, so we lose very little, if anything
+    assert check.utility_loss < 0.01 * check.best.utility
+    assert check.rank < 10
+
+
+def test_coarse_names():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 7)
+    builder = DesignSpaceBuilder.delayed()
+    # coarse over DB only
+    result = coarse_to_fine_search(model_instance, builder, coarse=["DB"])
+    assert check_search(model_instance, builder, result).n_evaluated < 4095
+    with pytest.raises(ValueError):
+        coarse_to_fine_search(model_instance, builder, coarse=["IRI"])
+
+
+def test_no_designs():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 8)
+    builder = DesignSpaceBuilder(RA=[200.0], RB=[100.0])
+    with pytest.raises(ValueError):
+        coarse_to_fine_search(model_instance, builder)
+
+
+def test_golden_section():
+    peaks = np.array([0.0, 0.3, 2.5, 9.9, 10.0])
+    calls = []
+
+    def f(x):
+        calls.append(x)
+        return -((x - peaks) ** 2)
+
+    lower, upper = np.zeros(5), np.full(5, 10.0)
+    x = _golden_section(f, lower, upper, 1e-6)
+    np.testing.assert_allclose(x, peaks, atol=1e-6)
+    # one new point per iteration, after the first two
+    assert len(calls) == 2 + int(np.ceil(np.log(1e-6 / 10) / np.log(0.618034)))
+
+
+def test_snap():
+    values = np.array([0.004, 12.346, 65.1049, 99.999])
+    snapped = _snap(values, np.full(4, 0.01), np.full(4, 99.995), 0.01)
+    np.testing.assert_array_equal(snapped, [0.01, 12.35, 65.1, 99.99])
+
+
+def test_golden_section_search():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 9)
+    builder = DesignSpaceBuilder.delayed()
+    grid_best = exhaustive_search(model_instance, builder)
+    result = golden_section_search(model_instance, builder, precision=0.01)
+    # RA is free to move between the grid's values, so we do as well, give or
+    # take the wiggles in the utility from sampling the particles
+    assert result.utility > grid_best.utility - 1e-3
+    assert result.n_evaluated * 3 < grid_best.n_designs
+    assert result.index is None
+    design = result.design
+    assert design.RA == round(design.RA, 2)
+    assert min(builder.RA) <= design.RA <= design.RB
+    assert design.DB in builder.DB
+    utility = model_instance.reduce_predictive_y(
+        model_instance.θ, design, MutualInformation()
+    )
+    assert result.utility == pytest.approx(utility[0], rel=1e-12)
+
+
+def test_golden_section_search_RA_over_RB():
+    model_instance = model_with_seed(delayed_models.HyperbolicMagnitudeEffect, 10)
+    builder = DesignSpaceBuilder.delay_magnitude_effect()
+    grid_best = exhaustive_search(model_instance, builder)
+    result = golden_section_search(model_instance, builder, precision={"RA": 0.001})
+    assert result.utility > grid_best.utility - 1e-3
+    ratio = result.design.RA / result.design.RB
+    assert ratio == pytest.approx(round(ratio, 3))
+
+
+def test_golden_section_search_PB():
+    model_instance = model_with_seed(risky_models.Hyperbolic, 11)
+    builder = DesignSpaceBuilder.risky()
+    result = golden_section_search(model_instance, builder, continuous=["PB"])
+    assert min(builder.PB) <= result.design.PB <= max(builder.PB)
+    assert result.design.RA in builder.RA
+
+
+def test_golden_section_search_errors():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 12)
+    with pytest.raises(ValueError):
+        golden_section_search(
+            model_instance, DesignSpaceBuilder.delayed(), continuous=["DB"]
+        )
+    with pytest.raises(ValueError):
+        golden_section_search(model_instance, DesignSpaceBuilder(RA=[200.0]))
+
+
+def test_golden_section_search_discrete_RA():
+    model_instance = model_with_seed(risky_models.Hyperbolic, 16)
+    builder = DesignSpaceBuilder(DA=[0], DB=[0], PA=[1], RA=[150.0], RB=[100.0])
+    # every design has RB < RA, so none of them are kept when assuming
+    # discounting, whatever PB is
+    with pytest.raises(ValueError):
+        golden_section_search(model_instance, builder, continuous=["PB"])
+    result = golden_section_search(
+        model_instance, builder, continuous=["PB"], assume_discounting=False
+    )
+    assert result.design.RA == 150 and result.design.RB == 100
+    builder = DesignSpaceBuilder(
+        DA=[0], DB=[0], PA=[1], RA=[50.0, 150.0], RB=[100.0, 200.0]
+    )
+    result = golden_section_search(model_instance, builder, continuous=["PB"])
+    assert result.design.RA <= result.design.RB
+
+
+def test_searches_respect_constraints():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 14)
+    builder = DesignSpaceBuilder.delayed()
+    builder.constrain(lambda DB: DB <= 30).constrain(lambda RA, RB: RA >= 0.6 * RB)
+    D = builder.build()
+    for result in [
+        coarse_to_fine_search(model_instance, builder),
+        exhaustive_search(model_instance, builder),
+        streaming_search(model_instance, builder.iter_chunks(1000)),
+    ]:
+        assert result.design._asdict() == D.loc[result.index].to_dict()
+    result = golden_section_search(model_instance, builder)
+    assert result.design.DB <= 30
+    assert result.design.RA >= 0.6 * result.design.RB
+
+
+def test_golden_section_search_respects_constraints_on_RA():
+    model_instance = model_with_seed(delayed_models.Hyperbolic, 15)
+    builder = DesignSpaceBuilder.delayed()
+    # only the bounds of this can be pushed down onto the search range
+    builder.constrain(lambda RA: (RA <= 30) | (RA >= 70))
+    result = golden_section_search(model_instance, builder)
+    assert result.design.RA <= 30 or result.design.RA >= 70
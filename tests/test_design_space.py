@@ -0,0 +1,174 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox.designs import DesignSpaceBuilder
+
+presets = [
+    "delayed",
+    "risky",
+    "delayed_and_risky",
+    "frontend_delay",
+    "delay_magnitude_effect",
+]
+
+
+def reference_build(builder, assume_discounting=True):
+    """The design space built one tuple at a time with itertools.product"""
+    if len(builder.IRI) > 1:
+        columns = ["RA", "DA", "PA", "RB", "IRI", "PB"]
+        values = [builder.RA, builder.DA, builder.PA, builder.RB, builder.IRI]
+        D = pd.DataFrame(itertools.product(*values, builder.PB), columns=columns)
+        D["DB"] = D["DA"] + D["IRI"]
+        D = D.drop(columns=["IRI"])
+    elif not builder.RA_over_RB:
+        columns = ["RA", "DA", "PA", "RB", "DB", "PB"]
+        values = [builder.RA, builder.DA, builder.PA, builder.RB, builder.DB]
+        D = pd.DataFrame(itertools.product(*values, builder.PB), columns=columns)
+    else:
+        columns = ["RA_over_RB", "DA", "PA", "RB", "DB", "PB"]
+        values = [builder.RA_over_RB, builder.DA, builder.PA, builder.RB, builder.DB]
+        D = pd.DataFrame(itertools.product(*values, builder.PB), columns=columns)
+        D["RA"] = D["RB"] * D["RA_over_RB"]
+        D = D.drop(columns=["RA_over_RB"])
+    D = D.drop(D[D.DA > D.DB].index)
+    if assume_discounting:
+        D = D.drop(D[D.RB < D.RA].index)
+    return D.astype("float64")
+
+
+@pytest.mark.parametrize("assume_discounting", [True, False])
+@pytest.mark.parametrize("preset", presets)
+def test_build_matches_product(preset, assume_discounting):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    expected = reference_build(builder, assume_discounting)
+    D = builder.build(assume_discounting=assume_discounting)
+    pd.testing.assert_frame_equal(D, expected, check_exact=True)
+
+
+@pytest.mark.parametrize("assume_discounting", [True, False])
+def test_build_filters_keep_index(assume_discounting):
+    builder = DesignSpaceBuilder(
+        RA=[10, 50.5, 120], DA=[0, 3, 7], DB=[1, 3, 10], PB=[0.5, 1]
+    )
+    expected = reference_build(builder, assume_discounting)
+    D = builder.build(assume_discounting=assume_discounting)
+    # rows are dropped, so the index has gaps where they were
+    assert len(D) < 3 * 3 * 3 * 2
+    pd.testing.assert_frame_equal(D, expected, check_exact=True)
+
+
+def test_build_design_matrix_matches_dataframe():
+    builder = DesignSpaceBuilder.delayed_and_risky()
+    D = builder.build()
+    for dtype in ["float64", "float32"]:
+        designs = builder.build(as_design_matrix=True, dtype=dtype)
+        assert designs.dtype == dtype
+        for name in ["RA", "DA", "PA", "RB", "DB", "PB"]:
+            np.testing.assert_array_equal(designs[name], D[name].astype(dtype))
+
+
+def test_build_no_designs():
+    D = DesignSpaceBuilder(RA=[200.0], RB=[100.0]).build()
+    assert len(D) == 0
+    assert list(D.columns) == ["RA", "DA", "PA", "RB", "DB", "PB"]
+
+
+def constrained_reference(builder, predicates, assume_discounting=True):
+    """The design space built with itertools.product and then filtered"""
+    D = reference_build(builder, assume_discounting)
+    for predicate in predicates:
+        D = D[predicate(D)]
+    return D.reset_index(drop=True)
+
+
+@pytest.mark.parametrize(
+    "preset",
+    ["delayed", "delayed_and_risky", "frontend_delay", "delay_magnitude_effect"],
+)
+def test_constraints_match_filtering(preset):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    builder.constrain(lambda DB: DB <= 365)
+    builder.constrain(lambda RA, RB: (RA >= 0.2 * RB) & (RA <= 0.8 * RB))
+    builder.constrain(lambda RA, PA, RB, PB: RB * PB - RA * PA >= 5)
+    expected = constrained_reference(
+        builder,
+        [
+            lambda D: D.DB <= 365,
+            lambda D: (D.RA >= 0.2 * D.RB) & (D.RA <= 0.8 * D.RB),
+            lambda D: D.RB * D.PB - D.RA * D.PA >= 5,
+        ],
+    )
+    D = builder.build()
+    assert 0 < len(D) < len(getattr(DesignSpaceBuilder, preset)().build())
+    pd.testing.assert_frame_equal(D.reset_index(drop=True), expected, check_like=True)
+    designs = builder.build_virtual().to_design_matrix()
+    pd.testing.assert_frame_equal(designs.to_dataframe(), expected, check_like=True)
+    index, designs = next(builder.iter_chunks(10**6))
+    pd.testing.assert_frame_equal(designs.to_dataframe(), expected, check_like=True)
+    np.testing.assert_array_equal(index, D.index.to_numpy())
+
+
+@pytest.mark.parametrize("assume_discounting", [True, False])
+@pytest.mark.parametrize("preset", presets)
+def test_n_designs_matches_build(preset, assume_discounting):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    n_designs = builder.n_designs(assume_discounting)
+    assert n_designs == len(builder.build(assume_discounting=assume_discounting))
+    # the count is recomputed when the design space changes
+    builder.constrain(lambda RA, RB: RA <= 0.3 * RB)
+    assert builder.n_designs(assume_discounting) < n_designs
+    assert builder.n_designs(assume_discounting) == len(
+        builder.build(assume_discounting=assume_discounting)
+    )
+
+
+def test_single_variable_constraints_are_pushed_down():
+    builder = DesignSpaceBuilder.delayed().constrain(lambda DB: DB <= 365)
+    axes, _, constraints = builder._grid_axes()
+    assert axes["DB"] == [db for db in builder.DB if db <= 365]
+    assert constraints == []
+    # DB is not an axis when it comes from IRI
+    builder = DesignSpaceBuilder.frontend_delay().constrain(lambda DB: DB <= 365)
+    axes, _, constraints = builder._grid_axes()
+    assert len(constraints) == 1
+    # nothing left
+    D = DesignSpaceBuilder.delayed().constrain(lambda PB: PB > 1).build()
+    assert len(D) == 0
+
+
+def test_constraint_arguments():
+    builder = DesignSpaceBuilder.delayed()
+    with pytest.raises(ValueError):
+        builder.constrain(lambda RA, delay: RA > delay)
+    with pytest.raises(ValueError):
+        builder.constrain(lambda: True)
+
+
+def test_constraints_cache_key():
+    builder = DesignSpaceBuilder.delayed()
+    key = builder.cache_key()
+    builder.constrain(lambda DB: DB <= 365, name="within a year")
+    assert builder.cache_key() != key
+    builder.constrain(lambda RA: RA > 10)
+    with pytest.raises(ValueError):
+        builder.cache_key()
+
+
+def within(limit):
+    return lambda DB: DB <= limit
+
+
+def test_constraints_cache_key_uses_predicate():
+    def key(predicate):
+        builder = DesignSpaceBuilder.delayed()
+        return builder.constrain(predicate, name="short delays").cache_key()
+
+    # the same name, but a different predicate
+    assert key(lambda DB: DB <= 365) == key(lambda DB: DB <= 365)
+    assert key(lambda DB: DB <= 365) != key(lambda DB: DB <= 30)
+    assert key(lambda DB: DB <= 365) != key(lambda DB: DB < 365)
+    assert key(lambda DB: DB <= 365) != key(lambda DB: np.less_equal(DB, 365))
+    # and the values it closes over
+    assert key(within(365)) == key(within(365))
+    assert key(within(365)) != key(within(30))
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from scipy.special import ndtr
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+
+pytest.importorskip("numba")
+
+from darc_toolbox import fused
+
+fused_models = [
+    (delayed_models.Hyperbolic, "delayed"),
+    (delayed_models.Exponential, "delayed"),
+    (delayed_models.HyperbolicMagnitudeEffect, "delay_magnitude_effect"),
+    (delayed_models.ExponentialMagnitudeEffect, "delay_magnitude_effect"),
+    (delayed_models.ConstantSensitivity, "frontend_delay"),
+    (delayed_models.MyersonHyperboloid, "frontend_delay"),
+    (delayed_models.ModifiedRachlin, "delayed"),
+    (delayed_models.HyperbolicNonLinearUtility, "delayed"),
+    (risky_models.Hyperbolic, "risky"),
+    (risky_models.PrelecOneParameter, "risky"),
+    (risky_models.LinearInLogOdds, "risky"),
+    (delayed_and_risky_models.MultiplicativeHyperbolic, "delayed_and_risky"),
+]
+
+
+def _both_backends(model_instance, method, θ, designs):
+    results = []
+    for backend in ("numpy", "numba"):
+        model_instance.backend = backend
+        with np.errstate(all="ignore"):
+            results.append(getattr(model_instance, method)(θ, designs))
+    return results
+
+
+@pytest.mark.parametrize("model, preset", fused_models)
+def test_fused_grid_matches_numpy(model, preset):
+    model_instance = model(n_particles=100)
+    designs = getattr(DesignSpaceBuilder, preset)().build(as_design_matrix=True)
+    designs = designs.take(np.random.randint(len(designs), size=200))
+    p_numpy, p_fused = _both_backends(
+        model_instance, "predictive_y_grid", model_instance.θ, designs
+    )
+    assert p_fused.shape == (200, 100)
+    np.testing.assert_allclose(p_fused, p_numpy, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("model, preset", fused_models)
+def test_fused_paired_matches_numpy(model, preset):
+    model_instance = model(n_particles=100)
+    D = getattr(DesignSpaceBuilder, preset)().build()
+    designs = D.sample(n=100, replace=True).reset_index(drop=True)
+    p_numpy, p_fused = _both_backends(
+        model_instance, "predictive_y", model_instance.θ, designs
+    )
+    np.testing.assert_allclose(p_fused, p_numpy, rtol=0, atol=1e-12)
+    # a single design is paired with every particle
+    p_numpy, p_fused = _both_backends(
+        model_instance, "predictive_y", model_instance.θ, designs.iloc[[0]]
+    )
+    assert p_fused.shape == (100,)
+    np.testing.assert_allclose(p_fused, p_numpy, rtol=0, atol=1e-12)
+
+
+def test_fused_float32():
+    model_instance = delayed_models.Hyperbolic(n_particles=100)
+    model_instance.dtype = "float32"
+    designs = DesignSpaceBuilder.delayed().build(as_design_matrix=True)
+    p_numpy, p_fused = _both_backends(
+        model_instance, "predictive_y_grid", model_instance.θ, designs
+    )
+    assert p_fused.dtype == np.float32
+    # The fused kernels round to float32 only once, at the end, so they are
+    # within float32 rounding error of NumPy rather than identical. Each
+    # backend computes VA = RA / (1 + k DA) and VB with a few roundings of
+    # relative size eps, so their decision variables VB - VA differ by at most
+    # about 8 eps (|VA| + |VB|). The choice function ϵ + (1 - 2ϵ) Φ(dv / α)
+    # has a slope of at most 1 / (α √(2π)), and rounding p itself adds eps.
+    eps = np.finfo(np.float32).eps
+    k = np.exp(model_instance.θ["logk"].to_numpy(dtype="float64"))
+    α = model_instance.θ["α"].to_numpy(dtype="float64")
+    VA = designs["RA"][:, np.newaxis] / (1 + k * designs["DA"][:, np.newaxis])
+    VB = designs["RB"][:, np.newaxis] / (1 + k * designs["DB"][:, np.newaxis])
+    slope = 1 / (α * np.sqrt(2 * np.pi))
+    bound = 8 * eps * (np.abs(VA) + np.abs(VB)) * slope + 2 * eps
+    difference = np.abs(p_fused.astype("float64") - p_numpy)
+    assert np.all(difference <= bound)
+
+
+def test_models_without_fused_kernel_use_numpy():
+    model_instance = delayed_models.ITCH(n_particles=50)
+    designs = DesignSpaceBuilder.delayed().build().sample(n=20)
+    p_numpy, p_numba = _both_backends(
+        model_instance, "predictive_y_grid", model_instance.θ, designs
+    )
+    np.testing.assert_array_equal(p_numba, p_numpy)
+
+
+def test_invalid_backend():
+    model_instance = delayed_models.Hyperbolic(n_particles=10)
+    with pytest.raises(ValueError):
+        model_instance.backend = "cuda"
+
+
+def test_ndtr_matches_scipy():
+    x = np.concatenate([np.linspace(-40, 40, 10001), [-np.inf, np.inf]])
+    result = np.array([fused.ndtr(value) for value in x])
+    np.testing.assert_allclose(result, ndtr(x), rtol=1e-12, atol=1e-300)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from darc_toolbox import hooks
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.model import DARCModel
+
+
+@pytest.fixture(autouse=True)
+def no_hooks():
+    yield
+    hooks.clear()
+
+
+@pytest.fixture(scope="module")
+def designs():
+    return DesignSpaceBuilder.delayed().build(as_design_matrix=True).take(slice(50))
+
+
+def test_hooks_see_each_evaluation(designs):
+    calls = []
+    DARCModel.add_hook(lambda *args: calls.append(args))
+    model = delayed_models.Hyperbolic(n_particles=100)
+    model.predictive_y_grid(model.θ, designs)
+
+    methods = [method for _, method, _, _ in calls]
+    assert methods == [
+        "_calc_decision_variable",
+        "CumulativeNormalChoiceFunc",
+        "predictive_y_grid",
+    ]
+    assert all(call[0] is model for call in calls)
+    assert all(isinstance(elapsed, int) and elapsed >= 0 for *_, elapsed in calls)
+    # the outer call includes the inner ones
+    assert calls[2][3] >= calls[0][3] + calls[1][3]
+    assert calls[0][2] == ((1, 100), (50, 1))
+    assert calls[1][2] == ((50, 100), (1, 100))
+    assert calls[2][2] == ((100, 2), (50, 6))
+
+    calls.clear()
+    model.predictive_y(model.θ, designs.take(np.zeros(100, dtype=int)))
+    assert [method for _, method, _, _ in calls][-1] == "predictive_y"
+    assert calls[-1][2] == ((100, 2), (100, 6))
+    calls.clear()
+    model._calc_decision_variable(model.θ, designs.take([0]))
+    assert [method for _, method, _, _ in calls] == ["_calc_decision_variable"]
+
+
+def test_hooks_by_model_class(designs):
+    calls = []
+
+    def hook(model, method, shapes, elapsed_ns):
+        calls.append(type(model))
+
+    delayed_models.Hyperbolic.add_hook(hook)
+    exponential = delayed_models.Exponential(n_particles=10)
+    exponential.predictive_y_grid(exponential.θ, designs)
+    assert calls == []
+    hyperbolic = delayed_models.Hyperbolic(n_particles=10)
+    hyperbolic.predictive_y_grid(hyperbolic.θ, designs)
+    assert set(calls) == {delayed_models.Hyperbolic}
+
+
+def test_remove_hook(designs):
+    calls = []
+    model = delayed_models.Hyperbolic(n_particles=10)
+    expected = model.predictive_y_grid(model.θ, designs)
+
+    def hook(*args):
+        calls.append(args)
+
+    DARCModel.add_hook(hook)
+    assert hooks.active
+    np.testing.assert_array_equal(model.predictive_y_grid(model.θ, designs), expected)
+    DARCModel.remove_hook(hook)
+    assert not hooks.active
+    n_calls = len(calls)
+    model.predictive_y_grid(model.θ, designs)
+    assert len(calls) == n_calls > 0
+    with pytest.raises(ValueError):
+        DARCModel.remove_hook(hook)
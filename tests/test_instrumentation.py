@@ -0,0 +1,128 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox.batch import BatchSimulation
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.design_search import exhaustive_search
+from darc_toolbox.designs import BayesianAdaptiveDesignGenerator, DesignSpaceBuilder
+from darc_toolbox.instrumentation import TrialRecorder
+
+
+def test_records_phases_of_a_trial():
+    model = delayed_models.Hyperbolic(n_particles=500)
+    model.recorder = TrialRecorder()
+    builder = DesignSpaceBuilder.delayed()
+    n_designs = len(builder.build())
+    with model.recorder.trial(model, n_designs=n_designs, protocol="test"):
+        result = exhaustive_search(model, builder)
+        data = pd.DataFrame([result.design]).assign(R=1)
+        model.update_beliefs(data)
+    # phases outside of a trial are not recorded
+    exhaustive_search(model, builder)
+
+    assert model.recorder.n_trials == 1
+    (record,) = model.recorder.records
+    assert record["model"] == "Hyperbolic"
+    assert record["n_particles"] == 500
+    assert record["n_designs"] == n_designs
+    assert record["protocol"] == "test"
+    phases = ["evaluate", "utility", "choose", "update"]
+    for phase in phases:
+        assert record[f"{phase}_seconds"] > 0
+        assert record[f"{phase}_peak_bytes"] >= 0
+    assert sum(record[f"{phase}_seconds"] for phase in phases) <= record["seconds"]
+    # evaluating the grid allocates at least one (designs x particles) array
+    assert record["evaluate_peak_bytes"] >= n_designs * 500 * 8
+    assert record["peak_bytes"] >= record["evaluate_peak_bytes"]
+
+
+def test_peak_memory_of_nested_phases():
+    recorder = TrialRecorder()
+    model = delayed_models.Hyperbolic(n_particles=10)
+    with recorder.trial(model, n_designs=1):
+        with recorder.phase("update"):
+            with recorder.phase("resample"):
+                big = np.ones(2**20)
+                del big
+            small = np.ones(2**10)
+        with recorder.phase("update"):
+            pass
+    record = recorder.records[0]
+    assert record["resample_peak_bytes"] >= 2**20 * 8
+    assert record["update_peak_bytes"] >= record["resample_peak_bytes"]
+    assert record["update_seconds"] >= record["resample_seconds"]
+    assert list(record)[-4:] == [
+        "update_seconds",
+        "update_peak_bytes",
+        "resample_seconds",
+        "resample_peak_bytes",
+    ]
+    del small
+
+
+def test_ring_buffer_and_dumps(tmp_path):
+    recorder = TrialRecorder(capacity=3, track_memory=False)
+    model = delayed_models.Hyperbolic(n_particles=10)
+    for _ in range(5):
+        with recorder.trial(model, n_designs=7):
+            with recorder.phase("choose"):
+                pass
+    assert [record["trial"] for record in recorder.records] == [2, 3, 4]
+    assert "peak_bytes" not in recorder.records[0]
+
+    recorder.to_csv(tmp_path / "trials.csv")
+    recorder.to_json(tmp_path / "trials.json")
+    df = pd.read_csv(tmp_path / "trials.csv")
+    pd.testing.assert_frame_equal(df, recorder.to_dataframe())
+    assert json.loads((tmp_path / "trials.json").read_text()) == list(recorder.records)
+    summary = recorder.summary()
+    assert summary.shape == (1, 2 * 3)
+
+    with pytest.raises(RuntimeError):
+        with recorder.trial(model, n_designs=7):
+            with recorder.trial(model, n_designs=7):
+                pass
+
+
+def test_batch_simulation_records_trials():
+    model = delayed_models.Hyperbolic(n_particles=50)
+    model.recorder = TrialRecorder(track_memory=False)
+    designs = DesignSpaceBuilder.delayed().build().iloc[:100]
+    θ_true = {"logk": np.full(4, -4.0), "α": np.full(4, 2.0)}
+    simulation = BatchSimulation(model, designs, θ_true, seed=1)
+    simulation.ess_threshold = 1.1
+    simulation.run(2)
+    records = model.recorder.to_dataframe()
+    assert len(records) == 2
+    assert np.all(records.n_participants == 4)
+    assert np.all(records.n_designs == 100)
+    for phase in ["evaluate", "utility", "choose", "update", "resample"]:
+        assert np.all(records[f"{phase}_seconds"] > 0)
+
+
+def test_records_design_generator_phases():
+    model = delayed_models.Hyperbolic(n_particles=200)
+    model.recorder = TrialRecorder(track_memory=False)
+    design_space = DesignSpaceBuilder.delayed().build()
+    generator = BayesianAdaptiveDesignGenerator(design_space, max_trials=2)
+    # a trial of its own
+    design = generator.get_next_design(model)
+    generator.enter_trial_design_and_response(design, True)
+    model.update_beliefs(generator.data)
+    # within the caller's trial, which also covers the update
+    with model.recorder.trial(model, n_designs=len(design_space)):
+        design = generator.get_next_design(model)
+        generator.enter_trial_design_and_response(design, False)
+        model.update_beliefs(generator.data)
+    assert generator.get_next_design(model) is None
+
+    first, second = model.recorder.records
+    for record in (first, second):
+        assert record["n_designs"] == len(design_space)
+        for phase in ["evaluate", "utility", "choose"]:
+            assert record[f"{phase}_seconds"] > 0
+        # the utility phase includes the evaluations made while optimising
+        assert record["utility_seconds"] <= record["seconds"]
+    assert "update_seconds" not in first
+    assert second["update_seconds"] > 0
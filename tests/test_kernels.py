@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from darc_toolbox import kernels
+
+# scalar reference implementations, equivalent to the old np.vectorize'd
+# versions in the model classes
+
+
+def rachlin_reference(delay, k, s):
+    if delay == 0:
+        return 1.0
+    else:
+        return 1 / (1 + np.power(k * delay, s))
+
+
+def linear_in_log_odds_reference(p, δ, γ):
+    if p == 0.0 or p == 1.0:
+        return p
+    else:
+        return (δ * p**γ) / ((δ * p**γ) + (1 - p) ** γ)
+
+
+delays = np.array([0.0, 1 / 24, 1.0, 7.0, 30.0, 365.0, 365.0 * 25])
+probs = np.array([0.0, 0.01, 0.1, 0.5, 0.9, 0.99, 1.0])
+
+
+def test_hyperboloid_rachlin_matches_reference():
+    k = np.array([1e-4, 0.01, 1.0])
+    s = np.array([0.5, 1.0, 2.0])
+    result = kernels.hyperboloid_rachlin(delays[:, None], k[None, :], s[None, :])
+    expected = np.array(
+        [[rachlin_reference(d, k[j], s[j]) for j in range(k.size)] for d in delays]
+    )
+    assert result.shape == (delays.size, k.size)
+    np.testing.assert_allclose(result, expected)
+
+
+def test_hyperboloid_rachlin_zero_delay_not_discounted():
+    """A zero delay must give a discount fraction of exactly 1, even when
+    s <= 0, which is where the formula itself breaks down"""
+    s = np.array([-1.0, 0.0, 1.0])
+    result = kernels.hyperboloid_rachlin(np.zeros(3), 0.1, s)
+    np.testing.assert_array_equal(result, np.ones(3))
+    assert result.dtype == np.float64
+
+
+def test_linear_in_log_odds_matches_reference():
+    δ = np.array([0.5, 1.0, 3.0])
+    γ = np.array([0.3, 1.0, 2.0])
+    result = kernels.linear_in_log_odds(probs[:, None], δ[None, :], γ[None, :])
+    expected = np.array(
+        [
+            [linear_in_log_odds_reference(p, δ[j], γ[j]) for j in range(δ.size)]
+            for p in probs
+        ]
+    )
+    np.testing.assert_allclose(result, expected)
+
+
+def test_linear_in_log_odds_fixed_end_points():
+    result = kernels.linear_in_log_odds(np.array([0.0, 1.0]), 0.0, 2.0)
+    np.testing.assert_array_equal(result, [0.0, 1.0])
+
+
+@pytest.mark.parametrize("func", [kernels.hyperbolic_odds, kernels.prelec])
+def test_probability_weighting_end_points(func):
+    with np.errstate(all="raise"):
+        result = func(np.array([0.0, 1.0]), 0.7)
+    np.testing.assert_array_equal(result, [0.0, 1.0])
+
+
+def test_exponential_broadcasts():
+    k = np.array([0.001, 0.01, 0.1, 1.0])
+    result = kernels.exponential(delays[:, None], k[None, :])
+    assert result.shape == (delays.size, k.size)
+    np.testing.assert_allclose(result, np.exp(-np.outer(delays, k)))
+
+
+def test_odds_round_trip():
+    p = probs[1:]
+    np.testing.assert_allclose(
+        kernels.odds_against_to_probs(kernels.prob_to_odds_against(p)), p
+    )
+
+
+@pytest.mark.parametrize("func", [kernels.hyperbolic, kernels.exponential])
+def test_zero_delay_not_discounted_when_k_overflows(func):
+    k = np.array([0.01, np.inf], dtype="float32")
+    result = func(np.zeros(2, dtype="float32"), k)
+    np.testing.assert_array_equal(result, [1.0, 1.0])
+    assert result.dtype == np.float32
+
+
+@pytest.mark.parametrize("func", [kernels.hyperbolic, kernels.exponential])
+def test_zero_delay_not_discounted_for_infinite_k(func):
+    # the formula alone gives NaN for inf * 0, which we deliberately replace
+    result = func(np.array([0.0, 0.0, 7.0]), np.array([np.inf, 0.5, np.inf]))
+    np.testing.assert_array_equal(result, [1.0, 1.0, 0.0])
+
+
+def test_finite_k_matches_formulas():
+    k = np.logspace(-8, 2, 11)
+    expected_hyperbolic = 1 / (1 + np.outer(delays, k))
+    expected_exponential = np.exp(-np.outer(delays, k))
+    np.testing.assert_array_equal(
+        kernels.hyperbolic(delays[:, None], k), expected_hyperbolic
+    )
+    np.testing.assert_array_equal(
+        kernels.exponential(delays[:, None], k), expected_exponential
+    )
@@ -50,11 +50,12 @@ n_particles = 2_000  # needs to be highish to ensure reliable test outcome
 def simulated_experiment_trial_loop(design_thing, model):
     """run a simulated experiment trial loop"""
     for trial in range(666):
-        design, design_df = design_thing.get_next_design(model)
+        design = design_thing.get_next_design(model)
 
         if design is None:
             break
 
+        design_df = pd.DataFrame([design], columns=darc_toolbox.Design._fields)
         response = model.simulate_y(design_df)
         design_thing.enter_trial_design_and_response(design, response)
 
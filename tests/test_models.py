@@ -8,7 +8,9 @@ import pytest
 from darc_toolbox.delayed import models as delayed_models
 from darc_toolbox.risky import models as risky_models
 from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
-from darc_toolbox import Prospect, Design
+from darc_toolbox import Design
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.design_matrix import DesignMatrix
 from scipy.stats import norm, expon
 
 
@@ -75,6 +77,61 @@ def test_predictive_y(model):
     assert isinstance(dv, np.ndarray)
 
 
+@pytest.mark.parametrize(
+    "model", delayed_models_list + risky_models_list + delayed_and_risky_models_list
+)
+def test_predictive_y_design_matrix(model):
+    """DataFrames and DesignMatrix objects should give identical results"""
+    model_instance = model(n_particles=10)
+    D = DesignSpaceBuilder.delayed_and_risky().build().sample(n=10)
+    p_df = model_instance.predictive_y(model_instance.θ, D)
+    p_dm = model_instance.predictive_y(model_instance.θ, DesignMatrix.from_dataframe(D))
+    np.testing.assert_array_equal(p_df, p_dm)
+
+
+@pytest.mark.parametrize(
+    "model", delayed_models_list + risky_models_list + delayed_and_risky_models_list
+)
+def test_predictive_y_grid(model):
+    """Grid evaluation should match evaluating one design at a time"""
+    n_particles = 10
+    model_instance = model(n_particles=n_particles)
+    D = DesignSpaceBuilder.delayed_and_risky().build().sample(n=5)
+    p_grid = model_instance.predictive_y_grid(model_instance.θ, D)
+    assert p_grid.shape == (5, n_particles)
+    for n in range(5):
+        np.testing.assert_array_equal(
+            p_grid[n, :], model_instance.predictive_y(model_instance.θ, D.iloc[[n]])
+        )
+
+
+@pytest.mark.parametrize(
+    "model", delayed_models_list + risky_models_list + delayed_and_risky_models_list
+)
+def test_constant_design_variables_bit_identical(model):
+    """Short-circuiting constant design variables (DA = 0, PA = 1) must not
+    change the answer at all. We check by appending one design which makes
+    those variables non-constant."""
+    model_instance = model(n_particles=50)
+    D = DesignSpaceBuilder.delayed_and_risky().build().sample(n=100)
+    constants = DesignMatrix.from_dataframe(D).constant_variables
+    assert constants["DA"] == 0.0 and constants["PA"] == 1.0
+    extra_design = pd.DataFrame(
+        {
+            "RA": [50.0],
+            "DA": [1.0],
+            "PA": [0.5],
+            "RB": [100.0],
+            "DB": [7.0],
+            "PB": [0.5],
+        }
+    )
+    D_not_constant = pd.concat([D, extra_design], ignore_index=True)
+    p_constant = model_instance.predictive_y_grid(model_instance.θ, D)
+    p_not_constant = model_instance.predictive_y_grid(model_instance.θ, D_not_constant)
+    np.testing.assert_array_equal(p_constant, p_not_constant[:-1, :])
+
+
 # tests to confirm that we can update beliefs
 
 # THIS IS NO LONGER HOW UPDATING OF data WORKS: NEED TO UPDATE THIS TEST
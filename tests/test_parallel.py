@@ -0,0 +1,97 @@
+import pickle
+import numpy as np
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+
+models_list = [
+    delayed_models.Hyperbolic,
+    delayed_models.ITCH,
+    risky_models.LinearInLogOdds,
+    delayed_and_risky_models.MultiplicativeHyperbolic,
+]
+
+
+@pytest.fixture(scope="module")
+def designs():
+    D = DesignSpaceBuilder.delayed_and_risky().build(as_design_matrix=True)
+    return D.take(np.random.RandomState(2).randint(len(D), size=400))
+
+
+def _sharded(model_instance, n_workers=2):
+    """Use worker processes even for the small problems in these tests"""
+    model_instance.n_workers = n_workers
+    model_instance._evaluator.min_shard_size = 10
+    return model_instance
+
+
+@pytest.mark.parametrize("model", models_list)
+def test_sharded_matches_single_process(model, designs):
+    model_instance = model(n_particles=400)
+    with np.errstate(all="ignore"):
+        expected_grid = model_instance.predictive_y_grid(model_instance.θ, designs)
+        expected_paired = model_instance.predictive_y(model_instance.θ, designs)
+        _sharded(model_instance)
+        try:
+            grid = model_instance.predictive_y_grid(model_instance.θ, designs)
+            paired = model_instance.predictive_y(model_instance.θ, designs)
+        finally:
+            model_instance.n_workers = 1
+    np.testing.assert_array_equal(grid, expected_grid)
+    np.testing.assert_array_equal(paired, expected_paired)
+
+
+def test_sharded_follows_model_settings(designs):
+    model_instance = delayed_models.Hyperbolic(n_particles=300)
+    _sharded(model_instance, n_workers=3)
+    try:
+        # settings changed after the pool starts are passed on to the workers
+        model_instance.dtype = "float32"
+        model_instance.θ_fixed = {"ϵ": 0.1}
+        with np.errstate(all="ignore"):
+            grid = model_instance.predictive_y_grid(model_instance.θ, designs)
+            model_instance.n_workers = 1
+            expected = model_instance.predictive_y_grid(model_instance.θ, designs)
+    finally:
+        model_instance.n_workers = 1
+    assert grid.dtype == np.float32
+    np.testing.assert_array_equal(grid, expected)
+
+
+def test_shared_memory_grows(designs):
+    single_process = delayed_models.Hyperbolic(n_particles=1000)
+    θ = {key: single_process.θ[key].to_numpy() for key in single_process.θ}
+    model_instance = _sharded(delayed_models.Hyperbolic(n_particles=1000))
+    try:
+        for n_particles, n_designs in [(100, 10), (1000, 400), (50, 5)]:
+            θ_subset = {key: values[:n_particles] for key, values in θ.items()}
+            designs_subset = designs.take(slice(0, n_designs))
+            grid = model_instance.predictive_y_grid(θ_subset, designs_subset)
+            expected = single_process.predictive_y_grid(θ_subset, designs_subset)
+            assert grid.shape == (n_designs, n_particles)
+            np.testing.assert_array_equal(grid, expected)
+    finally:
+        model_instance.n_workers = 1
+
+
+def test_small_problems_stay_in_process(designs):
+    model_instance = delayed_models.Hyperbolic(n_particles=100)
+    model_instance.n_workers = 2
+    try:
+        assert not model_instance._use_sharded(100)
+    finally:
+        model_instance.n_workers = 1
+
+
+def test_n_workers():
+    model_instance = delayed_models.Hyperbolic(n_particles=10)
+    assert model_instance.n_workers == 1
+    model_instance.n_workers = 2
+    assert model_instance.n_workers == 2
+    # the pool is not pickled along with the model
+    copy = pickle.loads(pickle.dumps(model_instance))
+    assert copy.n_workers == 1
+    model_instance.n_workers = 1
+    assert model_instance.n_workers == 1
@@ -0,0 +1,153 @@
+import copy
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+import darc_toolbox
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import BayesianAdaptiveDesignGenerator, DesignSpaceBuilder
+
+# models with parameters derived from the particles, eg k = exp(logk)
+models_list = [
+    delayed_models.Hyperbolic,
+    delayed_models.MyersonHyperboloid,
+    delayed_models.ModifiedRachlin,
+    delayed_models.HyperbolicNonLinearUtility,
+    risky_models.Hyperbolic,
+    delayed_and_risky_models.MultiplicativeHyperbolic,
+]
+
+
+@pytest.fixture(scope="module")
+def designs():
+    D = DesignSpaceBuilder.delayed_and_risky().build(as_design_matrix=True)
+    return D.take(np.random.RandomState(3).randint(len(D), size=200))
+
+
+def _evaluate(model_instance, θ, designs):
+    with np.errstate(all="ignore"):
+        return (
+            model_instance.predictive_y_grid(θ, designs),
+            model_instance.predictive_y(θ, designs),
+        )
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+@pytest.mark.parametrize("model", models_list)
+def test_cached_matches_uncached(model, backend, designs):
+    model_instance = model(n_particles=200)
+    model_instance.backend = backend
+    # a copy of the model starts with nothing cached
+    expected = _evaluate(copy.deepcopy(model_instance), model_instance.θ, designs)
+    for _ in range(2):
+        result = _evaluate(model_instance, model_instance.θ, designs)
+        np.testing.assert_array_equal(result[0], expected[0])
+        np.testing.assert_array_equal(result[1], expected[1])
+
+
+def test_derived_computed_once():
+    model_instance = delayed_models.Hyperbolic(n_particles=100)
+    calls = []
+
+    def exp(values):
+        calls.append(values)
+        return np.exp(values)
+
+    θ = model_instance._particles(model_instance.θ)
+    k = model_instance._derived(θ, "logk", exp)
+    assert model_instance._derived(θ, "logk", exp) is k
+    # the grid layout shares the same cached values
+    θ_rows = model_instance._particles(model_instance.θ, as_rows=True)
+    np.testing.assert_array_equal(model_instance._derived(θ_rows, "logk", exp)[0], k)
+    assert len(calls) == 1
+    # cached arrays can't be mistaken for temporaries and overwritten
+    assert not k.flags.writeable
+
+
+def test_derived_cached_by_value():
+    model_instance = delayed_models.Hyperbolic(n_particles=100)
+    θ = model_instance._particles(model_instance.θ)
+    k = model_instance._derived(θ, "logk", np.exp)
+    # copies and reorderings of the particles, like those badapted passes in
+    θ_copy = model_instance._particles(model_instance.θ.iloc[np.arange(100)])
+    assert model_instance._derived(θ_copy, "logk", np.exp) is k
+    θ_other = model_instance._particles(model_instance.θ.iloc[::-1])
+    assert model_instance._derived(θ_other, "logk", np.exp) is not k
+
+
+def test_particles_modified_in_place(designs):
+    model_instance = delayed_models.Hyperbolic(n_particles=200)
+    _evaluate(model_instance, model_instance.θ, designs)
+    model_instance.θ["logk"] *= 2
+    model_instance.θ.loc[0, "α"] = 3.0
+    result = _evaluate(model_instance, model_instance.θ, designs)
+    expected = _evaluate(copy.deepcopy(model_instance), model_instance.θ, designs)
+    np.testing.assert_array_equal(result[0], expected[0])
+    np.testing.assert_array_equal(result[1], expected[1])
+    θ = model_instance._particles(model_instance.θ)
+    np.testing.assert_array_equal(
+        model_instance._derived(θ, "logk", np.exp),
+        np.exp(model_instance.θ["logk"].to_numpy()),
+    )
+
+
+def test_cache_hits_over_trials():
+    np.random.seed(7)
+    model_instance = delayed_models.Hyperbolic(n_particles=200)
+    model_instance = model_instance.generate_faux_true_params()
+    D = DesignSpaceBuilder(RA=list(100 * np.linspace(0.05, 0.95, 19))).build()
+    design_thing = BayesianAdaptiveDesignGenerator(D, max_trials=3)
+    hits = misses = 0
+    for trial in range(3):
+        design = design_thing.get_next_design(model_instance)
+        # design optimisation evaluates the same shuffled copy of the
+        # particles at each of its 49 steps, so only converts them once
+        assert model_instance._particle_cache_hits - hits >= 48
+        design_df = pd.DataFrame([design], columns=darc_toolbox.Design._fields)
+        response = model_instance.simulate_y(design_df)
+        design_thing.enter_trial_design_and_response(design, response)
+        model_instance.update_beliefs(design_thing.data)
+        hits = model_instance._particle_cache_hits
+        # the point estimate, the shuffled particles, the proposals of
+        # update_beliefs' 5 steps, and θ_true on the first trial only
+        assert model_instance._particle_cache_misses - misses == (
+            8 if trial == 0 else 7
+        )
+        misses = model_instance._particle_cache_misses
+
+
+def test_cache_cleared_when_particles_replaced(designs):
+    model_instance = delayed_models.Hyperbolic(n_particles=200)
+    before = _evaluate(model_instance, model_instance.θ, designs)
+    model_instance.θ = model_instance._sample_from_prior()
+    after = _evaluate(model_instance, model_instance.θ, designs)
+    expected = _evaluate(model_instance, model_instance.θ.copy(), designs)
+    assert not np.array_equal(after[0], before[0])
+    np.testing.assert_array_equal(after[0], expected[0])
+    np.testing.assert_array_equal(after[1], expected[1])
+
+
+def test_cache_per_dtype(designs):
+    model_instance = risky_models.Hyperbolic(n_particles=200)
+    _evaluate(model_instance, model_instance.θ, designs)
+    model_instance.dtype = "float32"
+    p_chose_B, _ = _evaluate(model_instance, model_instance.θ, designs)
+    assert p_chose_B.dtype == np.float32
+    θ = model_instance._particles(model_instance.θ)
+    assert model_instance._derived(θ, "logh", np.exp).dtype == np.float32
+
+
+@pytest.mark.parametrize(
+    "duplicate", [copy.deepcopy, lambda m: pickle.loads(pickle.dumps(m))]
+)
+def test_copies_have_their_own_cache(duplicate, designs):
+    model_instance = delayed_models.Hyperbolic(n_particles=200)
+    expected = _evaluate(model_instance, model_instance.θ, designs)
+    duplicate_instance = duplicate(model_instance)
+    for _ in range(2):
+        result = _evaluate(duplicate_instance, duplicate_instance.θ, designs)
+        np.testing.assert_array_equal(result[0], expected[0])
+        np.testing.assert_array_equal(result[1], expected[1])
+    assert duplicate_instance._particle_caches is not model_instance._particle_caches
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.design_matrix import DesignMatrix
+
+delayed_presets = ["delayed", "frontend_delay", "delay_magnitude_effect"]
+
+model_presets = (
+    [
+        (model, preset)
+        for model in [
+            delayed_models.DelaySlice,
+            delayed_models.Hyperbolic,
+            delayed_models.Exponential,
+            delayed_models.HyperbolicMagnitudeEffect,
+            delayed_models.ExponentialMagnitudeEffect,
+            delayed_models.ConstantSensitivity,
+            delayed_models.MyersonHyperboloid,
+            delayed_models.ModifiedRachlin,
+            delayed_models.HyperbolicNonLinearUtility,
+            delayed_models.ITCH,
+            delayed_models.DRIFT,
+            delayed_models.TradeOff,
+        ]
+        for preset in delayed_presets
+    ]
+    + [
+        (model, "risky")
+        for model in [
+            risky_models.Hyperbolic,
+            risky_models.PrelecOneParameter,
+            risky_models.LinearInLogOdds,
+            risky_models.ProportionalDifference,
+        ]
+    ]
+    + [(delayed_and_risky_models.MultiplicativeHyperbolic, "delayed_and_risky")]
+)
+
+# Bounds on |p(chose B) in float32 - p(chose B) in float64| over all designs in
+# a preset and particles drawn from the prior. Errors in the decision variable
+# are amplified by 1/α, so these are dominated by particles with small α.
+MAX_ABS_ERROR = 1e-3
+MEAN_ABS_ERROR = 1e-6
+# RA^exp(a) and RB^exp(a) are large and nearly cancel, so float32 rounding
+# in the decision variable is much larger relative to α
+MAX_ABS_ERROR_OVERRIDES = {delayed_models.HyperbolicNonLinearUtility: 5e-2}
+
+
+def _p_chose_B(model_instance, θ, designs, dtype):
+    model_instance.dtype = dtype
+    with np.errstate(all="ignore"):
+        return model_instance.predictive_y_grid(θ, designs)
+
+
+@pytest.mark.parametrize("model, preset", model_presets)
+def test_float32_error_bounds(model, preset):
+    np.random.seed(1234)
+    model_instance = model(n_particles=200)
+    θ = model_instance.θ.copy()
+    if model is delayed_models.Exponential:
+        # k < 0 is exponential growth, which overflows float32 at long delays
+        θ["k"] = np.abs(θ["k"])
+    designs = getattr(DesignSpaceBuilder, preset)().build(as_design_matrix=True)
+
+    p64 = _p_chose_B(model_instance, θ, designs, "float64")
+    p32 = _p_chose_B(model_instance, θ, designs, "float32")
+
+    assert p64.dtype == np.float64
+    assert p32.dtype == np.float32
+    # float32 should not introduce any overflow or NaNs of its own
+    finite = np.isfinite(p64)
+    np.testing.assert_array_equal(np.isfinite(p32), finite)
+    if not finite.any():
+        return
+    error = np.abs(p32[finite] - p64[finite])
+    assert error.max() < MAX_ABS_ERROR_OVERRIDES.get(model, MAX_ABS_ERROR)
+    assert error.mean() < MEAN_ABS_ERROR
+
+
+def test_float32_paired_and_log_likelihood():
+    model_instance = delayed_models.Hyperbolic(n_particles=50)
+    model_instance.dtype = "float32"
+    D = DesignSpaceBuilder.delayed().build().sample(n=50).reset_index(drop=True)
+    assert model_instance.predictive_y(model_instance.θ, D).dtype == np.float32
+    D["R"] = np.random.randint(0, 2, size=len(D))
+    ll = model_instance.log_likelihood(model_instance.θ, D)
+    assert ll.shape == (50,)
+    assert np.all(np.isfinite(ll))
+
+
+def test_default_dtype_is_float64():
+    model_instance = risky_models.Hyperbolic(n_particles=10)
+    assert model_instance.dtype == np.float64
+    with pytest.raises(ValueError):
+        model_instance.dtype = "int32"
+
+
+def test_builder_dtype():
+    builder = DesignSpaceBuilder.delayed()
+    D = builder.build(dtype="float32")
+    assert all(D[col].dtype == np.float32 for col in D.columns)
+    designs = builder.build(as_design_matrix=True, dtype="float32")
+    assert designs.dtype == np.float32
+    assert designs["RA"].dtype == np.float32
+    with pytest.raises(ValueError):
+        builder.build(dtype="float16")
+
+
+def test_design_matrix_astype():
+    designs = DesignSpaceBuilder.risky().build(as_design_matrix=True)
+    assert designs.astype("float64") is designs
+    designs32 = designs.astype("float32")
+    assert designs32 is designs.astype(np.float32)
+    assert designs32["PB"].dtype == np.float32
+    assert DesignMatrix.coerce(designs, "float32") is designs32
+    np.testing.assert_array_equal(designs32["RB"], designs["RB"].astype("float32"))
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox.pruning import prior_information, prune_designs
+
+
+def binary_entropy(p):
+    return -(p * np.log(p) + (1 - p) * np.log(1 - p))
+
+
+@pytest.fixture(scope="module")
+def model_instance():
+    return delayed_models.Hyperbolic(n_particles=1000)
+
+
+@pytest.fixture(scope="module")
+def designs():
+    return DesignSpaceBuilder.delayed().build()
+
+
+def test_prior_information(model_instance, designs):
+    p_chose_B = model_instance.predictive_y_grid(model_instance.θ, designs)
+    expected = binary_entropy(p_chose_B.mean(axis=1)) - np.mean(
+        binary_entropy(p_chose_B), axis=1
+    )
+    information = prior_information(model_instance, designs, max_bytes=2**20)
+    np.testing.assert_allclose(information, expected, rtol=1e-9, atol=1e-12)
+
+
+def test_prune_designs(model_instance, designs):
+    pruned, report = prune_designs(model_instance, designs, tolerance=1e-3)
+    information = prior_information(model_instance, designs)
+    expected = designs[information >= 1e-3]
+    pd.testing.assert_frame_equal(pruned, expected)
+    assert report.n_designs == len(designs)
+    assert report.n_dropped == len(designs) - len(pruned)
+    assert report.tolerance == 1e-3
+    # a good share of the space tells us nothing, eg £95 now vs £100 in 25 years
+    assert report.n_dropped > len(designs) / 4
+    uninformative = (designs.RA == 95) & (designs.DB == 25 * 365)
+    assert uninformative.sum() == 1
+    assert not np.any(uninformative[pruned.index])
+
+
+def test_prune_designs_tolerance(model_instance, designs):
+    _, report = prune_designs(model_instance, designs, tolerance=0.0)
+    assert report.n_dropped == 0
+    _, report = prune_designs(model_instance, designs, tolerance=np.inf)
+    assert report.n_dropped == len(designs)
+
+
+def test_prune_design_matrix():
+    model_instance = risky_models.Hyperbolic(n_particles=500)
+    D = DesignSpaceBuilder.risky().build()
+    designs = DesignSpaceBuilder.risky().build(as_design_matrix=True, dtype="float32")
+    model_instance.dtype = "float32"
+    pruned, report = prune_designs(model_instance, designs, tolerance=1e-2)
+    expected, _ = prune_designs(model_instance, D, tolerance=1e-2)
+    assert pruned.dtype == np.float32
+    assert report.n_dropped > 0
+    for name in ["RA", "DA", "PA", "RB", "DB", "PB"]:
+        np.testing.assert_array_equal(pruned[name], expected[name].astype("float32"))
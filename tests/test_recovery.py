@@ -0,0 +1,108 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.delayed.designs import Kirby2009, Koffarnus_Bickel
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox import recovery
+
+
+@pytest.fixture
+def study(tmp_path):
+    θ_true = recovery.draw_true_parameters(delayed_models.Hyperbolic, 3, seed=1)
+    return recovery.RecoveryStudy(
+        delayed_models.Hyperbolic,
+        recovery.design_generator(
+            "Koffarnus_Bickel", delayed_models.Hyperbolic, n_trials=10
+        ),
+        θ_true,
+        n_trials=10,
+        directory=tmp_path / "study",
+        n_particles=200,
+        seed=2,
+        file_format="npz",
+    )
+
+
+def test_run_saves_every_trial(study):
+    assert study.run() == 3
+    results = study.results()
+    # Koffarnus_Bickel stops after 5 trials
+    assert len(results) == 3 * 5
+    assert list(results.participant.unique()) == [0, 1, 2]
+    assert list(results.trial[:5]) == [0, 1, 2, 3, 4]
+    for name in ["RA", "DA", "PA", "RB", "DB", "PB", "R"]:
+        assert name in results
+    for name in ["logk", "α"]:
+        assert np.all(results[f"{name}_sd"] > 0)
+        np.testing.assert_allclose(
+            results.groupby("participant")[f"{name}_true"].first(),
+            study.θ_true[name],
+        )
+
+
+def test_resume_skips_completed_participants(study):
+    study.run()
+    expected = study.results()
+    study.path(1).unlink()
+    assert study.completed() == [0, 2]
+    # only the missing participant is rerun, with the same random numbers
+    assert study.run() == 1
+    pd.testing.assert_frame_equal(study.results(), expected)
+    assert study.run() == 0
+
+
+def test_workers_match_one_process(study, tmp_path):
+    study.run()
+    parallel = recovery.RecoveryStudy(
+        study.model_class,
+        study.make_generator,
+        study.θ_true,
+        study.n_trials,
+        tmp_path / "parallel",
+        seed=study.seed,
+        model_kwargs=study.model_kwargs,
+        file_format="npz",
+    )
+    assert parallel.run(n_workers=2) == 3
+    pd.testing.assert_frame_equal(parallel.results(), study.results())
+
+
+def test_refuses_to_resume_a_different_study(study):
+    study.run()
+    study.seed = 3
+    with pytest.raises(ValueError):
+        study.run()
+
+
+def test_design_generator():
+    make = recovery.design_generator("Kirby2009", delayed_models.Hyperbolic, 20)
+    assert isinstance(make(), Kirby2009)
+    make = recovery.design_generator("Koffarnus_Bickel", delayed_models.Hyperbolic, 5)
+    assert isinstance(make(), Koffarnus_Bickel)
+    with pytest.raises(ValueError):
+        recovery.design_generator("Kirby2009", risky_models.Hyperbolic, 20)
+    assert recovery.find_model("risky.Hyperbolic") is risky_models.Hyperbolic
+
+
+def test_bayesian_cli(tmp_path):
+    directory = tmp_path / "cli"
+    args = ["delayed.Hyperbolic", "bayesian", str(directory), "--trials", "3"]
+    args += ["--participants", "2", "--particles", "200", "--workers", "1"]
+    args += ["--preset", "delayed"]
+    recovery.main(args)
+    results = recovery.read_results(directory)
+    assert len(results) == 2 * 3
+    assert (directory / recovery.MANIFEST).exists()
+
+
+def test_cli_default_particles(tmp_path):
+    directory = tmp_path / "cli"
+    args = ["delayed.Hyperbolic", "Kirby2009", str(directory), "--trials", "3"]
+    args += ["--participants", "2", "--workers", "1"]
+    recovery.main(args)
+    results = recovery.read_results(directory)
+    assert len(results) == 2 * 3
+    manifest = json.loads((directory / recovery.MANIFEST).read_text())
+    assert manifest["model_kwargs"]["n_particles"] == recovery.DEFAULT_N_PARTICLES
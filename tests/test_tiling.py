@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from darc_toolbox.delayed import models as delayed_models
+from darc_toolbox.risky import models as risky_models
+from darc_toolbox.delayed_and_risky import models as delayed_and_risky_models
+from darc_toolbox.designs import DesignSpaceBuilder
+from darc_toolbox import reducers
+
+models_list = [
+    delayed_models.Hyperbolic,
+    delayed_models.ModifiedRachlin,
+    delayed_models.HyperbolicMagnitudeEffect,
+    delayed_models.TradeOff,
+    risky_models.Hyperbolic,
+    risky_models.ProportionalDifference,
+    delayed_and_risky_models.MultiplicativeHyperbolic,
+]
+
+
+@pytest.fixture(scope="module")
+def designs():
+    D = DesignSpaceBuilder.delayed_and_risky().build(as_design_matrix=True)
+    return D.take(np.random.RandomState(1).randint(len(D), size=300))
+
+
+# a budget of 4 KB means 128 float64 elements per tile, so tiles are split
+# over particles as well as designs
+@pytest.mark.parametrize("max_bytes", [4096, 64 * 1024, 2**30])
+@pytest.mark.parametrize("model", models_list)
+def test_tiles_match_full_grid(model, designs, max_bytes):
+    model_instance = model(n_particles=200)
+    with np.errstate(all="ignore"):
+        expected = model_instance.predictive_y_grid(model_instance.θ, designs)
+        result = model_instance.reduce_predictive_y(
+            model_instance.θ, designs, reducers.Materialise(), max_bytes=max_bytes
+        )
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("max_bytes", [4096, 64 * 1024])
+def test_tiles_within_budget(designs, max_bytes):
+    model_instance = delayed_models.Hyperbolic(n_particles=200)
+    covered = np.zeros((len(designs), 200), dtype=int)
+    for design_slice, particle_slice, p_chose_B in model_instance.predictive_y_tiles(
+        model_instance.θ, designs, max_bytes=max_bytes
+    ):
+        assert p_chose_B.nbytes * 4 <= max_bytes
+        covered[design_slice, particle_slice] += 1
+    # every (design, particle) pair is evaluated exactly once
+    assert np.all(covered == 1)
+
+
+def test_mean_over_particles(designs):
+    model_instance = risky_models.Hyperbolic(n_particles=100)
+    p_chose_B = model_instance.predictive_y_grid(model_instance.θ, designs)
+    result = model_instance.reduce_predictive_y(
+        model_instance.θ, designs, reducers.MeanOverParticles(), max_bytes=4096
+    )
+    np.testing.assert_allclose(result, p_chose_B.mean(axis=1))
+
+
+def test_mutual_information(designs):
+    model_instance = delayed_models.Hyperbolic(n_particles=100)
+    p = model_instance.predictive_y_grid(model_instance.θ, designs)
+    p_mean = p.mean(axis=1, keepdims=True)
+    # the form used in badapted's calc_utility
+    expected = np.mean(
+        p * (np.log(p) - np.log(p_mean))
+        + (1 - p) * (np.log(1 - p) - np.log(1 - p_mean)),
+        axis=1,
+    )
+    result = model_instance.reduce_predictive_y(
+        model_instance.θ, designs, reducers.MutualInformation(), max_bytes=4096
+    )
+    np.testing.assert_allclose(result, expected, atol=1e-12)
+
+
+def test_log_likelihood(designs):
+    model_instance = delayed_and_risky_models.MultiplicativeHyperbolic(n_particles=100)
+    data = designs.take(slice(0, 20)).to_dataframe()
+    data["R"] = np.random.randint(0, 2, size=20)
+    expected = model_instance.log_likelihood(model_instance.θ, data)
+    result = model_instance.reduce_predictive_y(
+        model_instance.θ,
+        data,
+        reducers.LogLikelihood(data["R"].to_numpy()),
+        max_bytes=4096,
+    )
+    np.testing.assert_allclose(result, expected)
@@ -0,0 +1,133 @@
+import tracemalloc
+import numpy as np
+import pytest
+from darc_toolbox import design_space
+from darc_toolbox.designs import DesignSpaceBuilder
+
+DESIGN_VARIABLES = ["RA", "DA", "PA", "RB", "DB", "PB"]
+
+presets = [
+    "delayed",
+    "risky",
+    "delayed_and_risky",
+    "frontend_delay",
+    "delay_magnitude_effect",
+]
+
+
+def assert_same_designs(designs, D):
+    assert len(designs) == len(D)
+    for name in DESIGN_VARIABLES:
+        np.testing.assert_array_equal(designs[name], D[name].to_numpy())
+
+
+@pytest.mark.parametrize("assume_discounting", [True, False])
+@pytest.mark.parametrize("preset", presets)
+def test_virtual_matches_build(preset, assume_discounting):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    D = builder.build(assume_discounting=assume_discounting)
+    space = builder.build_virtual(assume_discounting=assume_discounting)
+    assert_same_designs(space.to_design_matrix(), D)
+    # designs are numbered in the same order, and know their place in the grid
+    np.testing.assert_array_equal(
+        space.grid_position(np.arange(len(space))), D.index.to_numpy()
+    )
+
+
+def test_virtual_chunks():
+    builder = DesignSpaceBuilder.delayed_and_risky()
+    D = builder.build()
+    space = builder.build_virtual()
+    n_chunks = 0
+    for chunk_slice, designs in space.chunks(chunk_size=5000):
+        assert_same_designs(designs, D.iloc[chunk_slice])
+        n_chunks += 1
+    assert n_chunks == int(np.ceil(len(D) / 5000))
+
+
+def test_virtual_take_and_get_design():
+    builder = DesignSpaceBuilder(
+        RA=[10, 50.5, 120], DA=[0, 3, 7], DB=[1, 3, 10], PB=[0.5, 1]
+    )
+    D = builder.build()
+    space = builder.build_virtual(dtype="float32")
+    indices = np.random.RandomState(4).randint(len(space), size=100)
+    designs = space.take(indices)
+    assert designs.dtype == np.float32
+    for name in DESIGN_VARIABLES:
+        np.testing.assert_array_equal(
+            designs[name], D[name].to_numpy()[indices].astype("float32")
+        )
+    assert space.get_design(indices[0]) == designs.get_design(0)
+    with pytest.raises(IndexError):
+        space.take([len(space)])
+
+
+def test_virtual_large_space_is_compact():
+    builder = DesignSpaceBuilder(
+        RA=np.linspace(1, 99, 1000).tolist(),
+        PB=np.linspace(0.01, 1, 100).tolist(),
+    )
+    space = builder.build_virtual()
+    assert space.n_grid == 1000 * 100 * len(builder.DB)
+    # about one bit per design, rather than 48 bytes
+    assert space.nbytes < space.n_grid / 4
+    designs = space.chunk(len(space) - 10, len(space))
+    assert len(designs) == 10
+    assert designs.get_design(9) == space.get_design(len(space) - 1)
+
+
+def test_virtual_build_peak_memory(monkeypatch):
+    # small chunks, so the grid is many chunks long without taking long
+    monkeypatch.setattr(design_space, "_MASK_CHUNK", 2**12)
+    builder = DesignSpaceBuilder(
+        RA=np.linspace(1, 99, 1000).tolist(),
+        PB=np.linspace(0.01, 1, 500).tolist(),
+    )
+    # a constraint across axes, which can't be pushed down onto them
+    builder.constrain(lambda RA, PB: RA * PB >= 10)
+    tracemalloc.start()
+    try:
+        space = builder.build_virtual()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # the bitset (an eighth of a byte per grid point), the counts of its bits
+    # and a chunk of columns, rather than a mask over the whole grid
+    assert peak < space.n_grid / 3
+    assert len(space) == builder.n_designs()
+
+
+def test_virtual_no_designs():
+    space = DesignSpaceBuilder(RA=[200.0], RB=[100.0]).build_virtual()
+    assert len(space) == 0
+    assert list(space.chunks()) == []
+
+
+@pytest.mark.parametrize("chunk_size", [1, 1000, 100_000])
+@pytest.mark.parametrize("assume_discounting", [True, False])
+@pytest.mark.parametrize("preset", presets)
+def test_iter_chunks_matches_build(preset, assume_discounting, chunk_size):
+    builder = getattr(DesignSpaceBuilder, preset)()
+    D = builder.build(assume_discounting=assume_discounting)
+    if chunk_size == 1:
+        D = D.iloc[:500]
+    chunks = builder.iter_chunks(chunk_size, assume_discounting=assume_discounting)
+    n_designs = 0
+    for index, designs in chunks:
+        expected = D.iloc[n_designs : n_designs + chunk_size]
+        assert len(designs) == min(chunk_size, len(D) - n_designs)
+        assert_same_designs(designs, expected)
+        np.testing.assert_array_equal(index, expected.index.to_numpy())
+        n_designs += len(designs)
+        if n_designs == len(D):
+            break
+    assert n_designs == len(D)
+
+
+def test_iter_chunks_dtype():
+    builder = DesignSpaceBuilder.delayed()
+    for _, designs in builder.iter_chunks(1000, dtype="float32"):
+        assert designs.dtype == "float32"
+    with pytest.raises(ValueError):
+        next(builder.iter_chunks(0))